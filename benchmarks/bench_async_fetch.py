@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+"""
+	Measures lyrics download throughput of the asyncio fetch stage for a
+	range of 'jobs'.
+
+	Usage:
+		python benchmarks/bench_async_fetch.py [<song_count>] [<latency_ms>]
+
+	A local HTTP server stands in for each lyrics source and answers after
+	<latency_ms>(50 by default), like a source across the internet. Every
+	song misses on the first source and is found on the second, so each
+	song makes two requests. Throughput grows with 'jobs' until
+	"host_connections" requests are waiting on each source, then it levels
+	off at about host_connections / latency songs per second.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import sys
+import time
+import threading
+
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lyrico import async_fetch
+from lyrico.config import Config
+from lyrico.pipeline import STOP, iter_queue
+from lyrico.lyrico_sources.build_requests import get_session, close_sessions
+
+
+SOURCES = ['lyric_wikia', 'musix_match']
+JOBS = [1, 2, 4, 8, 16, 32, 64]
+LYRICS_PAGE = b'<html><body><div class="lyricbox">' + b'la la la<br>' * 100 + b'</div></body></html>'
+
+
+class SourceServer(ThreadingMixIn, HTTPServer):
+	daemon_threads = True
+
+	def __init__(self, found, latency):
+		HTTPServer.__init__(self, ('127.0.0.1', 0), SourceHandler)
+		self.found = found
+		self.latency = latency
+
+
+class SourceHandler(BaseHTTPRequestHandler):
+
+	protocol_version = 'HTTP/1.1'
+	disable_nagle_algorithm = True
+
+	def do_GET(self):
+		time.sleep(self.server.latency)
+		body = LYRICS_PAGE if self.server.found else b'Not found'
+		self.send_response(200 if self.server.found else 404)
+		self.send_header('Content-Type', 'text/html')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, *args):
+		pass
+
+
+class BenchSong():
+
+	"""Stands in for Song, with only what the fetch stage uses"""
+
+	def __init__(self, index):
+		self.path = 'song-%d' % index
+		self.artist = 'artist'
+		self.title = 'title-%d' % index
+		self.lyrics = None
+		self.error = None
+
+	def start_fetch(self):
+		return True
+
+
+def get_download(source_name, server):
+	"""Returns a download function for the source, like donwload_from_*"""
+
+	def download(song):
+		url = 'http://127.0.0.1:%d/lyrics/%s/%s' % (server.server_address[1], song.artist, song.title)
+		res = get_session(source_name).get(url)
+		if res.status_code == 200:
+			song.lyrics = res.text
+
+	return download
+
+
+def run_jobs(jobs, song_count):
+	stage = async_fetch.AsyncFetchStage(jobs, song_count + 1)
+	stage.connect(async_fetch.queue.Queue())
+
+	for i in range(song_count):
+		stage.input.put(BenchSong(i))
+	stage.input.put(STOP)
+
+	start = time.time()
+	stage.start()
+	found = sum(1 for song in iter_queue(stage.output) if song.lyrics)
+	elapsed = time.time() - start
+
+	print('jobs %3d  %5d/%d found  %7.3fs  %7.1f songs/s' %
+		(jobs, found, song_count, elapsed, song_count / elapsed))
+
+
+def main():
+	song_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+	latency = (int(sys.argv[2]) if len(sys.argv) > 2 else 50) / 1000.0
+
+	# Only the last source has the lyrics.
+	servers = [SourceServer(i == len(SOURCES) - 1, latency) for i in range(len(SOURCES))]
+	for server in servers:
+		thread = threading.Thread(target=server.serve_forever)
+		thread.daemon = True
+		thread.start()
+
+	for setting in ('lyric_wikia', 'lyrics_n_music', 'musix_match', 'lyricsmode', 'az_lyrics'):
+		setattr(Config, setting, setting in SOURCES)
+	sources = [(source_name, get_download(source_name, server))
+		for source_name, server in zip(SOURCES, servers)]
+	async_fetch.get_enabled_sources = lambda: sources
+
+	print('host_connections %d, max_connections %d, latency %dms' %
+		(Config.host_connections, Config.max_connections, latency * 1000))
+	print('Expected plateau: about %.1f songs/s\n' % (Config.host_connections / latency))
+
+	try:
+		for jobs in JOBS:
+			run_jobs(jobs, song_count)
+	finally:
+		close_sessions()
+		for server in servers:
+			server.shutdown()
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+"""
+	Reports the trade off of hedged lookups(see hedged_fetch module):
+	requests sent per song against time per song.
+
+	Usage:
+		python benchmarks/bench_hedged_fetch.py [<song_count>]
+
+	Five simulated sources stand in for the real ones, each with its own
+	latency and hit rate. Whether a source has the lyrics of a song is
+	decided once, so every setting finds the same lyrics from the same
+	source. Songs are downloaded one after another, as by a single fetch
+	worker.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lyrico.config import Config
+from lyrico.hedged_fetch import hedged_fetch, HedgeStats
+
+
+# (name, latency in seconds, hit rate)
+SOURCES = [
+	('WIKI', 0.080, 0.30),
+	('LnM', 0.150, 0.20),
+	('mXm', 0.060, 0.50),
+	('LrMOD', 0.100, 0.40),
+	('AZLr', 0.120, 0.60),
+]
+
+# (label, race_sources, hedge_delay)
+SETTINGS = [
+	('one by one', 1, 0.0),
+	('delay 100ms', 1, 0.1),
+	('delay 50ms', 1, 0.05),
+	('race 2', 2, 0.0),
+	('race 3', 3, 0.0),
+	('race all', len(SOURCES), 0.0),
+]
+
+LYRICS = 'la la la\n' * 10
+
+
+class BenchSong():
+
+	def __init__(self, index, hits):
+		self.artist = 'artist'
+		self.title = 'title-%d' % index
+		self.lyrics = None
+		self.source = None
+		self.error = None
+
+		# Names of the sources which have the lyrics
+		self.hits = hits
+
+
+def get_download(name, latency, songs):
+	def download(lookup):
+		time.sleep(latency * random.uniform(0.8, 1.5))
+		if name in songs[lookup.title].hits:
+			lookup.lyrics = LYRICS
+			lookup.source = name
+		else:
+			lookup.error = 'Lyrics not found. Check artist or title name.'
+	return download
+
+
+def run_setting(label, race_sources, hedge_delay, songs, sources):
+	Config.race_sources = race_sources
+	Config.hedge_delay = hedge_delay
+	HedgeStats.requests = HedgeStats.dropped = HedgeStats.songs = 0
+
+	times = []
+	found = {}
+	for song in songs.values():
+		song.lyrics = song.source = None
+		start = time.time()
+		hedged_fetch(song, sources)
+		times.append(time.time() - start)
+		found[song.title] = song.source
+
+	times.sort()
+	print('%-12s %6.2f requests/song  %5.1f%% not needed  mean %6.1fms  p95 %6.1fms' % (
+		label, HedgeStats.requests / float(len(songs)),
+		100.0 * HedgeStats.dropped / max(1, HedgeStats.requests),
+		1000 * sum(times) / len(times), 1000 * times[int(len(times) * 0.95)]))
+	return found
+
+
+def main():
+	song_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+
+	random.seed(1)
+	songs = {}
+	for i in range(song_count):
+		hits = set(name for name, latency, hit_rate in SOURCES if random.random() < hit_rate)
+		song = BenchSong(i, hits)
+		songs[song.title] = song
+
+	sources = [(name, get_download(name, latency, songs)) for name, latency, hit_rate in SOURCES]
+
+	baseline = None
+	for label, race_sources, hedge_delay in SETTINGS:
+		found = run_setting(label, race_sources, hedge_delay, songs, sources)
+		if baseline is None:
+			baseline = found
+		elif found != baseline:
+			print('\tLyrics came from other sources than one by one.')
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+"""
+	Compares lyrics lookups with a new connection per request(requests.get)
+	and with the shared per source sessions of build_requests.get_session.
+
+	Usage:
+		python benchmarks/bench_http_sessions.py [<song_count>]
+
+	A local HTTP server stands in for each lyrics source. Every song misses
+	on the first three sources and is found on the fourth, so each song
+	makes four requests, like a song found by LYRICSMODE. The servers count
+	the connections(TCP handshakes) they accept. Over the internet each
+	handshake costs a round trip, two or more with TLS, so the time saved
+	is far larger than on localhost.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import sys
+import time
+import threading
+
+try:
+	from http.server import HTTPServer, BaseHTTPRequestHandler
+	from socketserver import ThreadingMixIn
+except ImportError:
+	# python27
+	from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+	from SocketServer import ThreadingMixIn
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lyrico.lyrico_sources.build_requests import get_session, get_lyrico_headers, close_sessions
+
+
+SOURCES = ['lyric_wikia', 'musix_match', 'lyricsmode', 'az_lyrics']
+LYRICS_PAGE = b'<html><body><div class="lyricbox">' + b'la la la<br>' * 100 + b'</div></body></html>'
+
+
+class SourceServer(ThreadingMixIn, HTTPServer):
+	daemon_threads = True
+
+	def __init__(self, found):
+		HTTPServer.__init__(self, ('127.0.0.1', 0), SourceHandler)
+		self.found = found
+		self.connections = 0
+		self.lock = threading.Lock()
+
+
+class SourceHandler(BaseHTTPRequestHandler):
+
+	# Keep connections alive
+	protocol_version = 'HTTP/1.1'
+
+	# Headers and body are written separately. Without this, delayed ACKs
+	# stall every response on a kept alive connection.
+	disable_nagle_algorithm = True
+
+	def setup(self):
+		BaseHTTPRequestHandler.setup(self)
+		with self.server.lock:
+			self.server.connections += 1
+
+	def do_GET(self):
+		body = LYRICS_PAGE if self.server.found else b'Not found'
+		self.send_response(200 if self.server.found else 404)
+		self.send_header('Content-Type', 'text/html')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, *args):
+		pass
+
+
+def lookup(get, servers, song_index):
+	"""Tries the sources in order until one has the lyrics"""
+
+	for source_name, server in zip(SOURCES, servers):
+		url = 'http://127.0.0.1:%d/lyrics/artist/title-%d' % (server.server_address[1], song_index)
+		res = get(source_name, url)
+		if res.status_code == 200:
+			return res.text
+
+
+def run_variant(name, get, servers, song_count):
+	for server in servers:
+		server.connections = 0
+
+	start = time.time()
+	for i in range(song_count):
+		lookup(get, servers, i)
+	elapsed = time.time() - start
+
+	connections = sum(server.connections for server in servers)
+	print('%-10s %6d requests  %6d connections  %8.1f handshakes per 1000 songs  %7.3fs' %
+		(name, song_count * len(SOURCES), connections, connections * 1000.0 / song_count, elapsed))
+
+
+def main():
+	song_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+	# Only the last source has the lyrics.
+	servers = [SourceServer(found=(i == len(SOURCES) - 1)) for i in range(len(SOURCES))]
+	for server in servers:
+		thread = threading.Thread(target=server.serve_forever)
+		thread.daemon = True
+		thread.start()
+
+	headers = get_lyrico_headers()
+	try:
+		run_variant('requests', lambda source_name, url: requests.get(url, headers=headers), servers, song_count)
+		run_variant('sessions', lambda source_name, url: get_session(source_name).get(url), servers, song_count)
+	finally:
+		close_sessions()
+		for server in servers:
+			server.shutdown()
+
+
+if __name__ == '__main__':
+	main()
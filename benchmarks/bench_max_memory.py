@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+"""
+	Compares the peak RSS of the pipeline with and without a memory ceiling.
+
+	Usage:
+		python benchmarks/bench_max_memory.py [<song_count>] [<max_memory>]
+
+	<song_count>(default 800) songs come from a generated manifest, no
+	audio files are needed. Each song gets 2MB of lyrics from a fake source
+	and saving is made slower than downloading, so finished downloads pile
+	up in the pipeline's queues. Each variant runs in its own process.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+
+try:
+	import resource
+except ImportError:
+	# Windows
+	resource = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lyrico.config import Config
+from lyrico.song import Song
+from lyrico.pipeline import SongPipeline
+from lyrico.memory_governor import MemoryGovernor
+from lyrico.song_helper import get_manifest_song_data
+
+
+LYRICS_SIZE = 2 * 1024 * 1024
+
+
+def fetch_lyrics(song):
+	time.sleep(0.001)
+	song.lyrics = 'x' * LYRICS_SIZE
+	return True
+
+
+def save_lyrics(song):
+	time.sleep(0.01)
+	song.lyrics = None
+
+
+def run_variant(max_memory, song_count):
+	temp_dir = tempfile.mkdtemp(prefix='lyrico-bench-')
+	Config.lyrics_dir = temp_dir
+	Config.overwrite = True
+	Song.fetch_lyrics = fetch_lyrics
+	Song.save_lyrics = save_lyrics
+
+	try:
+		governor = MemoryGovernor.create(max_memory)
+		pipeline = SongPipeline(governor=governor)
+
+		records = ({'path': '/music/track %d.mp3' % i, 'artist': 'Artist', 'title': 'Title %d' % i}
+			for i in range(song_count))
+		songs = (Song(record['path'], get_manifest_song_data(record)) for record in records)
+
+		start = time.time()
+		count = sum(1 for song in pipeline.run(songs))
+		elapsed = time.time() - start
+	finally:
+		shutil.rmtree(temp_dir)
+
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+	pauses = governor.pauses if governor else 0
+	print('max_memory %-6s %d songs %7.2fs  peak RSS %7.1f MB  %d pauses' %
+		(max_memory, count, elapsed, peak, pauses))
+
+
+def main():
+	if resource is None:
+		print('The resource module is not available on this platform.')
+		return
+
+	if len(sys.argv) > 2 and sys.argv[1] == '--variant':
+		run_variant(sys.argv[2], int(sys.argv[3]))
+		return
+
+	song_count = sys.argv[1] if len(sys.argv) > 1 else '800'
+	max_memory = sys.argv[2] if len(sys.argv) > 2 else '100M'
+	for variant in ('none', max_memory):
+		subprocess.call([sys.executable, os.path.abspath(__file__), '--variant', variant, song_count])
+
+
+if __name__ == '__main__':
+	main()
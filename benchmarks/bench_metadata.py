@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+"""
+	Compares reading tags in lyrico's process with reading them in a pool
+	of worker processes.
+
+	Usage:
+		python benchmarks/bench_metadata.py [<song_count>]
+
+	<song_count>(default 5000) mp3 files holding only an ID3 tag with artist,
+	title, album and some padding frames are created in a temp folder.
+	Scaling depends on the number of CPUs, which is printed first.
+
+	Scaling with more workers is unverified. It was only measured on a
+	single CPU, where every worker count read about 1900 songs/s.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mutagen.id3 import ID3, TPE1, TIT2, TALB, COMM
+
+from lyrico.config import Config
+from lyrico.metadata_pool import extract_song_data
+
+
+def build_library(root, song_count):
+	os.makedirs(root)
+	for i in range(song_count):
+		path = os.path.join(root, 'track %d.mp3' % i)
+		open(path, 'wb').close()
+
+		tag = ID3()
+		tag.add(TPE1(encoding=3, text='Artist %d' % (i % 100)))
+		tag.add(TIT2(encoding=3, text='Title %d' % i))
+		tag.add(TALB(encoding=3, text='Album %d' % (i % 10)))
+		for j in range(8):
+			tag.add(COMM(encoding=3, lang='eng', desc='comment %d' % j, text='x' * 200))
+		tag.save(path)
+
+
+def time_extract(song_paths, workers):
+	start = time.time()
+	count = sum(1 for path, data in extract_song_data(song_paths, workers) if data['artist'])
+	return time.time() - start, count
+
+
+def main():
+	song_count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+
+	temp_dir = tempfile.mkdtemp(prefix='lyrico-bench-')
+
+	# Lyrics file names are still built, but never looked up. Tags are
+	# read on every pass.
+	Config.lyrics_dir = temp_dir
+	Config.save_to_file = False
+	Config.metadata_cache = False
+
+	root = os.path.join(temp_dir, 'library')
+	build_library(root, song_count)
+	song_paths = [os.path.join(root, name) for name in sorted(os.listdir(root))]
+
+	cpus = multiprocessing.cpu_count()
+	print('CPUs: %d, songs: %d' % (cpus, song_count))
+
+	try:
+		for workers in sorted(set((1, 2, 4, cpus))):
+			elapsed, count = time_extract(song_paths, workers)
+			print('workers=%-3d %8.3fs  %6.0f songs/s  %d tags read' %
+				(workers, elapsed, song_count / elapsed, count))
+	finally:
+		shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+"""
+	Compares single threaded and threaded scans of a synthetic deep tree.
+
+	Usage:
+		python benchmarks/bench_parallel_scan.py [<latency_ms>]
+
+	Local disks answer folder reads from the page cache, so <latency_ms>
+	(default 2) is added to every folder read to stand in for the round trip
+	of a NFS/SMB mount.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lyrico import scanner
+from lyrico.scanner import LibraryScanner
+
+
+def build_deep_tree(root, depth=5, fanout=4, files_per_dir=6):
+	# depth 5 and fanout 4 gives 341 folders
+	pending = [(root, 0)]
+	while pending:
+		path, level = pending.pop()
+		os.makedirs(path)
+		for i in range(files_per_dir):
+			open(os.path.join(path, 'track %d.mp3' % i), 'w').close()
+		if level < depth - 1:
+			for i in range(fanout):
+				pending.append((os.path.join(path, 'dir %d' % i), level + 1))
+
+
+def with_latency(scandir, latency):
+	def slow_scandir(path):
+		time.sleep(latency)
+		return scandir(path)
+	return slow_scandir
+
+
+def time_walk(root, threads, ordered):
+	start = time.time()
+	count = len(list(LibraryScanner(threads=threads, ordered=ordered).walk(root)))
+	return time.time() - start, count
+
+
+def main():
+	latency = float(sys.argv[1]) / 1000 if len(sys.argv) > 1 else 0.002
+
+	temp_dir = tempfile.mkdtemp(prefix='lyrico-bench-')
+	root = os.path.join(temp_dir, 'library')
+	build_deep_tree(root)
+
+	scanner.scandir = with_latency(scanner.scandir, latency)
+	print('Folder read latency: %.1fms' % (latency * 1000))
+
+	try:
+		for threads in (1, 2, 4, 8, 16, 32):
+			for ordered in (True, False):
+				if threads == 1 and not ordered:
+					continue
+				elapsed, count = time_walk(root, threads, ordered)
+				print('threads=%-3d %-10s %8.3fs  %d audio files' %
+					(threads, 'ordered' if ordered else 'unordered', elapsed, count))
+	finally:
+		shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+	main()
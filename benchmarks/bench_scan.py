@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+"""
+	Compares the single pass 'scandir' walker with the old glob2 based scan
+	of 'source_dir'(one glob per audio format and case).
+
+	Usage:
+		python benchmarks/bench_scan.py [<library_dir>]
+
+	When <library_dir> is not given, a synthetic library is created in a
+	temporary folder and removed after the run.
+
+	glob2 is no longer a dependency of lyrico. Install it to run this.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+import glob2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lyrico.config import Config
+from lyrico.scanner import walk_audio_files
+
+
+def glob2_scan(path):
+	# The scan lyrico used before the 'scandir' walker.
+	song_list = []
+	for ext in Config.audio_formats:
+		song_list.extend(glob2.glob(os.path.join(path, '**/*.' + ext)))
+		song_list.extend(glob2.glob(os.path.join(path, '**/*.' + ext.upper())))
+	return song_list
+
+
+def scandir_scan(path):
+	return list(walk_audio_files(path))
+
+
+def build_library(root, artists=40, albums=10, tracks=12):
+	# Each album folder holds audio files in mixed case along with
+	# the usual cover art and playlist files.
+	extensions = ['mp3', 'flac', 'm4a', 'MP3', 'Ogg', 'wma']
+	for a in range(artists):
+		for b in range(albums):
+			album_dir = os.path.join(root, 'Artist %d' % a, 'Album %d' % b)
+			os.makedirs(album_dir)
+			for t in range(tracks):
+				ext = extensions[(a + b + t) % len(extensions)]
+				open(os.path.join(album_dir, '%02d Track.%s' % (t, ext)), 'w').close()
+			open(os.path.join(album_dir, 'cover.jpg'), 'w').close()
+			open(os.path.join(album_dir, 'playlist.m3u'), 'w').close()
+
+
+def time_scan(scan, path, repeat):
+	best = None
+	songs = []
+	for _ in range(repeat):
+		start = time.time()
+		songs = scan(path)
+		elapsed = time.time() - start
+		best = elapsed if best is None else min(best, elapsed)
+	return best, len(songs), len(set(songs))
+
+
+def main():
+	temp_dir = None
+	if len(sys.argv) > 1:
+		library = sys.argv[1]
+	else:
+		temp_dir = tempfile.mkdtemp(prefix='lyrico-bench-')
+		library = os.path.join(temp_dir, 'library')
+		build_library(library)
+
+	try:
+		for name, scan in (('glob2', glob2_scan), ('scandir', scandir_scan)):
+			best, count, unique = time_scan(scan, library, 3)
+			print('%-8s %8.3fs  %d audio files(%d unique)' % (name, best, count, unique))
+	finally:
+		if temp_dir:
+			shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+	main()
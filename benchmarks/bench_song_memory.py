@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+"""
+	Compares the peak RSS of keeping a million Song objects in memory, as
+	lyrico does until the log is written.
+
+	Usage:
+		python benchmarks/bench_song_memory.py [<song_count>]
+
+	Each variant runs in its own process, so peak RSS(ru_maxrss) only
+	covers that variant. Songs are built from synthetic metadata, no audio
+	files are needed. Every song gets ~1.5KB of lyrics, saved and then
+	released by the current Song class.
+
+	- 'dict': the Song record before slots. A __dict__ per song, holding the
+	  lyrics file name and the downloaded lyrics for the whole run.
+	- 'slots': the current Song class.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import sys
+import subprocess
+
+try:
+	import resource
+except ImportError:
+	# Windows
+	resource = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lyrico.song import Song
+
+
+LYRICS = 'La la la, these are the lyrics of the song\n' * 36
+
+
+class DictSong():
+
+	"""Same fields as the Song class had before __slots__"""
+
+	def __init__(self, path, data):
+		self.path = path
+		self.tag = None
+		self.artist = data['artist']
+		self.title = data['title']
+		self.album = data['album']
+		self.format = data['format']
+		self.lyrics_file_name = data['lyrics_file_name']
+		self.lyrics_file_path = data['lyrics_file_path']
+		self.lyrics_file_present = data['lyrics_file_present']
+		self.lyrics_tag_present = data['lyrics_tag_present']
+		self.lyrics = None
+		self.saved_to_tag = False
+		self.saved_to_file = False
+		self.source = None
+		self.error = data['error']
+
+
+def get_data(i):
+	artist = 'Artist %d' % (i // 10)
+	title = 'Title %d' % i
+	lyrics_file_name = '%s - %s.txt' % (artist, title)
+	return {
+		'artist': artist,
+		'title': title,
+		'album': 'Album %d' % (i // 10),
+		'format': 'mp3',
+		'lyrics_file_name': lyrics_file_name,
+		'lyrics_file_path': os.path.join('/music/lyrics', lyrics_file_name),
+		'lyrics_file_present': False,
+		'lyrics_tag_present': False,
+		'error': None,
+	}
+
+
+def run_variant(variant, song_count):
+	song_class = Song if variant == 'slots' else DictSong
+
+	song_list = []
+	for i in range(song_count):
+		path = '/music/Artist %d/Title %d.mp3' % (i // 10, i)
+		song = song_class(path, get_data(i))
+
+		# Each song gets its own copy of the lyrics, as if downloaded.
+		song.lyrics = LYRICS + str(i)
+		song.source = 'WIKI'
+		song.saved_to_file = True
+		if variant == 'slots':
+			# Released by Song.save_lyrics
+			song.lyrics = None
+		song_list.append(song)
+
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	if sys.platform != 'darwin':
+		# kilobytes on Linux
+		peak *= 1024
+	print('%-6s %d songs  peak RSS %8.1f MB' % (variant, len(song_list), peak / 1024.0 / 1024))
+
+
+def main():
+	if resource is None:
+		print('The resource module is not available on this platform.')
+		return
+
+	if len(sys.argv) > 2 and sys.argv[1] == '--variant':
+		run_variant(sys.argv[2], int(sys.argv[3]))
+		return
+
+	song_count = sys.argv[1] if len(sys.argv) > 1 else '1000000'
+	for variant in ('dict', 'slots'):
+		subprocess.call([sys.executable, os.path.abspath(__file__), '--variant', variant, song_count])
+
+
+if __name__ == '__main__':
+	main()
@@ -5,4 +5,8 @@
 
 
 from .lyrico import main
-main()
+
+# Guard needed since worker processes reading tags import this module on
+# platforms which spawn processes(Windows, macOS).
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+"""
+	Contains the AsyncFetchStage class, an asyncio based fetch stage for
+	the pipeline used with '--jobs'. Python 3 only, the pipeline falls back
+	to fetch threads when it can't be imported.
+
+	Up to 'jobs' songs are downloaded at the same time. Each song still
+	tries the sources one after another, in the order of get_enabled_sources.
+	Requests to a source wait for a free connection to its host
+	("host_connections" per source) and for a free connection overall
+	("max_connections"). So throughput grows with 'jobs' until the hosts
+	the songs are found on are saturated.
+
+	The sources are written with requests, which blocks, so each request
+	runs in a thread of an executor sized to "max_connections". asyncio
+	only schedules the songs and enforces the limits.
+
+	With hedging(see hedged_fetch module) the sources of a song are asked
+	as asyncio tasks. Tasks of sources no longer needed are cancelled, so
+	requests still waiting for a connection are never sent.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import time
+import asyncio
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import Config
+from .song import LYRICS_SOURCES, get_enabled_sources
+from .source_stats import timed_download
+from .hedged_fetch import HedgedLookup, hedging_enabled, run_lookup
+from .pipeline import STOP, start_thread, fetch_song
+
+
+class AsyncFetchStage():
+
+	def __init__(self, jobs, queue_size, governor=None):
+		self.jobs = max(1, jobs)
+
+		# Songs are read by a single thread, one STOP ends the stage.
+		self.workers = 1
+		self.input = queue.Queue(queue_size)
+
+		# Set by connect
+		self.output = None
+		self.output_workers = 1
+
+		self.governor = governor
+
+	def connect(self, output, output_workers=1):
+		self.output = output
+		self.output_workers = output_workers
+
+	def start(self):
+		start_thread(self.run)
+
+	def run(self):
+		loop = asyncio.new_event_loop()
+		try:
+			loop.run_until_complete(self.fetch_all(loop))
+		finally:
+			loop.close()
+
+		for _ in range(self.output_workers):
+			self.output.put(STOP)
+
+	def next_song(self):
+		"""Returns the next song, after waiting for the governor"""
+
+		song = self.input.get()
+		if song is not STOP and self.governor:
+			self.governor.acquire('fetch')
+		return song
+
+	async def fetch_all(self, loop):
+
+		# Requests block, they run in these threads. Reading and writing the
+		# queues block as well, so they get their own threads.
+		self.executor = ThreadPoolExecutor(max(1, Config.max_connections))
+		input_executor = ThreadPoolExecutor(1)
+		self.output_executor = ThreadPoolExecutor(1)
+
+		self.global_limit = asyncio.Semaphore(max(1, Config.max_connections))
+		self.host_limits = dict((setting, asyncio.Semaphore(max(1, Config.host_connections)))
+			for setting, download in LYRICS_SOURCES)
+
+		jobs = asyncio.Semaphore(self.jobs)
+		tasks = set()
+
+		def finished(task):
+			tasks.discard(task)
+			jobs.release()
+
+		try:
+			while True:
+				# Wait for a free job before taking the song, so songs stay
+				# in the queue(and producers wait) while all jobs are busy.
+				await jobs.acquire()
+				song = await loop.run_in_executor(input_executor, self.next_song)
+				if song is STOP:
+					break
+
+				task = asyncio.ensure_future(self.fetch(loop, song))
+				tasks.add(task)
+				task.add_done_callback(finished)
+
+			if tasks:
+				await asyncio.wait(list(tasks))
+		finally:
+			self.executor.shutdown(wait=False)
+			input_executor.shutdown(wait=False)
+			self.output_executor.shutdown(wait=False)
+
+	async def fetch(self, loop, song):
+		try:
+			if song.artist and song.title:
+				if song.start_fetch():
+					if hedging_enabled():
+						await self.fetch_hedged(loop, song)
+					else:
+						for setting, download in get_enabled_sources():
+							if not song.lyrics:
+								await self.download(loop, setting, download, song)
+			else:
+				# Logs the song as ignored
+				fetch_song(song)
+		except Exception as e:
+			# Keep the pipeline going. The song is logged as failed.
+			print('Unexpected error for', song.path)
+			print(e)
+			song.error = str(e)
+
+		await loop.run_in_executor(self.output_executor, self.output.put, song)
+
+	async def download(self, loop, setting, download, song):
+		"""Runs the download function once the host has a free connection"""
+
+		async with self.host_limits[setting]:
+			async with self.global_limit:
+				await loop.run_in_executor(self.executor, timed_download, setting, download, song)
+
+	async def ask_source(self, loop, setting, download, lookup):
+		async with self.host_limits[setting]:
+			async with self.global_limit:
+				lookup.sent = True
+				await loop.run_in_executor(self.executor, run_lookup, setting, download, lookup)
+
+	async def fetch_hedged(self, loop, song):
+		"""Asks the sources for song as tasks, see hedged_fetch module"""
+
+		hedged = HedgedLookup(song, get_enabled_sources())
+		tasks = set()
+		try:
+			while True:
+				decided, index = hedged.result()
+				if decided:
+					break
+
+				ask, wait = hedged.next_source(time.time())
+				if ask:
+					source_index, setting, download, lookup = hedged.ask(time.time())
+					tasks.add(asyncio.ensure_future(self.ask_source(loop, setting, download, lookup)))
+					continue
+
+				done, tasks = await asyncio.wait(tasks, timeout=wait,
+					return_when=asyncio.FIRST_COMPLETED)
+		finally:
+			# Sources still waiting for a connection are not asked.
+			for task in tasks:
+				task.cancel()
+
+		hedged.finish(index)
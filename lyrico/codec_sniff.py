@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+"""
+	Contains helpers to detect the container and codec of audio files from
+	their first bytes, instead of trusting the file extension.
+
+	A single small read tells mp3, FLAC, MP4 and ASF files apart and, for
+	Ogg files, which codec the stream holds. So Ogg files are parsed once
+	with the right mutagen class, files with a wrong extension are read
+	with the class matching their content and Opus/Speex files, which
+	lyrico can't tag, are skipped without being parsed.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import io
+import struct
+import uuid
+
+
+# Bytes read from the start of the file. Enough for the first Ogg page
+# header and the start of its first packet.
+SNIFF_BYTES = 512
+
+ASF_HEADER_OBJECT = uuid.UUID('75B22630-668E-11CF-A6D9-00AA0062CE6C').bytes_le
+
+# Box types found at the start of MP4 files
+MP4_BOXES = (b'ftyp', b'moov', b'mdat', b'free', b'skip', b'wide')
+
+# Start of the first packet of Ogg streams -> codec
+OGG_CODECS = [
+	(b'\x01vorbis', 'ogg-vorbis'),
+	(b'\x7fFLAC', 'ogg-flac'),
+	(b'OpusHead', 'ogg-opus'),
+	(b'Speex   ', 'ogg-speex'),
+]
+
+# Format(as in audio_format_keys.FORMAT_KEYS) used for each codec
+CODEC_FORMATS = {
+	'mp3': 'mp3',
+	'flac': 'flac',
+	'mp4': 'm4a',
+	'wma': 'wma',
+	'ogg-vorbis': 'ogg',
+	'ogg-flac': 'ogg',
+}
+
+# Extensions which are read with the same mutagen class
+FORMAT_FAMILIES = {
+	'mp3': 'mp3',
+	'flac': 'flac',
+	'm4a': 'mp4',
+	'mp4': 'mp4',
+	'wma': 'wma',
+	'ogg': 'ogg',
+	'oga': 'ogg',
+}
+
+# Detected codecs lyrico can't read or save tags for, with the error logged.
+UNSUPPORTED_CODECS = {
+	'ogg-opus': 'Opus audio is not supported. Only Vorbis and FLAC are supported in .ogg/.oga files.',
+	'ogg-speex': 'Speex audio is not supported. Only Vorbis and FLAC are supported in .ogg/.oga files.',
+	'ogg': 'Unable to read metadata from the .ogg/.oga file. Only Vorbis and FLAC are supported.',
+}
+
+
+def sniff_codec(path):
+
+	"""
+		Returns the codec of the audio file at path: 'mp3', 'flac', 'mp4',
+		'wma', 'ogg-vorbis', 'ogg-flac', 'ogg-opus', 'ogg-speex', 'ogg'
+		for other Ogg streams, or None if it is not recognized.
+
+		Raises IOError if the file can't be read.
+	"""
+
+	with io.open(path, 'rb') as f:
+		header = f.read(SNIFF_BYTES)
+
+		if header[0:3] == b'ID3' and len(header) >= 10:
+			# FLAC files can also start with an ID3v2 tag. Look past it.
+			size = 10 + get_syncsafe(header[6:10])
+			if struct.unpack(str('>B'), header[5:6])[0] & 0x10:
+				# footer
+				size += 10
+			f.seek(size)
+			if f.read(4) == b'fLaC':
+				return 'flac'
+			return 'mp3'
+
+	return sniff_header(header)
+
+
+def get_syncsafe(data):
+	"""Returns int stored in 4 bytes, 7 bits each, as in ID3v2 sizes"""
+
+	b = struct.unpack(str('>4B'), data)
+	return ((b[0] & 0x7F) << 21) | ((b[1] & 0x7F) << 14) | ((b[2] & 0x7F) << 7) | (b[3] & 0x7F)
+
+
+def sniff_header(header):
+	"""Returns the codec(see sniff_codec) for the first bytes of a file"""
+
+	if header[0:4] == b'fLaC':
+		return 'flac'
+
+	if header[0:4] == b'OggS' and len(header) >= 27:
+		segment_count = struct.unpack(str('>B'), header[26:27])[0]
+		packet = header[27 + segment_count:]
+		for signature, codec in OGG_CODECS:
+			if packet.startswith(signature):
+				return codec
+		return 'ogg'
+
+	if header[4:8] in MP4_BOXES:
+		return 'mp4'
+
+	if header[0:16] == ASF_HEADER_OBJECT:
+		return 'wma'
+
+	if len(header) >= 2:
+		# MPEG audio frame sync: 11 set bits, layer bits not 00
+		sync = struct.unpack(str('>H'), header[0:2])[0]
+		if sync & 0xFFE0 == 0xFFE0 and sync & 0x0006:
+			return 'mp3'
+
+	return None
+
+
+def get_format(song_format, codec):
+
+	"""
+		Returns the format to read the file with. The format from the
+		extension is kept unless the content is in another container.
+	"""
+
+	codec_format = CODEC_FORMATS.get(codec)
+	if codec_format is None:
+		return song_format
+
+	if FORMAT_FAMILIES.get(song_format) == FORMAT_FAMILIES[codec_format]:
+		return song_format
+	return codec_format
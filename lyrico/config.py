@@ -5,7 +5,6 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import os
-import glob2
 
 
 try:
@@ -62,21 +61,109 @@ class Config():
 
 	# Audio formats supported are not loaded from config.ini
 
-	# This list is used by the 'glob2' module to scan 'source_dir' for audio files.
+	# This list is used by the scanner module to scan 'source_dir' for audio files.
 	audio_formats = ['mp3', 'flac', 'm4a', 'mp4', 'ogg', 'oga', 'wma']
 
 	lyrics_dir = None
 	source_dir = None
 
+	# How lyrics files are placed in 'lyrics_dir'. See lyrics_layout module.
+	lyrics_layout = 'flat'
+
 	save_to_file = True
 	save_to_tag = False
 
 	overwrite = False
-	lyric_files_in_dir = None
 
 	# Flag to test if the config has been loaded
 	is_loaded = False
 
+	# Name of the folder inside 'lyrics_dir' where lyrico keeps its state files.
+	state_dir_name = '.lyrico'
+
+	# Performance settings. These are optional in config.ini and keep
+	# the following defaults when missing.
+
+	# Number of threads listing folders concurrently when scanning 'source_dir'.
+	scan_threads = 1
+
+	# Yield songs in the same order as a single threaded scan.
+	scan_ordered = True
+
+	# Order in which tags are read: 'none'(scan order), 'inode' or 'extent'.
+	# See read_order module.
+	read_order = 'none'
+
+	# Number of upcoming files to read ahead when read_order is set.
+	readahead_files = 4
+
+	# Read artist, title, album and lyrics with tag_probe instead of mutagen.
+	tag_probe = True
+
+	# Keep metadata read from tags in a SQLite database(see metadata_cache module).
+	metadata_cache = True
+
+	# Number of processes reading tags. 1 reads tags in lyrico's own process.
+	metadata_workers = 1
+
+	# Number of songs sent to a worker process at once.
+	metadata_chunksize = 64
+
+	# Number of threads downloading lyrics. See pipeline module.
+	fetch_workers = 1
+
+	# Songs downloaded at the same time by the asyncio fetch stage. 1 uses
+	# fetch_workers threads instead. See async_fetch module.
+	jobs = 1
+
+	# Connections at the same time per lyrics source, and overall, with jobs.
+	host_connections = 4
+	max_connections = 16
+
+	# Sources asked at the same time for a song, and seconds after which the
+	# next source is asked anyway. 1 and 0 ask them one after another. See
+	# hedged_fetch module.
+	race_sources = 1
+	hedge_delay = 0.0
+
+	# Order in which sources are tried: 'adaptive', 'fixed' or a comma
+	# separated list of sources, and the fraction of songs trying them in
+	# random order with 'adaptive'. See source_stats module.
+	source_order = 'adaptive'
+	source_exploration = 0.05
+
+	# Number of threads saving lyrics to files and tags.
+	save_workers = 1
+
+	# Songs waiting between two stages of the pipeline. Bounds the number
+	# of songs in flight.
+	queue_size = 100
+
+	# Memory ceiling for the pipeline, ex. '512M'. 'none' for no ceiling.
+	# See memory_governor module.
+	max_memory = 'none'
+
+	# Connections kept alive per lyrics source. Never less than fetch_workers
+	# or host_connections.
+	http_pool_size = 10
+
+	# Connect to all enabled sources when the run starts.
+	http_prewarm = False
+
+	# Retries of requests a host throttled(429 or 503), first backoff in
+	# seconds, and the longest wait before giving up on the host.
+	max_retries = 3
+	retry_backoff = 1.0
+	max_retry_wait = 60.0
+
+	# Requests per second per host, source or 'default', from the optional
+	# [rate_limits] section. See lyrico_sources.rate_limits module.
+	rate_limits = {}
+
+	# Concurrent tag reads and saves per device type or mount point, from
+	# the optional [devices] section. See device_limits module.
+	device_limits = {}
+
 	@staticmethod
 	def load_config(check_config):
 
@@ -101,6 +188,7 @@ class Config():
 
 			Config.source_dir = conf.get('paths', 'source_dir')
 			Config.lyrics_dir = conf.get('paths', 'lyrics_dir')
+			Config.lyrics_layout = Config.get_optional(conf, 'paths', 'lyrics_layout', 'flat')
 
 			# This forces user to set dirs before running the app for first time.
 			if (Config.lyrics_dir == 'None' or Config.source_dir == 'None') and check_config:
@@ -129,8 +217,39 @@ class Config():
 				not Config.az_lyrics and not Config.musix_match and not Config.lyricsmode) and check_config):
 				raise BadConfigError(3, 'Bad Config')
 
-			# Loading this with user config, we need to call the load_config only once at start.
-			Config.lyric_files_in_dir = glob2.glob(os.path.join(Config.lyrics_dir, '**/*.txt'))
+			Config.scan_threads = Config.get_optional(conf, 'performance', 'scan_threads', 1)
+			Config.scan_ordered = Config.get_optional(conf, 'performance', 'scan_ordered', True)
+			Config.read_order = Config.get_optional(conf, 'performance', 'read_order', 'none')
+			Config.readahead_files = Config.get_optional(conf, 'performance', 'readahead_files', 4)
+			Config.tag_probe = Config.get_optional(conf, 'performance', 'tag_probe', True)
+			Config.metadata_cache = Config.get_optional(conf, 'performance', 'metadata_cache', True)
+			Config.metadata_workers = Config.get_optional(conf, 'performance', 'metadata_workers', 1)
+			Config.metadata_chunksize = Config.get_optional(conf, 'performance', 'metadata_chunksize', 64)
+			Config.fetch_workers = Config.get_optional(conf, 'performance', 'fetch_workers', 1)
+			Config.jobs = Config.get_optional(conf, 'performance', 'jobs', 1)
+			Config.host_connections = Config.get_optional(conf, 'performance', 'host_connections', 4)
+			Config.max_connections = Config.get_optional(conf, 'performance', 'max_connections', 16)
+			Config.race_sources = Config.get_optional(conf, 'performance', 'race_sources', 1)
+			Config.hedge_delay = Config.get_optional(conf, 'performance', 'hedge_delay', 0.0)
+			Config.source_order = Config.get_optional(conf, 'performance', 'source_order', 'adaptive').strip().lower()
+			Config.source_exploration = Config.get_optional(conf, 'performance', 'source_exploration', 0.05)
+			Config.save_workers = Config.get_optional(conf, 'performance', 'save_workers', 1)
+			Config.queue_size = Config.get_optional(conf, 'performance', 'queue_size', 100)
+			Config.max_memory = Config.get_optional(conf, 'performance', 'max_memory', 'none')
+			Config.http_pool_size = Config.get_optional(conf, 'performance', 'http_pool_size', 10)
+			Config.http_prewarm = Config.get_optional(conf, 'performance', 'http_prewarm', False)
+
+			Config.max_retries = Config.get_optional(conf, 'performance', 'max_retries', 3)
+			Config.retry_backoff = Config.get_optional(conf, 'performance', 'retry_backoff', 1.0)
+			Config.max_retry_wait = Config.get_optional(conf, 'performance', 'max_retry_wait', 60.0)
+
+			if conf.has_section('rate_limits'):
+				Config.rate_limits = dict((key, conf.getfloat('rate_limits', key))
+					for key in conf.options('rate_limits'))
+
+			if conf.has_section('devices'):
+				Config.device_limits = dict((key, conf.getint('devices', key))
+					for key in conf.options('devices'))
 
 			Config.is_loaded = True
 
@@ -169,6 +288,26 @@ class Config():
 			print('Unable to load config.')
 			print(e)
 
+	@staticmethod
+	def get_optional(conf, section, key, default):
+
+		"""
+			Reads an optional setting from conf. Configs saved by older versions
+			of lyrico don't have these, so default is returned when missing.
+			The type of default decides how the value is parsed.
+		"""
+
+		if not conf.has_option(section, key):
+			return default
+
+		if isinstance(default, bool):
+			return conf.getboolean(section, key)
+		if isinstance(default, int):
+			return conf.getint(section, key)
+		if isinstance(default, float):
+			return conf.getfloat(section, key)
+		return conf.get(section, key)
+
 	@staticmethod
 	def set_dir(dir_type, path):
 
@@ -258,6 +397,22 @@ class Config():
 			# Action is to enable/disable a source.
 			print('lyrico will %suse %s as a source for lyrics.' % (log_str, SOURCE_STR_MAP[target]))
 
+	@staticmethod
+	def get_state_path(file_name):
+
+		"""
+			Returns path to a lyrico state file. State files are kept in a
+			hidden folder inside 'lyrics_dir' which is created if missing.
+		"""
+
+		state_dir = os.path.join(Config.lyrics_dir, Config.state_dir_name)
+		try:
+			os.makedirs(state_dir)
+		except OSError:
+			if not os.path.isdir(state_dir):
+				raise
+		return os.path.join(state_dir, file_name)
+
 	@staticmethod
 	def show_settings():
 		
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+
+"""
+	Contains the DeviceLimits class which limits how many tags are read or
+	saved at the same time on each device.
+
+	Songs are grouped by the st_dev of their file. Each device gets its own
+	limit, by default based on its type:
+
+		- 'ssd' - flash storage handles many requests in parallel
+		- 'hdd' - spinning disks(and RAIDs of them) seek for each request
+		- 'network' - NFS, SMB and other network mounts, bound by latency
+		- 'unknown' - the type could not be detected(ex. not Linux)
+
+	The type is detected on Linux from /proc/self/mountinfo and the
+	'rotational' flag of the block device in /sys. Limits per type, or
+	per mount point, can be set in the [devices] section of config.ini:
+
+		[devices]
+		hdd = 1
+		/mnt/nfs/music = 16
+
+	Tag reads are limited in the worker processes of metadata_pool, tag
+	saves in the save threads of the pipeline.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import io
+import os
+import re
+import threading
+import contextlib
+
+from .config import Config
+
+
+# Default number of concurrent tag reads or saves per device type
+DEFAULT_LIMITS = {
+	'ssd': 16,
+	'hdd': 2,
+	'network': 8,
+	'unknown': 4,
+}
+
+NETWORK_FILESYSTEMS = ('nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'ncpfs', 'afs',
+	'9p', 'ceph', 'glusterfs', 'fuse.sshfs', 'fuse.glusterfs', 'fuse.rclone')
+
+
+OCTAL_ESCAPE = re.compile(r'\\([0-7]{3})')
+
+
+def read_mounts():
+
+	"""
+		Returns list of (mount_point, fs_type, st_dev) from
+		/proc/self/mountinfo, longest mount points first. Empty when not
+		available.
+	"""
+
+	mounts = []
+	try:
+		with io.open('/proc/self/mountinfo', 'r', encoding='utf-8') as f:
+			for line in f:
+				fields = line.split()
+				separator = fields.index('-')
+				major, minor = fields[2].split(':')
+
+				# Spaces and other characters are escaped as octal, ex. '\040'
+				mount_point = OCTAL_ESCAPE.sub(lambda m: '%c' % int(m.group(1), 8), fields[4])
+				mounts.append((mount_point, fields[separator + 1], os.makedev(int(major), int(minor))))
+	except (IOError, OSError, ValueError, IndexError, AttributeError):
+		return []
+
+	mounts.sort(key=lambda mount: len(mount[0]), reverse=True)
+	return mounts
+
+
+def is_rotational(st_dev):
+	"""Returns True for spinning disks, False for SSDs, None if unknown"""
+
+	# Partitions don't have a queue folder, their disk does.
+	device_dir = os.path.realpath('/sys/dev/block/%d:%d' % (os.major(st_dev), os.minor(st_dev)))
+	for path in (device_dir, os.path.dirname(device_dir)):
+		try:
+			with io.open(os.path.join(path, 'queue', 'rotational'), 'r') as f:
+				return f.read().strip() == '1'
+		except (IOError, OSError):
+			continue
+	return None
+
+
+def normalize_mount_point(path):
+	# Keys of config.ini are lower case.
+	return os.path.normpath(path).lower()
+
+
+class DeviceLimits():
+
+	"""
+		Per device semaphores. Semaphores are created as devices are seen,
+		unless shared ones were given(see create_shared).
+	"""
+
+	current = None
+
+	def __init__(self, overrides=None, shared=None):
+
+		if overrides is None:
+			overrides = Config.device_limits
+
+		# Limits per device type and per mount point from [devices]
+		self.type_limits = dict(DEFAULT_LIMITS)
+		self.mount_limits = {}
+		for key, limit in overrides.items():
+			if key in DEFAULT_LIMITS:
+				self.type_limits[key] = limit
+			else:
+				self.mount_limits[normalize_mount_point(key)] = limit
+
+		self.mounts = None
+
+		# st_dev -> semaphore, None for no limit
+		self.semaphores = {}
+		self.shared = shared
+		self.lock = threading.Lock()
+
+	@staticmethod
+	def get_limits():
+		"""Returns DeviceLimits for this process"""
+
+		if DeviceLimits.current is None:
+			DeviceLimits.current = DeviceLimits()
+		return DeviceLimits.current
+
+	def get_mount(self, st_dev, path):
+
+		"""
+			Returns (mount_point, fs_type) for the device. When no mount has
+			st_dev(ex. btrfs subvolumes), the mount holding path is used.
+		"""
+
+		if self.mounts is None:
+			self.mounts = read_mounts()
+
+		for mount_point, fs_type, mount_dev in self.mounts:
+			if mount_dev == st_dev:
+				return mount_point, fs_type
+
+		for mount_point, fs_type, mount_dev in self.mounts:
+			if path == mount_point or path.startswith(mount_point.rstrip(os.sep) + os.sep):
+				return mount_point, fs_type
+
+		return None, None
+
+	def get_mount_dev(self, path):
+		"""Returns st_dev of the mount holding path, None if not known"""
+
+		if self.mounts is None:
+			self.mounts = read_mounts()
+
+		for mount_point, fs_type, mount_dev in self.mounts:
+			if path == mount_point or path.startswith(mount_point.rstrip(os.sep) + os.sep):
+				return mount_dev
+		return None
+
+	def get_device_type(self, st_dev, path):
+		"""Returns 'ssd', 'hdd', 'network' or 'unknown'"""
+
+		mount_point, fs_type = self.get_mount(st_dev, path)
+		if fs_type in NETWORK_FILESYSTEMS:
+			return 'network'
+
+		rotational = is_rotational(st_dev)
+		if rotational is None:
+			return 'unknown'
+		return 'hdd' if rotational else 'ssd'
+
+	def get_limit(self, st_dev, path):
+		"""Returns number of concurrent reads or saves allowed on the device"""
+
+		mount_point, fs_type = self.get_mount(st_dev, path)
+		if mount_point is not None:
+			limit = self.mount_limits.get(normalize_mount_point(mount_point))
+			if limit is not None:
+				return limit
+
+		return self.type_limits[self.get_device_type(st_dev, path)]
+
+	def get_semaphore(self, path):
+		"""Returns the semaphore for the device of path, None for no limit"""
+
+		try:
+			st_dev = os.stat(path).st_dev
+		except OSError:
+			# Let the caller log the error.
+			return None
+
+		with self.lock:
+			if st_dev in self.semaphores:
+				return self.semaphores[st_dev]
+
+			if self.shared is not None:
+				semaphore = self.shared.get(st_dev)
+				if semaphore is None:
+					# Devices without a mount of their own(ex. btrfs
+					# subvolumes) use the one of the mount holding the file.
+					semaphore = self.shared.get(self.get_mount_dev(os.path.realpath(path)))
+				self.semaphores[st_dev] = semaphore
+			else:
+				limit = self.get_limit(st_dev, os.path.abspath(path))
+				self.semaphores[st_dev] = threading.BoundedSemaphore(limit) if limit > 0 else None
+			return self.semaphores[st_dev]
+
+	@contextlib.contextmanager
+	def slot(self, path):
+		"""Waits until the device of path allows one more read or save"""
+
+		semaphore = self.get_semaphore(path)
+		if semaphore is None:
+			yield
+			return
+
+		with semaphore:
+			yield
+
+	def create_shared(self, workers, semaphore_factory):
+
+		"""
+			Returns st_dev -> semaphore for every mounted device, to be
+			shared with worker processes. Songs can be on any of them, ex.
+			reached through symlinks or listed in a manifest. Devices whose
+			limit is not below workers are left out, they are not limited
+			anyway. When mounts are not known(ex. not Linux) all songs share
+			the 'unknown' limit, under None.
+		"""
+
+		if self.mounts is None:
+			self.mounts = read_mounts()
+
+		if not self.mounts:
+			limit = self.type_limits['unknown']
+			return {None: semaphore_factory(limit)} if 0 < limit < workers else {}
+
+		shared = {}
+		for mount_point, fs_type, mount_dev in self.mounts:
+			if mount_dev in shared:
+				continue
+
+			limit = self.get_limit(mount_dev, mount_point)
+			if 0 < limit < workers:
+				shared[mount_dev] = semaphore_factory(limit)
+
+		return shared
+
+
+def init_worker(shared):
+	"""Initializer of metadata_pool worker processes"""
+
+	DeviceLimits.current = DeviceLimits(shared=shared)
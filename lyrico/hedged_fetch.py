@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+
+"""
+	Contains the HedgedLookup class which asks several lyrics sources for
+	a song at the same time, instead of one after another.
+
+	Sources are tried in the order of song.get_enabled_sources. A song found on
+	the fourth source first waits for three misses. With hedging:
+
+		- 'race_sources' - this many sources are asked at the same time.
+		  When one misses, the next source is asked.
+		- 'hedge_delay' - when no source answered within this many seconds,
+		  the next source is asked as well.
+
+	The lyrics of the highest priority source which found them(see
+	lyrics_helper.test_lyrics) are used, so the source is the same as when
+	asked one after another, only found sooner. Once they are known, the
+	sources not asked yet are not asked anymore. Requests already sent
+	can't be interrupted, their results are dropped.
+
+	Hedging trades extra requests for less time per song. The extra
+	requests are counted(see HedgeStats) and printed at the end of a run.
+	See benchmarks/bench_hedged_fetch.py for the trade off.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import time
+import threading
+
+try:
+	import queue
+except ImportError:
+	# python27
+	import Queue as queue
+
+from .config import Config
+from .source_stats import timed_download
+
+
+def hedging_enabled():
+	return Config.race_sources > 1 or Config.hedge_delay > 0
+
+
+class SourceLookup(object):
+
+	"""
+		Stands in for the song while one source is asked. Download functions
+		set lyrics, source and error here, so sources asked at the same time
+		don't overwrite each other.
+	"""
+
+	__slots__ = ('artist', 'title', 'lyrics', 'source', 'error', 'sent', 'done')
+
+	def __init__(self, song):
+		self.artist = song.artist
+		self.title = song.title
+
+		self.lyrics = None
+		self.source = None
+		self.error = None
+
+		# The request was sent, and the download function returned.
+		self.sent = False
+		self.done = False
+
+
+def run_lookup(setting, download, lookup):
+	"""Runs the download function of a source for lookup"""
+
+	try:
+		timed_download(setting, download, lookup)
+	except Exception as e:
+		# Counts as a miss, the other sources are still used.
+		lookup.error = str(e)
+	lookup.done = True
+
+
+class HedgeStats():
+
+	"""Requests sent by hedged lookups, for all songs of the run"""
+
+	# Sources asked
+	requests = 0
+
+	# Sources asked whose result was not needed, as a source before them
+	# found the lyrics.
+	dropped = 0
+
+	songs = 0
+	lock = threading.Lock()
+
+	@staticmethod
+	def add(requests, dropped):
+		with HedgeStats.lock:
+			HedgeStats.songs += 1
+			HedgeStats.requests += requests
+			HedgeStats.dropped += dropped
+
+	@staticmethod
+	def print_stats():
+		if not HedgeStats.songs:
+			return
+		print('Hedged lookups: %d requests for %d songs, %d not needed.' %
+			(HedgeStats.requests, HedgeStats.songs, HedgeStats.dropped))
+
+
+class HedgedLookup():
+
+	"""
+		Decides which sources to ask for song, and when. Drivers(hedged_fetch
+		with threads, AsyncFetchStage with asyncio) ask the sources and call
+		finish once result is decided.
+	"""
+
+	def __init__(self, song, sources):
+		self.song = song
+
+		# (setting, download function) of the enabled sources
+		self.sources = sources
+
+		# SourceLookup per source, None until asked
+		self.lookups = [None] * len(sources)
+		self.next_index = 0
+		self.last_asked = None
+
+	def result(self):
+
+		"""
+			Returns (decided, index). index is the highest priority source
+			which found the lyrics, or None if all of them missed. Not decided
+			while a source before it is still asked or not asked yet.
+		"""
+
+		for index, lookup in enumerate(self.lookups):
+			if lookup is None or not lookup.done:
+				return False, None
+			if lookup.lyrics:
+				return True, index
+		return True, None
+
+	def next_source(self, now):
+
+		"""
+			Returns (ask, wait). ask is True if the next source is to be asked
+			now. Otherwise wait is the number of seconds until it is, None to
+			wait for a source to answer.
+		"""
+
+		if self.next_index >= len(self.sources):
+			return False, None
+
+		asked = [lookup for lookup in self.lookups if lookup is not None]
+
+		# A later source found the lyrics. Only the ones before it are needed.
+		if any(lookup.lyrics for lookup in asked):
+			return False, None
+
+		in_flight = sum(1 for lookup in asked if not lookup.done)
+		if in_flight < max(1, Config.race_sources):
+			return True, None
+
+		if Config.hedge_delay > 0:
+			wait = self.last_asked + Config.hedge_delay - now
+			if wait <= 0:
+				return True, None
+			return False, wait
+
+		return False, None
+
+	def ask(self, now):
+		"""Returns (index, setting, download, lookup) for the next source"""
+
+		index = self.next_index
+		setting, download = self.sources[index]
+		lookup = SourceLookup(self.song)
+		self.lookups[index] = lookup
+
+		self.next_index += 1
+		self.last_asked = now
+		return index, setting, download, lookup
+
+	def finish(self, index):
+		"""Copies the result to the song and counts the requests"""
+
+		song = self.song
+		asked = [lookup for lookup in self.lookups if lookup is not None and lookup.sent]
+
+		if index is not None:
+			lookup = self.lookups[index]
+			song.lyrics = lookup.lyrics
+			song.source = lookup.source
+			song.error = None
+		elif asked:
+			# Like the last source tried one after another
+			song.error = asked[-1].error
+
+		dropped = 0
+		if index is not None:
+			dropped = sum(1 for lookup in self.lookups[index + 1:] if lookup is not None and lookup.sent)
+		HedgeStats.add(len(asked), dropped)
+
+
+def hedged_fetch(song, sources):
+	"""Downloads lyrics for song with hedged lookups, using a thread per source"""
+
+	hedged = HedgedLookup(song, sources)
+
+	# Signalled by the threads once a source answers
+	answered = queue.Queue()
+
+	def ask_source(setting, download, lookup):
+		run_lookup(setting, download, lookup)
+		answered.put(lookup)
+
+	while True:
+		decided, index = hedged.result()
+		if decided:
+			break
+
+		ask, wait = hedged.next_source(time.time())
+		if ask:
+			source_index, setting, download, lookup = hedged.ask(time.time())
+			lookup.sent = True
+
+			thread = threading.Thread(target=ask_source, args=(setting, download, lookup))
+			# Dropped lookups don't keep lyrico running.
+			thread.daemon = True
+			thread.start()
+			continue
+
+		try:
+			answered.get(timeout=wait)
+		except queue.Empty:
+			pass
+
+	hedged.finish(index)
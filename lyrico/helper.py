@@ -47,4 +47,31 @@ def sanitize_data(s):
 	# remove double white-spaces or tabs if any
 	s = re.sub(r'\s+', ' ', s)
 
-	return s
\ No newline at end of file
+	return s
+
+def get_mtime_ns(stat_result):
+	"""Returns modification time in nanoseconds from an os.stat result"""
+
+	# python27 does not have 'st_mtime_ns'
+	mtime_ns = getattr(stat_result, 'st_mtime_ns', None)
+	if mtime_ns is None:
+		mtime_ns = int(stat_result.st_mtime * 1000000000)
+	return mtime_ns
+
+
+def replace_file(src, dst):
+
+	"""
+		Moves src over dst. Used to save state files by writing them to
+		a temporary file first, so an interrupted run never leaves a half
+		written file behind.
+	"""
+
+	try:
+		# >3.3 replaces atomically on all platforms
+		os.replace(src, dst)
+	except AttributeError:
+		# python27 can't rename over an existing file on Windows
+		if os.path.exists(dst) and sys.platform == 'win32':
+			os.remove(dst)
+		os.rename(src, dst)
@@ -3,9 +3,16 @@
 """lyrico
 
 Usage:
-  lyrico [<source_dir>]
+  lyrico watch [--poll] [--scan-threads=<n>] [<source_dir>]
+  lyrico merge
+  lyrico prune-cache
+  lyrico plan [--incremental] [--scan-threads=<n>] [--read-order=<order>] [--metadata-workers=<n>] [--shard=<i/n>] [--output=<plan_file>] [<source_dir>]
+  lyrico execute [--jobs=<n>] [--max-memory=<size>] <plan_file>
+  lyrico [--incremental] [--scan-threads=<n>] [--read-order=<order>] [--metadata-workers=<n>] [--jobs=<n>] [--max-memory=<size>] [--shard=<i/n>] [<source_dir>]
+  lyrico --from-manifest=<file> [--jobs=<n>] [--max-memory=<size>] [--shard=<i/n>]
   lyrico (enable | disable) (<lyrico_action>)
   lyrico set (<dir_type>) (<full_path_to_dir>)
+  lyrico migrate (<lyrics_layout>)
   lyrico (-h | --help)
   lyrico --version
   lyrico --settings
@@ -14,6 +21,26 @@ Options:
   -h --help     Show this screen.
   --version     Show version.
   --settings    Show current settings.
+  --incremental  Only process audio files that are new, were modified or
+                 failed on the last run.
+  --poll        Poll "source_dir" for changes instead of using inotify.
+  --scan-threads=<n>  Number of threads listing folders when scanning
+                      "source_dir". Overrides "scan_threads" in settings.
+  --read-order=<order>  Order in which tags are read, "none", "inode" or
+                        "extent". Overrides "read_order" in settings.
+  --metadata-workers=<n>  Number of processes reading tags, 0 for one per
+                          CPU. Overrides "metadata_workers" in settings.
+  --jobs=<n>  Number of songs downloading lyrics at the same time.
+              Overrides "jobs" in settings.
+  --max-memory=<size>  Pause scanning, reading tags and downloading while
+                       lyrico uses more memory, ex. "512M" or "2G".
+                       Overrides "max_memory" in settings.
+  --shard=<i/n>  Only process the i-th of n equal parts of "source_dir".
+                 Use "lyrico merge" to combine logs of all the parts.
+  --from-manifest=<file>  Process the songs listed in a JSON lines file,
+                          or stdin when "-", instead of scanning "source_dir".
+  --output=<plan_file>  Where "lyrico plan" writes the plan. Defaults to
+                        "plan.jsonl" in "lyrics_dir".
 """
 
 from __future__ import print_function
@@ -24,13 +51,79 @@ import platform
 from .docopt import docopt
 
 from .song import Song
-from .song_helper import get_song_list
+from .scanner import LibraryScanner
 from .config import Config
+from .scan_manifest import ScanManifest
+from .lyrics_catalog import LyricsCatalog
+from .watcher import watch_source_dir
+from .lyrics_layout import LYRICS_LAYOUTS, migrate_lyrics_dir
+from .song_helper import read_manifest_records, get_manifest_song_data
+from .shards import parse_shard, filter_shard, get_shard_index, get_shard_suffix, save_shard_results, merge_shard_logs
+from .read_order import READ_ORDERS, sort_by_physical_order, ReadAhead
+from .pipeline import SongPipeline
+from .streaming_log import StreamingLog
+from .memory_governor import MemoryGovernor
+from .plan import get_plan_path, write_plan, print_plan, execute_plan
+from .metadata_cache import MetadataCache, prune_metadata_cache
+from .hedged_fetch import HedgeStats
+from .source_stats import SourceStats, is_valid_source_order
 
 # testpypi 0.6.0
 __version__ = "0.6.0"
 
 
+def read_manifest_songs(records):
+	"""Generator which yields Song objects for manifest records"""
+
+	try:
+		for record in records:
+			yield Song(record['path'], get_manifest_song_data(record))
+	except IOError as e:
+		print('Unable to read manifest.')
+		print(e)
+
+
+def scan_source_dir(args, shard):
+
+	"""
+		Returns (manifest, scanner, song_paths, read_ahead) where song_paths
+		is a generator of the audio files in 'source_dir' to process.
+		read_ahead is a ReadAhead for song_paths, or None.
+	"""
+
+	manifest = ScanManifest.load(shard=shard)
+	scanner = LibraryScanner(threads=Config.scan_threads, ordered=Config.scan_ordered)
+	song_paths = scanner.walk(Config.source_dir)
+
+	if shard:
+		# Only keep the songs of this shard.
+		song_paths = filter_shard(song_paths, Config.source_dir, shard)
+
+	song_paths = manifest.filter_pending(song_paths, args['--incremental'])
+
+	read_ahead = None
+	if Config.read_order != 'none':
+		# Read tags in the order the files are placed on disk.
+		song_paths = sort_by_physical_order(song_paths, Config.read_order)
+		read_ahead = ReadAhead(song_paths, Config.readahead_files)
+
+	return manifest, scanner, song_paths, read_ahead
+
+
+def print_scan_results(args, manifest, scanner):
+	"""Prints counters of the scan once all songs were read"""
+
+	cache = MetadataCache.get_cache()
+	if cache:
+		cache.close()
+		if cache.hits:
+			print(cache.hits, 'songs read from metadata cache.')
+	if scanner and scanner.aliases_collapsed:
+		print(scanner.aliases_collapsed, 'duplicate paths(hardlinks or symlinks) to the same songs skipped.')
+	if manifest and args['--incremental']:
+		print(manifest.unchanged_count, 'unchanged songs skipped.')
+
+
 def main():
 
 	# Fix console for windows users
@@ -56,6 +149,21 @@ def main():
 		Config.show_settings()
 		return
 
+	if args['migrate']:
+		# Move lyrics files in 'lyrics_dir' to another layout
+		migrate_lyrics_dir(args['<lyrics_layout>'])
+		return
+
+	if args['prune-cache']:
+		# Drop metadata cached for deleted or modified songs
+		prune_metadata_cache()
+		return
+
+	if args['merge']:
+		# Combine the logs written by 'lyrico --shard' runs
+		merge_shard_logs(Song.write_log)
+		return
+
 	if args['disable'] or args['enable'] or args['set']:
 		# User is updating config
 
@@ -102,28 +210,150 @@ def main():
 
 			# update class variable so that new setting is reflected across modules.
 			Config.source_dir = args['<source_dir>']
+
+		if args['--scan-threads']:
+			try:
+				Config.scan_threads = int(args['--scan-threads'])
+			except ValueError:
+				print('"--scan-threads" must be a number. You gave:', args['--scan-threads'])
+				return
+
+		if args['--read-order']:
+			Config.read_order = args['--read-order']
+
+		if args['--metadata-workers']:
+			try:
+				Config.metadata_workers = int(args['--metadata-workers'])
+			except ValueError:
+				print('"--metadata-workers" must be a number. You gave:', args['--metadata-workers'])
+				return
+
+		if args['--jobs']:
+			try:
+				Config.jobs = int(args['--jobs'])
+			except ValueError:
+				print('"--jobs" must be a number. You gave:', args['--jobs'])
+				return
+
+		if args['--max-memory']:
+			Config.max_memory = args['--max-memory']
+
+		try:
+			governor = MemoryGovernor.create(Config.max_memory)
+		except ValueError:
+			print('Invalid "max_memory":', Config.max_memory)
+			print('Use a size in bytes or with a unit, ex. "512M" or "2G".')
+			return
+
+		shard = None
+		if args['--shard']:
+			try:
+				shard = parse_shard(args['--shard'])
+			except ValueError:
+				print('Invalid "--shard":', args['--shard'])
+				print('Use "i/n" to process the i-th of n parts, ex. "--shard=3/8".')
+				return
+
+		if Config.lyrics_layout not in LYRICS_LAYOUTS:
+			print('Invalid "lyrics_layout":', Config.lyrics_layout)
+			print('Use "lyrico migrate" with "flat", "letter" or "hash" to set it.')
+			return
+
+		if Config.read_order not in READ_ORDERS:
+			print('Invalid "read_order":', Config.read_order)
+			print('Only "none", "inode" and "extent" are valid orders.')
+			return
+
+		if not is_valid_source_order(Config.source_order):
+			print('Invalid "source_order":', Config.source_order)
+			print('Use "adaptive", "fixed" or a comma separated list of sources, ex. "musix_match, az_lyrics".')
+			return
+
+		if args['watch']:
+			# Keep running and download lyrics for songs as they are added.
+			watch_source_dir(Config.source_dir, args['--poll'])
+			return
 				
-		song_list = [Song(song_path) for song_path in get_song_list(Config.source_dir)]
-		print(len(song_list), 'songs detected.')
-		print('Metadata extracted for', (str(Song.valid_metadata_count) + '/' + str(len(song_list))), 'songs.')
-		for song in song_list:
-			# Only download lyrics if 'title' and 'artist' is present
-			# Error str is already present in song.error
-			if song.artist and song.title:
-				song.download_lyrics()
-
-			# Show immidiate log in console
-			else:
-				# If title was present, use that
-				if song.title:
-					print(song.title, 'was ignored.', song.error)
-				# else use audio file path
-				else:
-					print(song.path, 'was ignored.', song.error)
+		if args['execute']:
+			# Run a plan written by 'lyrico plan', without scanning.
+			if execute_plan(args['<plan_file>'], governor):
+				print('FINISHED')
+			return
+
+		# Songs are scanned, read, downloaded and saved concurrently. See
+		# pipeline module.
+		pipeline = SongPipeline(governor=governor)
+
+		# The manifest is updated on every run, so that the next '--incremental'
+		# run can skip the songs which have not changed since.
+		if args['--from-manifest']:
+			# Songs and their metadata come from the manifest. 'source_dir'
+			# is not scanned.
+			manifest = None
+			scanner = None
+			records = read_manifest_records(args['--from-manifest'])
+
+			if shard:
+				# Split like a '--shard' scan of the record's 'source_dir'.
+				records = (record for record in records
+					if get_shard_index(record['path'], record.get('source_dir') or Config.source_dir,
+						shard[1]) == shard[0])
+
+			songs = read_manifest_songs(records)
+		else:
+			manifest, scanner, song_paths, read_ahead = scan_source_dir(args, shard)
+			songs = pipeline.read_songs(song_paths, read_ahead)
+
+		if args['plan']:
+			# Only decide what a run would do. No lyrics are downloaded.
+			plan_path = args['--output'] or get_plan_path(shard)
+			try:
+				header = write_plan(songs, plan_path, shard, manifest)
+			except (IOError, OSError) as e:
+				print('Unable to write plan.')
+				print(e)
+				return
+			print_scan_results(args, manifest, scanner)
+			print_plan(header)
+			print('\nPlan saved to', plan_path)
+			print('Run "lyrico execute" with it to download lyrics.')
+			return
+
+		# Songs are logged and dropped as they finish, instead of being kept
+		# until the end of the run.
+		log = StreamingLog(shard)
+		for song in pipeline.run(songs):
+			if manifest:
+				manifest.record(song)
+			log.add(song)
+
+			if governor and governor.under_pressure:
+				# Producers are waiting for memory. Push out what finished
+				# songs left behind.
+				log.flush()
+				cache = MetadataCache.get_cache()
+				if cache:
+					cache.flush()
+				governor.relieve()
+
+		print_scan_results(args, manifest, scanner)
+		if governor and governor.pauses:
+			print('Paused', governor.pauses, 'times to stay under "max_memory".')
+		HedgeStats.print_stats()
+		SourceStats.get_stats().print_stats()
+
+		# Songs are downloaded as they are read, so these are only known
+		# once all of them went through, not right after the scan.
+		print('\n' + str(log.count), 'songs detected.')
+		print('Metadata extracted for', (str(Song.valid_metadata_count) + '/' + str(log.count)), 'songs.')
 
+		if manifest:
+			manifest.save()
+		LyricsCatalog.get_catalog().save()
+		SourceStats.get_stats().save()
 
 		print('\nBuilding log...')
-		Song.log_results(song_list)
+		log.close()
 		print('FINISHED')
 		
 		# Disable windows unicode console anyways
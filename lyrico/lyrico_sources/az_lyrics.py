@@ -23,18 +23,18 @@ from __future__ import unicode_literals
 
 import re
 import sys
-import requests
 
 from requests import ConnectionError, HTTPError, Timeout
 from bs4 import BeautifulSoup
 
-from .build_requests import get_lyrico_headers
+from .build_requests import get_session
+from .rate_limits import ThrottledError, THROTTLED_ERROR
 from .lyrics_helper import test_lyrics
 
 
-# Defining 'request_headers' outside donwload function makes a single profile
-# per lyrico operation and not a new profile per each download in an operation.
-request_headers = get_lyrico_headers()
+# Requests go through a session shared by all downloads from this source. It
+# keeps a single profile per lyrico operation and reuses connections across songs.
+session_name = 'az_lyrics'
 
 # Holds corerction for Artist names
 # key(artist name built from our song metadata): value(corresponding value used by AZLyrics)
@@ -92,7 +92,7 @@ def donwload_from_az_lyrics(song):
 	try:
 		print('\tTrying AZLyrics:', azlyrics_url)
 
-		res = requests.get(azlyrics_url, headers = request_headers)
+		res = get_session(session_name).get(azlyrics_url)
 		res.raise_for_status()
 		# 'requests' was guessing the encoding from azlyrics as ISO-8859-1.
 		# AZLyrics sends 'UTF-8' in its meta tag
@@ -104,6 +104,9 @@ def donwload_from_az_lyrics(song):
 	except (ConnectionError, Timeout) as e:
 		print(e)
 		error = 'No network connectivity.'
+	# 429 or 503, the lyrics may well be there
+	except ThrottledError:
+		error = THROTTLED_ERROR
 	except HTTPError:
 		# Already carrying error string
 		pass
@@ -4,6 +4,13 @@ from __future__ import unicode_literals
 
 import copy
 import random
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from ..config import Config
+from .rate_limits import RateLimitedSession
 
 
 user_agents = [
@@ -61,6 +68,76 @@ def get_lyrico_headers(site_name=None):
 	headers_copy['User-Agent'] = user_agents[random.randint(0, (len(user_agents) - 1))]
 	return headers_copy
 
+# Base URL of each source. Used to open connections ahead with prewarm_sessions.
+SOURCE_URLS = {
+	'lyric_wikia': 'http://lyrics.wikia.com/',
+	'lyrics_n_music': 'http://api.lyricsnmusic.com/',
+	'musix_match': 'https://www.musixmatch.com/',
+	'lyricsmode': 'http://www.lyricsmode.com/',
+	'az_lyrics': 'http://www.azlyrics.com/',
+}
+
+# Seconds to wait for a source when prewarming its connection
+PREWARM_TIMEOUT = 10
+
+# source name -> requests.Session
+sessions = {}
+sessions_lock = threading.Lock()
+
+def get_session(source_name):
+
+	"""
+		Returns the requests.Session used for all requests to the source.
+		Connections are kept alive and reused across songs, so only the first
+		request to a host pays for the TCP(and TLS) handshake.
+
+		The session carries the lyrico headers, so each source sees a single
+		profile per lyrico operation.
+	"""
+
+	with sessions_lock:
+		session = sessions.get(source_name)
+		if session is None:
+			session = RateLimitedSession(source_name)
+			session.headers.update(get_lyrico_headers())
+
+			# Keep a connection per fetch thread, or per connection allowed to
+			# the host with "jobs".
+			pool_size = max(Config.http_pool_size, Config.fetch_workers, Config.host_connections, 1)
+			adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+			session.mount('http://', adapter)
+			session.mount('https://', adapter)
+
+			sessions[source_name] = session
+		return session
+
+def prewarm_session(source_name):
+	try:
+		get_session(source_name).head(SOURCE_URLS[source_name], timeout=PREWARM_TIMEOUT)
+	except requests.RequestException:
+		# The source reports the error for the first song.
+		pass
+
+def prewarm_sessions():
+
+	"""
+		Opens a connection to each of the enabled sources in the background,
+		so the handshakes are done while 'source_dir' is scanned.
+	"""
+
+	for source_name in SOURCE_URLS:
+		if not getattr(Config, source_name):
+			continue
+		thread = threading.Thread(target=prewarm_session, args=(source_name,))
+		thread.daemon = True
+		thread.start()
+
+def close_sessions():
+	with sessions_lock:
+		for session in sessions.values():
+			session.close()
+		sessions.clear()
+
 def get_lnm_api_key():
 	return lnm_api_keys[random.randint( 0, (len(lnm_api_keys) - 1))]
 
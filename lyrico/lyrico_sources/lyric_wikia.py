@@ -14,7 +14,6 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import sys
-import requests
 
 try:
 	from urllib.parse  import quote
@@ -25,13 +24,14 @@ except ImportError:
 from requests import ConnectionError, HTTPError, Timeout
 from bs4 import BeautifulSoup
 
-from .build_requests import get_lyrico_headers
+from .build_requests import get_session
+from .rate_limits import ThrottledError, THROTTLED_ERROR
 from .lyrics_helper import test_lyrics
 
 
-# Defining 'request_headers' outside donwload function makes a single profile
-# per lyrico operation and not a new profile per each download in an operation.
-request_headers = get_lyrico_headers()
+# Requests go through a session shared by all downloads from this source. It
+# keeps a single profile per lyrico operation and reuses connections across songs.
+session_name = 'lyric_wikia'
 
 
 def donwload_from_lyric_wikia(song):
@@ -77,12 +77,15 @@ def donwload_from_lyric_wikia(song):
 	try:
 		print('\tTrying Lyric Wikia:', lyrics_wikia_url)
 
-		res = requests.get(lyrics_wikia_url, headers = request_headers)
+		res = get_session(session_name).get(lyrics_wikia_url)
 		res.raise_for_status()
 		
 	# Catch network errors
 	except (ConnectionError, Timeout):
 		song.error = 'No network connectivity.'
+	# 429 or 503, the lyrics may well be there
+	except ThrottledError:
+		song.error = THROTTLED_ERROR
 	except HTTPError:
 		song.error = 'Lyrics not found. Check artist or title name.'
 	
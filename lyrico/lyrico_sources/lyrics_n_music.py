@@ -17,20 +17,20 @@ from __future__ import unicode_literals
 
 import re
 import json
-import requests
 
 from requests import ConnectionError, HTTPError, Timeout
 from bs4 import BeautifulSoup
 
-from .build_requests import get_lyrico_headers, get_lnm_api_key
+from .build_requests import get_session, get_lnm_api_key
+from .rate_limits import ThrottledError, THROTTLED_ERROR
 from .lyrics_helper import test_lyrics
 
 
 base_lnm_url = 'http://api.lyricsnmusic.com/songs'
 
-# Defining these outside donwload_from_lnm function makes
-# random visitor per lyrico operation and not per each download in an operation
-request_headers = get_lyrico_headers()
+# Requests go through a session shared by all downloads from this source. It
+# keeps a single profile per lyrico operation and reuses connections across songs.
+session_name = 'lyrics_n_music'
 api_key = get_lnm_api_key()
 
 
@@ -55,14 +55,15 @@ def donwload_from_lnm(song):
 	}
 
 
-	# Add additional content type header for the JSON request
-	request_headers['Content-type'] = 'application/json'
+	# Add additional content type header for the JSON request. It is only
+	# sent with this request, the session headers are shared.
+	json_headers = {'Content-type': 'application/json'}
 
 	try:
 		print('\tTrying LYRICSnMUSIC...')
 		# On unable to find data, this request returns and empty list(JSON string)
 		# but with 200 success code
-		r_json = requests.get(base_lnm_url, params=data, headers = request_headers)
+		r_json = get_session(session_name).get(base_lnm_url, params=data, headers = json_headers)
 		# Raise HTTPError for bad requests
 		r_json.raise_for_status()
 
@@ -80,16 +81,16 @@ def donwload_from_lnm(song):
 			song.error = 'Lyrics not found. Check artist or title name and retry.'
 			return
 
-		# remove the JSON content type header, since we are making the usual request
-		del request_headers['Content-type']
-
 		# make the second request for lyrics HTML page
-		r_html = requests.get(lyrics_url, headers = request_headers)
+		r_html = get_session(session_name).get(lyrics_url)
 		r_html.raise_for_status()
 
 	# Catch network errors
 	except (ConnectionError, Timeout):
 		song.error = 'No network connectivity.'
+	# 429 or 503, the lyrics may well be there
+	except ThrottledError:
+		song.error = THROTTLED_ERROR
 	except HTTPError:
 		song.error = 'Bad request. Lyrics not found. Check artist or title name.'
 	
@@ -18,7 +18,6 @@ from __future__ import unicode_literals
 
 import re
 import string
-import requests
 
 try:
 	from string  import ascii_lowercase as LOWERCASE_CHARS
@@ -29,13 +28,14 @@ except ImportError:
 from requests import ConnectionError, HTTPError, Timeout
 from bs4 import BeautifulSoup
 
-from .build_requests import get_lyrico_headers
+from .build_requests import get_session
+from .rate_limits import ThrottledError, THROTTLED_ERROR
 from .lyrics_helper import remove_accents, test_lyrics
 
 
-# Defining 'request_headers' outside donwload function makes a single profile
-# per lyrico operation and not a new profile per each download in an operation.
-request_headers = get_lyrico_headers()
+# Requests go through a session shared by all downloads from this source. It
+# keeps a single profile per lyrico operation and reuses connections across songs.
+session_name = 'lyricsmode'
 
 # This correction mapping only is valid for top approx 3000 artists which LYRICSMODE
 # displays as lists.
@@ -84,12 +84,15 @@ def donwload_from_lyricsmode(song=None):
 	try:
 		print('\tTrying LYRICSMODE:', lyricsmode_url)
 
-		res = requests.get(lyricsmode_url, headers = request_headers)
+		res = get_session(session_name).get(lyricsmode_url)
 		res.raise_for_status()
 		
 	# Catch network errors
 	except (ConnectionError, Timeout):
 		song.error = 'No network connectivity.'
+	# 429 or 503, the lyrics may well be there
+	except ThrottledError:
+		song.error = THROTTLED_ERROR
 	except HTTPError as e:
 		song.error = 'Lyrics not found. Check artist or title name.'
 	
@@ -16,7 +16,6 @@ from __future__ import unicode_literals
 
 import re
 import sys
-import requests
 
 try:
 	from urllib.parse  import quote
@@ -27,12 +26,13 @@ except ImportError:
 from requests import ConnectionError, HTTPError, Timeout
 from bs4 import BeautifulSoup
 
-from .build_requests import get_lyrico_headers
+from .build_requests import get_session
+from .rate_limits import ThrottledError, THROTTLED_ERROR
 from .lyrics_helper import test_lyrics
 
-# Defining 'request_headers' outside donwload function makes a single profile
-# per lyrico operation and not a new profile per each download in an operation.
-request_headers = get_lyrico_headers()
+# Requests go through a session shared by all downloads from this source. It
+# keeps a single profile per lyrico operation and reuses connections across songs.
+session_name = 'musix_match'
 
 
 def donwload_from_musix_match(song):
@@ -73,12 +73,15 @@ def donwload_from_musix_match(song):
 	try:
 		print('\tTrying musixmatch:', mxm_url)
 
-		res = requests.get(mxm_url, headers = request_headers)
+		res = get_session(session_name).get(mxm_url)
 		res.raise_for_status()
 
 	# Catch network errors
 	except (ConnectionError, Timeout) as e:
 		song.error = 'No network connectivity.'
+	# 429 or 503, the lyrics may well be there
+	except ThrottledError:
+		song.error = THROTTLED_ERROR
 	except HTTPError as e:
 		song.error = 'Lyrics not found. Check artist or title name.'
 	
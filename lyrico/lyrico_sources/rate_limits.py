@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+
+"""
+	Contains the RateLimitedSession class used by build_requests.get_session,
+	so every request of the lyrics sources goes through it.
+
+	Requests to each host take a token from the host's TokenBucket first.
+	Rates are set in the optional [rate_limits] section of config.ini, in
+	requests per second, by host name, source or for all hosts:
+
+		[rate_limits]
+		www.azlyrics.com = 0.5
+		musix_match = 2
+		default = 5
+
+	Hosts without a rate are not limited. A host answering 429(Too Many
+	Requests) or 503(Service Unavailable) is throttling us. The request is
+	retried after the 'Retry-After' the host sent, or else after an
+	exponential backoff with jitter, up to "max_retries" times. All requests
+	to the host wait meanwhile. When the host stays throttled,
+	ThrottledError is raised. Sources report it as THROTTLED_ERROR instead
+	of 'Lyrics not found', so the song is retried on the next run.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import time
+import random
+import threading
+from email.utils import parsedate_tz, mktime_tz
+
+try:
+	from urllib.parse import urlparse
+except ImportError:
+	# Python27
+	from urlparse import urlparse
+
+import requests
+
+from ..config import Config
+
+
+THROTTLE_STATUS_CODES = (429, 503)
+
+THROTTLED_ERROR = 'Too many requests. The source is rate limiting lyrico, retry later.'
+
+# time.monotonic is not affected by changes of the system clock.
+now = getattr(time, 'monotonic', time.time)
+
+
+class ThrottledError(requests.RequestException):
+	"""Raised when a host keeps answering 429 or 503. Not a 404 miss."""
+	pass
+
+
+# ThrottledErrors raised in each thread. Lets callers of a source tell if
+# it was throttled, see source_stats.timed_download.
+throttled = threading.local()
+
+def get_throttled_count():
+	return getattr(throttled, 'count', 0)
+
+def throttled_error(message, response=None):
+	"""Returns a ThrottledError to raise, and counts it"""
+
+	throttled.count = get_throttled_count() + 1
+	return ThrottledError(message, response=response)
+
+
+def get_retry_after(response):
+	"""Returns seconds from the 'Retry-After' header of response, None if missing"""
+
+	value = response.headers.get('Retry-After')
+	if not value:
+		return None
+
+	value = value.strip()
+	if value.isdigit():
+		return float(value)
+
+	# An HTTP date
+	date = parsedate_tz(value)
+	if date is None:
+		return None
+	return max(0.0, mktime_tz(date) - time.time())
+
+
+def get_backoff(attempt):
+	"""Returns seconds to wait before retry number attempt(from 0), with full jitter"""
+
+	return random.uniform(0, Config.retry_backoff * (2 ** attempt))
+
+
+class TokenBucket():
+
+	"""
+		Allows rate requests per second to a host, in bursts of up to burst
+		requests. rate None for no limit. Also holds back all requests to the
+		host while it is throttling us(see pause).
+	"""
+
+	def __init__(self, rate=None, burst=None):
+		self.rate = rate if rate and rate > 0 else None
+		self.burst = burst or max(1.0, rate or 1.0)
+
+		self.tokens = self.burst
+		self.updated = now()
+
+		# Requests wait until then, set from 'Retry-After' or backoff
+		self.blocked_until = 0.0
+
+		self.lock = threading.Lock()
+
+	def acquire(self, host):
+
+		"""
+			Waits for a token. Raises ThrottledError if the host asked to
+			wait for longer than "max_retry_wait".
+		"""
+
+		while True:
+			with self.lock:
+				current = now()
+				wait = self.blocked_until - current
+				if wait > Config.max_retry_wait:
+					raise throttled_error('%s asked to wait %d seconds.' % (host, wait))
+
+				if wait <= 0:
+					if self.rate is None:
+						return
+
+					self.tokens = min(self.burst, self.tokens + (current - self.updated) * self.rate)
+					self.updated = current
+					if self.tokens >= 1:
+						self.tokens -= 1
+						return
+					wait = (1 - self.tokens) / self.rate
+
+			time.sleep(wait)
+
+	def pause(self, seconds):
+		"""Holds back requests to the host for seconds"""
+
+		with self.lock:
+			self.blocked_until = max(self.blocked_until, now() + seconds)
+
+
+# host -> TokenBucket
+buckets = {}
+buckets_lock = threading.Lock()
+
+def get_bucket(host, source_name=None):
+	with buckets_lock:
+		bucket = buckets.get(host)
+		if bucket is None:
+			rate = None
+			for key in (host, source_name, 'default'):
+				if key in Config.rate_limits:
+					rate = Config.rate_limits[key]
+					break
+			bucket = TokenBucket(rate)
+			buckets[host] = bucket
+		return bucket
+
+
+class RateLimitedSession(requests.Session):
+
+	"""
+		requests.Session which waits for the TokenBucket of the host before
+		each request and retries requests the host throttled.
+	"""
+
+	def __init__(self, source_name=None):
+		requests.Session.__init__(self)
+		self.source_name = source_name
+
+	def request(self, method, url, *args, **kwargs):
+		host = urlparse(url).hostname
+		bucket = get_bucket(host, self.source_name)
+
+		attempt = 0
+		while True:
+			bucket.acquire(host)
+			res = requests.Session.request(self, method, url, *args, **kwargs)
+			if res.status_code not in THROTTLE_STATUS_CODES:
+				return res
+
+			retry_after = get_retry_after(res)
+			wait = retry_after if retry_after is not None else get_backoff(attempt)
+			res.close()
+
+			# Other requests to the host wait as well.
+			bucket.pause(wait)
+
+			if attempt >= Config.max_retries or wait > Config.max_retry_wait:
+				raise throttled_error('%s answered %d.' % (host, res.status_code), res)
+			attempt += 1
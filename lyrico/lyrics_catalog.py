@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+
+"""
+	Contains the LyricsCatalog class which keeps track of lyrics files
+	present in 'lyrics_dir'.
+
+	The catalog is a set of paths, so checking if a song's lyrics file exists
+	does not depend on the number of lyrics files. It is saved in the lyrico
+	state folder along with the mtime of each folder in 'lyrics_dir'. On the
+	next run only the folders whose mtime changed are read again.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import io
+import json
+
+try:
+	# >3.5
+	from os import scandir
+except ImportError:
+	# python27 uses the 'scandir' backport
+	from scandir import scandir
+
+from .config import Config
+from .helper import get_mtime_ns, replace_file
+
+
+class LyricsCatalog():
+
+	"""
+		Set backed catalog of the '.txt' files in 'lyrics_dir' and its inner
+		folders. The folders are only read on first lookup, so runs which don't
+		need it(ex. changing settings) never pay for it.
+	"""
+
+	catalog_file_name = 'lyrics_catalog.json'
+	catalog_version = 1
+
+	# Catalog for Config.lyrics_dir used by the current run. See get_catalog.
+	current = None
+
+	def __init__(self, lyrics_dir, state_path=None):
+
+		self.lyrics_dir = lyrics_dir
+		self.state_path = state_path
+
+		# Absolute paths of all lyrics files
+		self.files = None
+
+		# Relative folder path -> [mtime_ns, [lyrics file names], [inner folder names]]
+		self.dirs = {}
+
+		# Set when files were added since the catalog was loaded.
+		self.modified = False
+
+	@staticmethod
+	def get_catalog():
+
+		"""
+			Returns the LyricsCatalog for Config.lyrics_dir, creating it the
+			first time it is needed.
+		"""
+
+		catalog = LyricsCatalog.current
+		if catalog is None or catalog.lyrics_dir != Config.lyrics_dir:
+			try:
+				state_path = Config.get_state_path(LyricsCatalog.catalog_file_name)
+			except OSError:
+				# 'lyrics_dir' does not exist. Nothing to catalog or persist.
+				state_path = None
+			catalog = LyricsCatalog(Config.lyrics_dir, state_path)
+			LyricsCatalog.current = catalog
+		return catalog
+
+	def contains(self, path):
+		"""Returns True if lyrics file at path is present in 'lyrics_dir'"""
+
+		if self.files is None:
+			self.load()
+		return path in self.files
+
+	def add(self, path):
+		"""Called after lyrics file at path is saved"""
+
+		if self.files is None:
+			self.load()
+		if path not in self.files:
+			self.files.add(path)
+			self.modified = True
+
+	def load(self):
+
+		"""
+			Loads the saved catalog and reads again only the folders which
+			changed since it was saved.
+		"""
+
+		saved_dirs = {}
+		if self.state_path:
+			try:
+				with io.open(self.state_path, 'r', encoding='utf-8') as f:
+					saved = json.load(f)
+				if (saved.get('version') == LyricsCatalog.catalog_version and
+					saved.get('lyrics_dir') == self.lyrics_dir):
+					saved_dirs = saved.get('dirs', {})
+			except (IOError, ValueError):
+				pass
+
+		self.files = set()
+		self.dirs = {}
+		self.modified = False
+
+		# Rebuild the catalog starting at the root folder. Folders whose mtime
+		# is unchanged are taken from saved_dirs, including their inner
+		# folders, since adding or removing entries changes the mtime.
+		pending_dirs = ['']
+		while pending_dirs:
+			rel_dir = pending_dirs.pop()
+			dir_path = os.path.join(self.lyrics_dir, rel_dir) if rel_dir else self.lyrics_dir
+
+			entry = self.get_dir_entry(rel_dir, dir_path, saved_dirs.get(rel_dir))
+			if entry is None:
+				continue
+
+			self.dirs[rel_dir] = entry
+			for name in entry[1]:
+				self.files.add(os.path.join(dir_path, name))
+			for name in entry[2]:
+				pending_dirs.append(os.path.join(rel_dir, name) if rel_dir else name)
+
+	def get_dir_entry(self, rel_dir, dir_path, saved_entry):
+
+		"""
+			Returns [mtime_ns, lyrics file names, inner folder names] for folder
+			at dir_path. Folder is only read if saved_entry is outdated.
+		"""
+
+		try:
+			# stat before reading the folder, so that files added while reading
+			# change the mtime and get picked up on the next run.
+			mtime_ns = get_mtime_ns(os.stat(dir_path))
+		except OSError:
+			return None
+
+		if saved_entry and saved_entry[0] == mtime_ns:
+			return saved_entry
+
+		file_names = []
+		dir_names = []
+		try:
+			entries = scandir(dir_path)
+		except OSError:
+			return None
+
+		try:
+			for entry in entries:
+				# Skip hidden files and folders like lyrico's own state folder
+				if entry.name.startswith('.'):
+					continue
+				try:
+					if entry.is_dir(follow_symlinks=False):
+						dir_names.append(entry.name)
+					elif entry.name.endswith('.txt'):
+						file_names.append(entry.name)
+				except OSError:
+					continue
+		finally:
+			close = getattr(entries, 'close', None)
+			if close:
+				close()
+
+		self.modified = True
+		return [mtime_ns, file_names, dir_names]
+
+	def save(self):
+
+		"""
+			Saves the catalog. Folders changed during this run are read once
+			more, so files added by anything else than lyrico are not missed.
+		"""
+
+		if self.files is None or not self.state_path:
+			return
+
+		for rel_dir in list(self.dirs):
+			dir_path = os.path.join(self.lyrics_dir, rel_dir) if rel_dir else self.lyrics_dir
+			entry = self.get_dir_entry(rel_dir, dir_path, self.dirs[rel_dir])
+			if entry is None:
+				del self.dirs[rel_dir]
+			else:
+				self.dirs[rel_dir] = entry
+
+		if not self.modified:
+			return
+
+		data = {
+			'version': LyricsCatalog.catalog_version,
+			'lyrics_dir': self.lyrics_dir,
+			'dirs': self.dirs,
+		}
+
+		temp_path = '%s.%d.tmp' % (self.state_path, os.getpid())
+		try:
+			with io.open(temp_path, 'w', encoding='utf-8') as f:
+				f.write(json.dumps(data, ensure_ascii=False))
+			replace_file(temp_path, self.state_path)
+			self.modified = False
+		except (IOError, OSError) as e:
+			print('Unable to save lyrics catalog.')
+			print(e)
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+"""
+	Contains the layouts used to place lyrics files inside 'lyrics_dir'.
+
+	- 'flat': all files directly in 'lyrics_dir'. This is the default.
+	- 'letter': files are put in a folder named after the first letter of the
+	  artist, ex. 'lyrics_dir/m/Metallica - One.txt'
+	- 'hash': files are put in one of 256 folders named after the first two
+	  hex digits of the md5 of the file name, ex. 'lyrics_dir/3f/Metallica - One.txt'
+
+	Large flat folders(100k+ files) slow down file creation and lookups on
+	most filesystems. The layout only depends on the file name, so any
+	existing 'lyrics_dir' can be migrated between layouts.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import hashlib
+
+from .config import Config
+
+
+LYRICS_LAYOUTS = ('flat', 'letter', 'hash')
+
+
+def get_shard(file_name, layout):
+
+	"""
+		Returns name of the folder for lyrics file named file_name or None
+		for the 'flat' layout.
+	"""
+
+	if layout == 'letter':
+		first_char = file_name[0].lower()
+		if first_char.isdigit():
+			return '0-9'
+		if first_char.isalpha():
+			return first_char
+		return '_'
+
+	if layout == 'hash':
+		return hashlib.md5(file_name.lower().encode('utf-8')).hexdigest()[:2]
+
+	return None
+
+
+def get_lyrics_file_path(file_name, layout=None, lyrics_dir=None):
+	"""Returns path to lyrics file named file_name as per the layout"""
+
+	if layout is None:
+		layout = Config.lyrics_layout
+	if lyrics_dir is None:
+		lyrics_dir = Config.lyrics_dir
+
+	shard = get_shard(file_name, layout)
+	if shard:
+		return os.path.join(lyrics_dir, shard, file_name)
+	return os.path.join(lyrics_dir, file_name)
+
+
+def is_lyrics_file(file_name):
+	"""Lyrics files are named '<artist> - <title>.txt'. This skips logs etc."""
+	return file_name.endswith('.txt') and ' - ' in file_name
+
+
+def find_lyrics_files(lyrics_dir, layout):
+
+	"""
+		Returns paths to lyrics files directly in lyrics_dir and in the
+		folders of layout. Files in other folders, ex. the user's own, are
+		not lyrico's to move.
+	"""
+
+	lyrics_files = []
+	for name in os.listdir(lyrics_dir):
+		path = os.path.join(lyrics_dir, name)
+		if name.startswith('.'):
+			continue
+		if os.path.isdir(path):
+			for inner_name in os.listdir(path):
+				if is_lyrics_file(inner_name) and get_shard(inner_name, layout) == name:
+					lyrics_files.append(os.path.join(path, inner_name))
+		elif is_lyrics_file(name):
+			lyrics_files.append(path)
+	return lyrics_files
+
+
+def migrate_lyrics_dir(layout):
+
+	"""
+		Moves all lyrics files in 'lyrics_dir' to the places used by layout
+		and saves layout in config.
+	"""
+
+	if layout not in LYRICS_LAYOUTS:
+		print('Invalid lyrics layout:', layout)
+		print('Only "flat", "letter" and "hash" are valid layouts.')
+		return False
+
+	lyrics_dir = Config.lyrics_dir
+	old_layout = Config.lyrics_layout
+	try:
+		lyrics_files = find_lyrics_files(lyrics_dir, old_layout)
+	except OSError as e:
+		print('Unable to read "lyrics_dir".')
+		print(e)
+		return False
+
+	print('Moving', len(lyrics_files), 'lyrics files to the', layout, 'layout...')
+
+	moved_count = 0
+
+	# Files not moved since the target exists, and files which failed
+	conflicts = []
+	failed = []
+
+	# Folders of the old layout which files were moved out of
+	old_dirs = set()
+
+	for path in lyrics_files:
+		target = get_lyrics_file_path(os.path.basename(path), layout, lyrics_dir)
+		if target == path:
+			continue
+
+		if os.path.exists(target):
+			# Same song saved in two folders. Keep both and let the user decide.
+			conflicts.append(path)
+			continue
+
+		try:
+			target_dir = os.path.dirname(target)
+			if not os.path.isdir(target_dir):
+				os.makedirs(target_dir)
+			os.rename(path, target)
+			moved_count += 1
+
+			if os.path.dirname(path) != lyrics_dir:
+				old_dirs.add(os.path.dirname(path))
+		except OSError as e:
+			failed.append((path, e))
+
+	# Remove folders of the old layout which are now empty. Other folders,
+	# ex. the user's own, are left alone.
+	for path in old_dirs:
+		try:
+			if not os.listdir(path):
+				os.rmdir(path)
+		except OSError:
+			pass
+
+	print(moved_count, 'lyrics files moved.')
+	if conflicts:
+		print(len(conflicts), 'lyrics files were not moved since the file already exists:')
+		for path in conflicts:
+			print('    ', path)
+	if failed:
+		print(len(failed), 'lyrics files could not be moved:')
+		for path, e in failed:
+			print('    ', path, '-', e)
+
+	if Config.save_config_to_file('paths', 'lyrics_layout', layout):
+		Config.lyrics_layout = layout
+		print('lyrico will save lyrics files using the', layout, 'layout.')
+	return True
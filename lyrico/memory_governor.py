@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+
+"""
+	Contains the MemoryGovernor class which keeps the resident memory(RSS)
+	of lyrico under the ceiling set by '--max-memory' or "max_memory".
+
+	The pipeline calls acquire before a song enters it(the scan, or the
+	feed of songs from a manifest) and again before its lyrics are fetched,
+	where most of its memory is allocated. When RSS is at the ceiling these
+	wait, while the songs already past them finish, are flushed to the log
+	and released. Songs are counted back out with release. Nothing waits
+	when no song is past it, since waiting would not free anything, so a
+	run slows down to one song at a time rather than stopping.
+
+	RSS is read from /proc, so the ceiling is only enforced on Linux.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import gc
+import os
+import re
+import time
+import threading
+
+try:
+	import ctypes
+	import ctypes.util
+except ImportError:
+	ctypes = None
+
+
+SIZE_UNITS = {
+	'': 1,
+	'k': 1024,
+	'm': 1024 ** 2,
+	'g': 1024 ** 3,
+}
+
+# Seconds a waiting producer sleeps between two RSS checks
+WAIT_INTERVAL = 0.2
+
+
+def parse_size(value):
+
+	"""
+		Returns number of bytes for value, ex. '512M', '2G', '1048576'.
+		Returns None for 'none' or '0'. Raises ValueError if invalid.
+	"""
+
+	value = value.strip().lower()
+	if value in ('', 'none'):
+		return None
+
+	match = re.match(r'^(\d+(?:\.\d+)?)\s*([kmg]?)i?b?$', value)
+	if not match:
+		raise ValueError('Invalid size: ' + value)
+
+	size = int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+	return size or None
+
+
+def get_rss():
+	"""Returns resident memory of this process in bytes, None if unknown"""
+
+	try:
+		with open('/proc/self/statm') as f:
+			resident_pages = int(f.read().split()[1])
+		return resident_pages * os.sysconf(str('SC_PAGE_SIZE'))
+	except (IOError, OSError, ValueError, IndexError, AttributeError):
+		return None
+
+
+def get_malloc_trim():
+	"""Returns glibc's malloc_trim, or None if not available"""
+
+	if ctypes is None:
+		return None
+	try:
+		libc = ctypes.CDLL(ctypes.util.find_library('c'))
+		return libc.malloc_trim
+	except (OSError, AttributeError, TypeError):
+		return None
+
+
+class MemoryGovernor():
+
+	def __init__(self, max_memory):
+		self.max_memory = max_memory
+
+		# Songs past each gate(see acquire) and not released yet
+		self.in_flight = {}
+
+		# Number of gates waiting. The log sink flushes while it is set.
+		self.waiting = 0
+
+		# Number of times a producer had to wait, shown at the end of the run.
+		self.pauses = 0
+		self.peak_rss = 0
+
+		self.condition = threading.Condition()
+		self.malloc_trim = get_malloc_trim()
+		self.last_relief = 0
+
+	@staticmethod
+	def create(max_memory):
+
+		"""
+			Returns a MemoryGovernor for max_memory(see parse_size), or None
+			if it is not set. Raises ValueError if max_memory is invalid.
+		"""
+
+		max_memory = parse_size(max_memory)
+		if max_memory is None:
+			return None
+
+		if get_rss() is None:
+			print('"max_memory" is ignored. Memory use can only be read on Linux.')
+			return None
+
+		return MemoryGovernor(max_memory)
+
+	def check(self):
+		"""Returns True if RSS is below the ceiling"""
+
+		rss = get_rss()
+		if rss is None:
+			return True
+		self.peak_rss = max(self.peak_rss, rss)
+		return rss < self.max_memory
+
+	@property
+	def under_pressure(self):
+		return self.waiting > 0
+
+	def acquire(self, gate):
+
+		"""
+			Called before a song passes gate, 'read' when it enters the
+			pipeline and 'fetch' before its lyrics are downloaded.
+		"""
+
+		with self.condition:
+			paused = False
+			while self.in_flight.get(gate) and not self.check():
+				if not paused:
+					paused = True
+					self.pauses += 1
+					self.waiting += 1
+				self.condition.wait(WAIT_INTERVAL)
+
+			if paused:
+				self.waiting -= 1
+			self.in_flight[gate] = self.in_flight.get(gate, 0) + 1
+
+	def release(self):
+		"""Called by the log sink once a song is logged and dropped"""
+
+		with self.condition:
+			for gate in self.in_flight:
+				if self.in_flight[gate]:
+					self.in_flight[gate] -= 1
+			self.condition.notify_all()
+
+	def relieve(self):
+
+		"""
+			Called by the log sink while under pressure, after flushing. Frees
+			unreachable objects and hands freed heap memory back to the system,
+			so RSS reflects the songs that were released.
+		"""
+
+		now = time.time()
+		if now - self.last_relief < WAIT_INTERVAL:
+			return
+		self.last_relief = now
+
+		gc.collect()
+		if self.malloc_trim is not None:
+			self.malloc_trim(0)
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+
+"""
+	Contains the MetadataCache class which keeps the metadata read from the
+	tags of audio files in a SQLite database.
+
+	Entries are keyed by the path of the audio file and only used while its
+	size, mtime and inode(see ScanManifest.get_signature) are unchanged, so
+	unchanged files are not opened again on the next run. The database is
+	saved in the lyrico state folder in WAL mode, so several lyrico
+	processes(ex. shards, or 'lyrico watch' along with a full run) can read
+	and update it at once. 'lyrico prune-cache' removes entries of deleted
+	or modified files and compacts the database.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import sqlite3
+import threading
+
+from .config import Config
+from .scan_manifest import ScanManifest
+
+
+# Rows written to the database in a single transaction.
+WRITE_BATCH_SIZE = 500
+
+# Seconds to wait for another lyrico process writing to the database.
+LOCK_TIMEOUT = 30
+
+
+class MetadataCache():
+
+	"""
+		SQLite backed cache of the metadata dicts returned by
+		song_helper.read_song_metadata.
+	"""
+
+	cache_file_name = 'metadata_cache.sqlite3'
+
+	# Bump when the metadata read from tags changes, which drops old entries.
+	schema_version = 2
+
+	# Cache for Config.lyrics_dir used by the current run. See get_cache.
+	current = None
+
+	def __init__(self, path):
+
+		self.path = path
+		self.connection = None
+
+		# metadata_pool looks up songs from the thread feeding the worker
+		# processes, while results are saved from the main thread.
+		self.lock = threading.RLock()
+
+		# Rows waiting to be written, see put.
+		self.pending = []
+
+		# Set when the database can't be used. lyrico then reads all tags.
+		self.disabled = False
+
+		self.hits = 0
+		self.misses = 0
+
+	@staticmethod
+	def get_cache():
+
+		"""
+			Returns the MetadataCache for Config.lyrics_dir or None if the
+			cache is disabled in settings or can't be used.
+		"""
+
+		if not Config.metadata_cache:
+			return None
+
+		cache = MetadataCache.current
+		if cache is None:
+			try:
+				path = Config.get_state_path(MetadataCache.cache_file_name)
+			except OSError:
+				# 'lyrics_dir' does not exist. Nowhere to keep the cache.
+				return None
+			cache = MetadataCache(path)
+			MetadataCache.current = cache
+
+		if cache.disabled:
+			return None
+		return cache
+
+	def connect(self):
+		"""Opens the database, creating its table when needed"""
+
+		if self.connection is not None:
+			return self.connection
+
+		connection = sqlite3.connect(self.path, timeout=LOCK_TIMEOUT, check_same_thread=False)
+		try:
+			# WAL lets readers carry on while another process writes.
+			connection.execute('PRAGMA journal_mode=WAL')
+			connection.execute('PRAGMA synchronous=NORMAL')
+
+			version = connection.execute('PRAGMA user_version').fetchone()[0]
+			if version != MetadataCache.schema_version:
+				with connection:
+					connection.execute('DROP TABLE IF EXISTS songs')
+					connection.execute('PRAGMA user_version=%d' % MetadataCache.schema_version)
+
+			with connection:
+				connection.execute(
+					'CREATE TABLE IF NOT EXISTS songs ('
+					'path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER, '
+					'artist TEXT, title TEXT, album TEXT, format TEXT, '
+					'lyrics_tag_present INTEGER, error TEXT)')
+		except sqlite3.Error:
+			connection.close()
+			raise
+
+		self.connection = connection
+		return connection
+
+	def handle_error(self, e):
+		"""Logs sqlite errors and stops using the cache for this run"""
+
+		print('Unable to use metadata cache. Tags will be read from all files.')
+		print(e)
+		self.disabled = True
+		self.pending = []
+		if self.connection is not None:
+			self.connection.close()
+			self.connection = None
+
+	def get(self, path, signature):
+
+		"""
+			Returns the cached metadata dict for file at path or None if it is
+			not cached or the file changed since. signature is [size, mtime_ns, inode].
+		"""
+
+		if self.disabled or signature is None:
+			return None
+
+		with self.lock:
+			try:
+				row = self.connect().execute(
+					'SELECT size, mtime_ns, inode, artist, title, album, format, lyrics_tag_present, error '
+					'FROM songs WHERE path = ?', (path,)).fetchone()
+			except sqlite3.Error as e:
+				self.handle_error(e)
+				return None
+
+		if row is None or list(row[:3]) != signature:
+			self.misses += 1
+			return None
+
+		self.hits += 1
+		return {
+			'artist': row[3],
+			'title': row[4],
+			'album': row[5],
+			'format': row[6],
+			'lyrics_tag_present': bool(row[7]),
+			'error': row[8],
+		}
+
+	def put(self, path, signature, metadata):
+		"""Queues metadata read from file at path to be saved"""
+
+		if self.disabled or signature is None:
+			return
+
+		# Songs are read by the pipeline threads while the log sink may flush.
+		with self.lock:
+			self.pending.append((path, signature[0], signature[1], signature[2],
+				metadata['artist'], metadata['title'], metadata['album'], metadata['format'],
+				int(metadata['lyrics_tag_present']), metadata['error']))
+
+			if len(self.pending) >= WRITE_BATCH_SIZE:
+				self.flush()
+
+	def flush(self):
+		"""Writes the queued entries to the database"""
+
+		with self.lock:
+			if self.disabled or not self.pending:
+				return
+
+			# Rows queued from now on go to the next batch.
+			pending, self.pending = self.pending, []
+			try:
+				connection = self.connect()
+				with connection:
+					connection.executemany(
+						'INSERT OR REPLACE INTO songs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', pending)
+			except sqlite3.Error as e:
+				self.handle_error(e)
+
+	def close(self):
+		"""Writes queued entries and closes the database"""
+
+		self.flush()
+		with self.lock:
+			if self.connection is not None:
+				self.connection.close()
+				self.connection = None
+
+	def prune(self):
+
+		"""
+			Removes entries of files which were deleted or modified since they
+			were cached and compacts the database. Returns (kept, removed)
+			counts or None on errors.
+		"""
+
+		try:
+			connection = self.connect()
+			rows = connection.execute('SELECT path, size, mtime_ns, inode FROM songs').fetchall()
+
+			stale = [(row[0],) for row in rows if ScanManifest.get_signature(row[0]) != list(row[1:])]
+			with connection:
+				connection.executemany('DELETE FROM songs WHERE path = ?', stale)
+
+			# VACUUM can't run inside a transaction.
+			connection.isolation_level = None
+			connection.execute('VACUUM')
+			connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+		except sqlite3.Error as e:
+			self.handle_error(e)
+			return None
+
+		self.close()
+		return (len(rows) - len(stale), len(stale))
+
+
+def prune_metadata_cache():
+	"""Runs MetadataCache.prune for 'lyrico prune-cache' and prints the result"""
+
+	try:
+		path = Config.get_state_path(MetadataCache.cache_file_name)
+	except OSError as e:
+		print('Unable to read "lyrics_dir".')
+		print(e)
+		return False
+
+	if not os.path.exists(path):
+		print('No metadata cache found in', Config.lyrics_dir)
+		return False
+
+	result = MetadataCache(path).prune()
+	if result is None:
+		return False
+
+	print(result[1], 'outdated entries removed from metadata cache.', result[0], 'entries kept.')
+	return True
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+"""
+	Contains helpers to read tags of audio files in a pool of processes.
+
+	Parsing tags with mutagen is pure python and holds the GIL, so on large
+	libraries reading metadata is CPU bound. Worker processes only return
+	plain metadata dicts(see song_helper.read_song_metadata). The mutagen
+	tag itself is never sent back, Song.save_lyrics reopens it when lyrics
+	are saved to tag. Lyrics file lookups, the metadata cache and the Song
+	counters stay in lyrico's own process. Reads per device are limited as
+	set in the device_limits module.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import multiprocessing
+
+from .config import Config
+from .song_helper import get_song_data, build_song_data, read_song_metadata_only
+from .metadata_cache import MetadataCache
+from .scan_manifest import ScanManifest
+from .device_limits import DeviceLimits, init_worker
+from .read_order import advise_paths
+
+
+def get_worker_count(workers=None):
+
+	"""
+		Returns number of processes to use for reading tags. 0 means one
+		process per CPU.
+	"""
+
+	if workers is None:
+		workers = Config.metadata_workers
+
+	if workers <= 0:
+		try:
+			workers = multiprocessing.cpu_count()
+		except NotImplementedError:
+			workers = 1
+
+	return workers
+
+
+def extract_song_data(song_paths, workers=None, chunksize=None, read_ahead=None):
+
+	"""
+		Generator which yields (path, data) for each of song_paths, where data
+		is the dict used to instantiate Song objects. Paths are yielded in
+		the same order as song_paths.
+
+		With a single worker tags are read in this process, same as Song(path).
+		The files after each one are advised to be read ahead as set by
+		read_ahead(see read_order.ReadAhead), right before it is read.
+	"""
+
+	workers = get_worker_count(workers)
+	if chunksize is None:
+		chunksize = Config.metadata_chunksize
+	chunksize = max(1, chunksize)
+
+	if workers == 1:
+		for path in song_paths:
+			if read_ahead:
+				advise_paths(read_ahead.get_next_paths(path))
+			yield (path, get_song_data(path))
+		return
+
+	# The metadata cache is only used in this process. Cached songs pass
+	# through the pool so the order of song_paths is kept, but workers
+	# don't open them.
+	cache = MetadataCache.get_cache()
+
+	# Workers share a semaphore per device, so a slow disk doesn't get
+	# more concurrent reads than it can take.
+	shared_limits = DeviceLimits.get_limits().create_shared(workers, multiprocessing.BoundedSemaphore)
+
+	pool = multiprocessing.Pool(workers, init_worker, (shared_limits,))
+	try:
+		# imap consumes song_paths lazily, so scanning and reading tags overlap.
+		items = get_cached_items(song_paths, cache, read_ahead)
+		for path, signature, metadata in pool.imap(read_song_metadata_only, items, chunksize):
+			if cache and signature is not None:
+				cache.put(path, signature, metadata)
+			yield (path, build_song_data(metadata))
+		pool.close()
+	finally:
+		# Also stops workers if the run is interrupted.
+		pool.terminate()
+		pool.join()
+
+
+def get_cached_items(song_paths, cache, read_ahead=None):
+
+	"""
+		Generator which yields (path, signature, metadata, next_paths) for
+		song_paths. metadata is the cached metadata, else None. signature is
+		None for cached songs, so they are not saved to the cache again.
+		next_paths are advised to be read ahead by the worker reading path.
+	"""
+
+	for path in song_paths:
+		next_paths = read_ahead.get_next_paths(path) if read_ahead else []
+		if cache is None:
+			yield (path, None, None, next_paths)
+			continue
+
+		signature = ScanManifest.get_signature(path)
+		metadata = cache.get(path, signature)
+		if metadata is not None:
+			yield (path, None, metadata, next_paths)
+		else:
+			yield (path, signature, None, next_paths)
@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+
+"""
+	Contains the SongPipeline class which runs the songs of a lyrico run
+	through its stages concurrently:
+
+		scan -> read tags -> fetch lyrics -> save lyrics -> log
+
+	Stages are connected by bounded queues. When a later stage falls
+	behind, the queue before it fills up and the earlier stages wait, so
+	only a bounded number of songs are in flight and the first lyrics are
+	saved while 'source_dir' is still being scanned. Finished songs are
+	handed back to the caller(the log sink) and can be dropped right away.
+
+	Each stage has its own number of workers: scan_threads for the scan,
+	metadata_workers processes for reading tags, fetch_workers and
+	save_workers threads for the other two. With "jobs" > 1 lyrics are
+	fetched by an asyncio event loop instead(see async_fetch module), with
+	connections limited per host and overall.
+
+	With a single fetch and save worker(the default) songs are fetched and
+	saved one after another by the caller instead, so the console messages
+	of each song stay together. Scanning and reading tags still run ahead,
+	each in its own thread.
+
+	With a MemoryGovernor(see memory_governor module) new songs only enter
+	the pipeline, and lyrics are only fetched, while RSS is below
+	'--max-memory'.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import threading
+
+try:
+	import queue
+except ImportError:
+	# python27
+	import Queue as queue
+
+from .song import Song
+from .config import Config
+from .metadata_pool import extract_song_data
+from .lyrico_sources.build_requests import prewarm_sessions
+
+
+# Put in a queue once per worker of the next stage when no more songs follow.
+STOP = object()
+
+
+def iter_queue(items):
+	"""Generator which yields items from queue until STOP"""
+
+	while True:
+		item = items.get()
+		if item is STOP:
+			return
+		yield item
+
+
+def start_thread(target, *args):
+	thread = threading.Thread(target=target, args=args)
+
+	# Don't keep lyrico running if the main thread is interrupted.
+	thread.daemon = True
+	thread.start()
+	return thread
+
+
+def fetch_song(song):
+	"""Fetch stage. Downloads lyrics for songs with artist and title."""
+
+	if song.artist and song.title:
+		song.fetch_lyrics()
+
+	# Show immidiate log in console
+	else:
+		# If title was present, use that
+		if song.title:
+			print(song.title, 'was ignored.', song.error)
+		# else use audio file path
+		else:
+			print(song.path, 'was ignored.', song.error)
+
+
+def save_song(song):
+	"""Save stage. Saves lyrics of songs which were fetched."""
+
+	if song.artist and song.title and song.download_required():
+		song.save_lyrics()
+
+
+def run_step(func, song):
+	"""Calls func for song, a failure is logged for the song"""
+
+	try:
+		func(song)
+	except Exception as e:
+		# Keep the pipeline going. The song is logged as failed.
+		print('Unexpected error for', song.path)
+		print(e)
+		song.error = str(e)
+
+
+class Stage():
+
+	"""
+		A pool of threads calling func for each song in the input queue and
+		putting the song in the output queue afterwards.
+	"""
+
+	def __init__(self, func, workers, queue_size, governor=None, gate=None):
+		self.func = func
+
+		# Each song waits for governor.acquire(gate) before func
+		self.governor = governor
+		self.gate = gate
+
+		self.workers = max(1, workers)
+		self.input = queue.Queue(queue_size)
+
+		# Set by connect
+		self.output = None
+		self.output_workers = 1
+
+		# Workers still running. The last one to stop tells the next stage.
+		self.running = self.workers
+		self.lock = threading.Lock()
+
+	def connect(self, output, output_workers=1):
+		self.output = output
+		self.output_workers = output_workers
+
+	def start(self):
+		for _ in range(self.workers):
+			start_thread(self.run)
+
+	def run(self):
+		for song in iter_queue(self.input):
+			if self.governor:
+				self.governor.acquire(self.gate)
+			run_step(self.func, song)
+			self.output.put(song)
+
+		with self.lock:
+			self.running -= 1
+			last = self.running == 0
+
+		if last:
+			for _ in range(self.output_workers):
+				self.output.put(STOP)
+
+
+def get_async_fetch_stage():
+	"""Returns the AsyncFetchStage class, None if asyncio is not available"""
+
+	try:
+		from .async_fetch import AsyncFetchStage
+	except (ImportError, SyntaxError):
+		# python27
+		return None
+	return AsyncFetchStage
+
+
+class SongPipeline():
+
+	"""
+		Runs songs through the fetch and save stages. See module docstring.
+	"""
+
+	def __init__(self, fetch_workers=None, save_workers=None, queue_size=None, governor=None, jobs=None):
+
+		if jobs is None:
+			jobs = Config.jobs
+		if fetch_workers is None:
+			fetch_workers = Config.fetch_workers
+		if save_workers is None:
+			save_workers = Config.save_workers
+		if queue_size is None:
+			queue_size = Config.queue_size
+
+		self.queue_size = max(1, queue_size)
+		self.governor = governor
+
+		# Set by read_songs
+		self.reading = False
+
+		# Stage threads print the messages of different songs at the same
+		# time. Only use them when there is more than one worker.
+		self.serial = max(fetch_workers, save_workers, jobs) <= 1
+
+		self.fetch = self.create_fetch_stage(fetch_workers, jobs, governor)
+		self.save = Stage(save_song, save_workers, self.queue_size)
+		self.finished = queue.Queue(self.queue_size)
+
+		self.fetch.connect(self.save.input, self.save.workers)
+		self.save.connect(self.finished)
+
+	def create_fetch_stage(self, fetch_workers, jobs, governor):
+
+		# Lyrics take most of the memory of a song, so fetching waits too.
+		if jobs > 1:
+			AsyncFetchStage = get_async_fetch_stage()
+			if AsyncFetchStage:
+				return AsyncFetchStage(jobs, self.queue_size, governor)
+
+			# No per host limits without asyncio, a thread per job.
+			fetch_workers = jobs
+
+		return Stage(fetch_song, fetch_workers, self.queue_size, governor, 'fetch')
+
+	def read_songs(self, song_paths, read_ahead=None):
+
+		"""
+			Returns a generator which yields Song objects for song_paths.
+			song_paths is consumed by its own thread(the scan stage), so
+			scanning goes on while tags are read. read_ahead(a ReadAhead for
+			song_paths) is applied as each file is read.
+		"""
+
+		# Songs from read_songs are counted by the governor as paths, not
+		# again when they are fed to the fetch stage.
+		self.reading = True
+		paths = queue.Queue(self.queue_size)
+
+		# Worker processes take paths as fast as they come, so with
+		# "metadata_workers" > 1 the memory ceiling is applied to the paths.
+		start_thread(self.feed, song_paths, paths, 1, self.governor)
+
+		# Paths are sent to workers in chunks, a partial chunk waits for more
+		# paths. Those may be held back by the governor until the songs
+		# already sent finish, so send them one by one.
+		chunksize = 1 if self.governor else None
+
+		return self.build_songs(iter_queue(paths), chunksize, read_ahead)
+
+	def build_songs(self, song_paths, chunksize, read_ahead=None):
+		"""Generator which yields Song objects for song_paths"""
+
+		# Tags are read in worker processes when "metadata_workers" > 1.
+		for path, data in extract_song_data(song_paths, chunksize=chunksize, read_ahead=read_ahead):
+			yield Song(path, data)
+
+	def feed(self, items, output, output_workers, governor=None):
+
+		"""
+			Puts items in output queue, followed by a STOP for each worker.
+			Waits for governor before each item.
+		"""
+
+		try:
+			for item in items:
+				if governor:
+					governor.acquire('read')
+				output.put(item)
+		except Exception as e:
+			# Songs already queued are still processed.
+			print('Unable to read more songs.')
+			print(e)
+		finally:
+			for _ in range(output_workers):
+				output.put(STOP)
+
+	def run(self, songs):
+
+		"""
+			Generator which yields the songs as they finish all stages. songs
+			is an iterable of Song objects, consumed by its own thread(the
+			read stage).
+		"""
+
+		if Config.http_prewarm:
+			prewarm_sessions()
+
+		if self.serial:
+			finished = self.run_serial(songs)
+		else:
+			self.fetch.start()
+			self.save.start()
+			governor = None if self.reading else self.governor
+			start_thread(self.feed, songs, self.fetch.input, self.fetch.workers, governor)
+			finished = iter_queue(self.finished)
+
+		for song in finished:
+			yield song
+
+			# The caller is done with the song.
+			if self.governor:
+				self.governor.release()
+
+	def run_serial(self, songs):
+		"""Generator which fetches and saves songs one after another"""
+
+		# Tags are read by their own thread(the read stage), ahead of the
+		# song being fetched.
+		read = queue.Queue(self.queue_size)
+		governor = None if self.reading else self.governor
+		start_thread(self.feed, songs, read, 1, governor)
+
+		for song in iter_queue(read):
+			if self.governor:
+				self.governor.acquire('fetch')
+
+			run_step(fetch_song, song)
+			run_step(save_song, song)
+			yield song
@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+
+"""
+	Contains the 'lyrico plan' and 'lyrico execute' commands.
+
+	'lyrico plan' scans 'source_dir' and reads tags like a normal run, but
+	makes no requests. For each song it records what a run would do, as
+	decided by Song.download_required:
+
+		- 'download' - lyrics are downloaded and saved to file and/or tag
+		- 'present' - lyrics are already present, skipped
+		- 'ignored' - artist or title not found
+
+	The plan is a JSON lines file. The first line holds the settings used,
+	the totals and an estimate of the number of requests. Each following
+	line is one song, with everything needed to build its Song object.
+
+	'lyrico execute <plan_file>' runs the plan through the pipeline without
+	scanning or reading tags again. Finished songs are appended to a
+	journal next to the plan, '<plan_file>.journal'. If the run is
+	interrupted, the same command resumes with the songs not in the journal.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import io
+import json
+import time
+import tempfile
+
+from .song import Song
+from .config import Config
+from .pipeline import SongPipeline
+from .scan_manifest import ScanManifest
+from .streaming_log import StreamingLog
+from .lyrics_catalog import LyricsCatalog
+from .shards import get_shard_suffix
+from .helper import replace_file
+from .hedged_fetch import HedgeStats
+from .source_stats import SourceStats
+
+
+PLAN_VERSION = 1
+
+# Settings which decide what is done for each song. The plan is executed
+# with the settings it was made with.
+PLAN_SETTINGS = ('save_to_file', 'save_to_tag', 'overwrite')
+
+# Sources and the most requests each makes for a song. LYRICSnMUSIC
+# searches first and then fetches the lyrics page.
+SOURCE_REQUESTS = [
+	('lyric_wikia', 1),
+	('lyrics_n_music', 2),
+	('musix_match', 1),
+	('lyricsmode', 1),
+	('az_lyrics', 1),
+]
+
+# Fields of the dict used to instantiate Song objects(see
+# song_helper.build_song_data) which are saved in the plan.
+SONG_DATA_KEYS = ('artist', 'title', 'album', 'format', 'lyrics_file_path',
+	'lyrics_file_present', 'lyrics_tag_present', 'error')
+
+
+def get_plan_path(shard=None):
+	"""Returns default path of the plan file in 'lyrics_dir'"""
+
+	return os.path.join(Config.lyrics_dir, 'plan' + get_shard_suffix(shard) + '.jsonl')
+
+
+def get_journal_path(plan_path):
+	return plan_path + '.journal'
+
+
+def get_action(song):
+	"""Returns 'download', 'present' or 'ignored' for song"""
+
+	if not (song.artist and song.title):
+		return 'ignored'
+	if song.download_required():
+		return 'download'
+	return 'present'
+
+
+def get_record(song, signature):
+	"""Returns the plan record for song"""
+
+	action = get_action(song)
+	overwrite = Config.overwrite
+	data = dict((key, getattr(song, key)) for key in SONG_DATA_KEYS)
+
+	return {
+		'path': song.path,
+		'action': action,
+		'save_to_file': action == 'download' and Config.save_to_file and
+			(overwrite or not song.lyrics_file_present),
+		'save_to_tag': action == 'download' and Config.save_to_tag and
+			(overwrite or not song.lyrics_tag_present),
+		'signature': signature,
+		'data': data,
+	}
+
+
+def get_request_estimate(download_count):
+
+	"""
+		Returns the least and most requests needed to download lyrics for
+		download_count songs with the enabled sources. The least is when the
+		first source finds all lyrics, the most when all sources are tried.
+	"""
+
+	per_song = [requests for source, requests in SOURCE_REQUESTS if getattr(Config, source)]
+	if not per_song:
+		return {'min': 0, 'max': 0}
+	return {'min': download_count, 'max': download_count * sum(per_song)}
+
+
+def write_plan(songs, plan_path, shard=None, manifest=None):
+
+	"""
+		Writes the plan for songs to plan_path. Signatures of the songs are
+		taken from manifest, so 'lyrico execute' can update it.
+		Returns the first line of the plan(see print_plan).
+	"""
+
+	totals = {
+		'songs': 0,
+		'download': 0,
+		'present': 0,
+		'ignored': 0,
+		'save_to_file': 0,
+		'save_to_tag': 0,
+	}
+
+	# Records are spooled until the totals for the first line are known.
+	spool = tempfile.TemporaryFile()
+	try:
+		for song in songs:
+			signature = manifest.pending.get(song.path) if manifest else None
+			record = get_record(song, signature)
+
+			totals['songs'] += 1
+			totals[record['action']] += 1
+			totals['save_to_file'] += record['save_to_file']
+			totals['save_to_tag'] += record['save_to_tag']
+
+			spool.write((json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8'))
+
+		header = {
+			'lyrico_plan': PLAN_VERSION,
+			'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+			'source_dir': Config.source_dir,
+			'shard': list(shard) if shard else None,
+			'settings': dict((key, getattr(Config, key)) for key in PLAN_SETTINGS),
+			'sources': [source for source, requests in SOURCE_REQUESTS if getattr(Config, source)],
+			'totals': totals,
+			'estimated_requests': get_request_estimate(totals['download']),
+		}
+
+		temp_path = '%s.%d.tmp' % (plan_path, os.getpid())
+		with io.open(temp_path, 'wb') as f:
+			f.write((json.dumps(header, ensure_ascii=False) + '\n').encode('utf-8'))
+			spool.seek(0)
+			for line in spool:
+				f.write(line)
+		replace_file(temp_path, plan_path)
+	finally:
+		spool.close()
+
+	# A new plan starts with an empty journal.
+	journal_path = get_journal_path(plan_path)
+	if os.path.exists(journal_path):
+		os.remove(journal_path)
+
+	return header
+
+
+def print_plan(header):
+	"""Prints the summary of a plan"""
+
+	totals = header['totals']
+	estimate = header['estimated_requests']
+
+	print(totals['songs'], 'songs detected.')
+	print('To download:', totals['download'],
+		'(lyrics files: %d, tags: %d)' % (totals['save_to_file'], totals['save_to_tag']))
+	print('Already present:', totals['present'])
+	print('Ignored(no artist or title):', totals['ignored'])
+	print('Sources:', ', '.join(header['sources']) or 'none')
+	print('Estimated requests: %d to %d' % (estimate['min'], estimate['max']))
+
+
+def read_plan(plan_path):
+
+	"""
+		Returns (header, records) for the plan at plan_path. records is a
+		generator. Raises IOError if the plan can't be read and ValueError
+		if it is not a plan.
+	"""
+
+	f = io.open(plan_path, 'r', encoding='utf-8')
+	try:
+		header = json.loads(f.readline())
+		if not isinstance(header, dict) or header.get('lyrico_plan') != PLAN_VERSION:
+			raise ValueError('Not a lyrico plan file.')
+	except ValueError:
+		f.close()
+		raise
+
+	def read_records():
+		with f:
+			for line in f:
+				if line.strip():
+					yield json.loads(line)
+
+	return header, read_records()
+
+
+class PlanJournal():
+
+	"""
+		Songs of a plan which finished in earlier 'lyrico execute' runs, and
+		what was written to the log for them.
+	"""
+
+	def __init__(self, plan_path):
+		self.path = get_journal_path(plan_path)
+
+		# path -> entry(see add)
+		self.entries = {}
+		self.f = None
+
+	def load(self):
+		try:
+			with io.open(self.path, 'r', encoding='utf-8') as f:
+				for line in f:
+					try:
+						entry = json.loads(line)
+					except ValueError:
+						# The last line of an interrupted run
+						continue
+					self.entries[entry['path']] = entry
+		except IOError:
+			# No earlier run
+			pass
+
+	def add(self, song):
+		"""Called for each song once it is processed"""
+
+		if self.f is None:
+			self.f = io.open(self.path, 'a', encoding='utf-8')
+
+		entry = {
+			'path': song.path,
+			'log_string': song.get_log_string(),
+			'valid': bool(song.artist and song.title),
+			'saved_to_file': song.saved_to_file,
+			'saved_to_tag': song.saved_to_tag,
+		}
+		self.f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+		# Written right away, so an interrupted run resumes after this song.
+		self.f.flush()
+
+	def close(self):
+		if self.f is not None:
+			self.f.close()
+			self.f = None
+
+
+def execute_plan(plan_path, governor=None):
+
+	"""
+		Runs the plan at plan_path, skipping songs finished by earlier runs
+		of the same plan. Writes the log and updates the scan manifest.
+		Returns False if the plan can't be read.
+	"""
+
+	try:
+		header, records = read_plan(plan_path)
+	except (IOError, ValueError) as e:
+		print('Unable to read plan.')
+		print(e)
+		return False
+
+	# Decisions in the plan were made with its own settings.
+	for key, value in header['settings'].items():
+		if getattr(Config, key) != value:
+			print('Using "%s" as planned: %s' % (key, value))
+			setattr(Config, key, value)
+
+	shard = tuple(header['shard']) if header['shard'] else None
+
+	journal = PlanJournal(plan_path)
+	journal.load()
+
+	# Songs finished earlier are logged from the journal.
+	log = StreamingLog(shard)
+	for entry in journal.entries.values():
+		log.add_log_string(entry['log_string'])
+		Song.valid_metadata_count += entry['valid']
+		Song.lyrics_saved_to_file_count += entry['saved_to_file']
+		Song.lyrics_saved_to_tag_count += entry['saved_to_tag']
+
+	if journal.entries:
+		print(len(journal.entries), 'songs already done by an earlier run of this plan.')
+
+	manifest = ScanManifest.load(shard=shard)
+
+	def get_songs():
+		for record in records:
+			if record['path'] in journal.entries:
+				continue
+			if record['signature']:
+				manifest.add_pending(record['path'], record['signature'])
+			yield Song(record['path'], record['data'])
+
+	pipeline = SongPipeline(governor=governor)
+	try:
+		for song in pipeline.run(get_songs()):
+			manifest.record(song)
+			journal.add(song)
+			log.add(song)
+
+			if governor and governor.under_pressure:
+				log.flush()
+				governor.relieve()
+	finally:
+		journal.close()
+
+	print('\n' + str(log.count), 'songs in plan.')
+	HedgeStats.print_stats()
+	SourceStats.get_stats().print_stats()
+
+	# Songs not in the plan are kept in the manifest.
+	manifest.save(drop_unseen=False)
+	LyricsCatalog.get_catalog().save()
+	SourceStats.get_stats().save()
+
+	print('\nBuilding log...')
+	log.close()
+	return True
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+
+"""
+	Contains helpers to read tags of audio files in their physical order on disk.
+
+	On spinning disks, reading tags in scan order makes the disk head jump
+	all over the platter. Sorting the songs by inode number, or by the
+	physical offset of their first extent (FIEMAP, Linux only), turns most of
+	those seeks into short forward moves. posix_fadvise(WILLNEED) is issued
+	for the next few files so the disk reads ahead while tags are parsed(see
+	ReadAhead). It is issued by the stage reading tags, right before each
+	file is read, so the window follows the file being read.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import sys
+import struct
+
+try:
+	import fcntl
+except ImportError:
+	# Windows
+	fcntl = None
+
+
+READ_ORDERS = ('none', 'inode', 'extent')
+
+# _IOWR('f', 11, struct fiemap) from <linux/fs.h>
+FS_IOC_FIEMAP = 0xC020660B
+
+# struct fiemap {u64 fm_start; u64 fm_length; u32 fm_flags; u32 fm_mapped_extents;
+#	u32 fm_extent_count; u32 fm_reserved;}
+FIEMAP_HEADER = struct.Struct(str('=QQIIII'))
+
+# struct fiemap_extent {u64 fe_logical; u64 fe_physical; u64 fe_length;
+#	u64 fe_reserved64[2]; u32 fe_flags; u32 fe_reserved[3];}
+FIEMAP_EXTENT = struct.Struct(str('=QQQQQIIII'))
+
+# fe_flags of extents whose physical offset is not known yet(it is 0)
+FIEMAP_EXTENT_UNKNOWN = 0x00000002
+FIEMAP_EXTENT_DELALLOC = 0x00000004
+
+# Tags are read from the start of most audio files, so only this much
+# of each file is advised to be read ahead.
+READAHEAD_BYTES = 1024 * 1024
+
+
+def get_first_extent(fd):
+
+	"""
+		Returns the physical offset of the first extent of the open file or
+		None if FIEMAP is not supported by the filesystem or the offset is
+		not known(ex. data not written to disk yet).
+	"""
+
+	if fcntl is None or not sys.platform.startswith('linux'):
+		return None
+
+	# Ask for a single extent mapping the whole file.
+	request = FIEMAP_HEADER.pack(0, 0xFFFFFFFFFFFFFFFF, 0, 0, 1, 0) + b'\0' * FIEMAP_EXTENT.size
+	buf = bytearray(request)
+	try:
+		fcntl.ioctl(fd, FS_IOC_FIEMAP, buf, True)
+	except (IOError, OSError):
+		return None
+
+	mapped_extents = FIEMAP_HEADER.unpack_from(buf)[3]
+	if not mapped_extents:
+		# Empty files or data inlined in the inode
+		return None
+
+	extent = FIEMAP_EXTENT.unpack_from(buf, FIEMAP_HEADER.size)
+	if extent[5] & (FIEMAP_EXTENT_UNKNOWN | FIEMAP_EXTENT_DELALLOC):
+		return None
+	return extent[1]
+
+
+def get_physical_key(path, read_order):
+
+	"""
+		Returns sort key approximating where the file at path is placed on disk.
+		'extent' falls back to the inode number when FIEMAP is not available.
+	"""
+
+	try:
+		st = os.stat(path)
+	except OSError:
+		# Let the Song log errors for missing files. Put them at the end.
+		return (float('inf'), 0, 0)
+
+	if read_order == 'extent':
+		try:
+			fd = os.open(path, os.O_RDONLY)
+		except OSError:
+			fd = None
+		if fd is not None:
+			try:
+				physical = get_first_extent(fd)
+			finally:
+				os.close(fd)
+			if physical is not None:
+				return (st.st_dev, 0, physical)
+
+	# Files without extent information sort after the ones with it, by inode.
+	return (st.st_dev, 1, st.st_ino)
+
+
+def sort_by_physical_order(song_paths, read_order):
+	"""Returns list of song_paths sorted by their physical placement on disk"""
+
+	if read_order not in ('inode', 'extent'):
+		return list(song_paths)
+
+	keyed = [(get_physical_key(path, read_order), path) for path in song_paths]
+	keyed.sort(key=lambda item: item[0])
+	return [path for key, path in keyed]
+
+
+def advise_willneed(path):
+	"""Asks the kernel to start reading the beginning of the file at path"""
+
+	try:
+		fd = os.open(path, os.O_RDONLY)
+	except OSError:
+		return
+
+	try:
+		os.posix_fadvise(fd, 0, READAHEAD_BYTES, os.POSIX_FADV_WILLNEED)
+	except OSError:
+		pass
+	finally:
+		os.close(fd)
+
+
+class ReadAhead():
+
+	"""
+		Keeps the kernel reading ahead the next 'window' files of song_paths
+		(in the order they are read) while tags are read. Does nothing when
+		posix_fadvise is not available(Windows, macOS, python27).
+	"""
+
+	def __init__(self, song_paths, window):
+		self.song_paths = list(song_paths)
+		self.window = window
+		self.enabled = window > 0 and hasattr(os, 'posix_fadvise')
+
+		# path -> index in song_paths
+		self.indexes = dict((path, index) for index, path in enumerate(self.song_paths))
+
+		# Files before this index were already advised.
+		self.advised_until = 0
+
+	def get_next_paths(self, path):
+
+		"""
+			Returns the paths to advise when path is about to be read: the
+			files of the window after it which were not advised yet.
+		"""
+
+		if not self.enabled:
+			return []
+
+		index = self.indexes.get(path)
+		if index is None:
+			return []
+
+		start = max(self.advised_until, index + 1)
+		end = min(len(self.song_paths), index + self.window + 1)
+		if start >= end:
+			return []
+		self.advised_until = end
+		return self.song_paths[start:end]
+
+
+def advise_paths(paths):
+	for path in paths:
+		advise_willneed(path)
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+
+"""
+	Contains the ScanManifest class used by the '--incremental' mode.
+
+	The manifest is saved in the lyrico state folder and maps the path of each
+	audio file to the [size, mtime_ns, inode, outcome] recorded on last run.
+	On the next run only new or modified files and the files which failed
+	are queued again.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import json
+import io
+
+from .config import Config
+from .helper import get_mtime_ns, replace_file
+from .shards import get_shard_suffix
+
+
+# Outcomes recorded for every song processed.
+
+# Lyrics were saved or were already present as per settings.
+OUTCOME_OK = 'ok'
+
+# Lyrics download or save failed. These are retried on next run.
+OUTCOME_FAILED = 'failed'
+
+# Artist or title could not be read. Only retried when the file changes.
+OUTCOME_IGNORED = 'ignored'
+
+
+class ScanManifest():
+
+	"""
+		On-disk record of audio files processed by previous lyrico runs.
+	"""
+
+	manifest_file_name = 'scan_manifest%s.json'
+	manifest_version = 1
+
+	def __init__(self, path):
+
+		self.path = path
+
+		# path -> [size, mtime_ns, inode, outcome]
+		self.files = {}
+
+		# Signatures of files queued on this run. They are moved to
+		# self.files once the outcome for the song is recorded.
+		self.pending = {}
+
+		# Paths detected on this run. Used to drop deleted files on save.
+		self.seen = set()
+
+		# Count of files skipped since they did not change
+		self.unchanged_count = 0
+
+	@staticmethod
+	def get_settings_key():
+
+		"""
+			Returns the settings which decide if lyrics are required for a song.
+			If any of these change, the previous outcomes are not valid anymore.
+		"""
+
+		return [Config.lyrics_dir, Config.save_to_file, Config.save_to_tag, Config.overwrite]
+
+	@staticmethod
+	def load(path=None, shard=None):
+
+		"""
+			Returns ScanManifest for path, which defaults to the manifest in
+			lyrico state folder. Missing, old or unreadable manifests result
+			in an empty manifest so that every file is processed.
+
+			Each shard(see shards module) keeps its own manifest.
+		"""
+
+		if path is None:
+			try:
+				path = Config.get_state_path(ScanManifest.manifest_file_name % get_shard_suffix(shard))
+			except OSError:
+				# 'lyrics_dir' does not exist. The error is logged when saving
+				# lyrics, so only skip using the manifest.
+				return ScanManifest(None)
+
+		manifest = ScanManifest(path)
+
+		try:
+			with io.open(path, 'r', encoding='utf-8') as f:
+				saved = json.load(f)
+		except (IOError, ValueError):
+			return manifest
+
+		if (saved.get('version') == ScanManifest.manifest_version and
+			saved.get('settings') == ScanManifest.get_settings_key()):
+			manifest.files = saved.get('files', {})
+
+		return manifest
+
+	@staticmethod
+	def get_signature(path):
+		"""Returns [size, mtime_ns, inode] for file at path or None if it can't be read"""
+
+		try:
+			st = os.stat(path)
+		except OSError:
+			return None
+		return [st.st_size, get_mtime_ns(st), st.st_ino]
+
+	def filter_pending(self, song_paths, skip_unchanged=True):
+
+		"""
+			Generator which only yields the paths which are new, were modified
+			or failed on last run.
+
+			With skip_unchanged False, all paths are yielded but their signatures
+			are still recorded, so that a full run prepares the manifest for the
+			next incremental run.
+		"""
+
+		for path in song_paths:
+			self.seen.add(path)
+
+			signature = ScanManifest.get_signature(path)
+			if signature is None:
+				# Let the Song log the error for missing file.
+				yield path
+				continue
+
+			previous = self.files.get(path)
+			if (skip_unchanged and previous and previous[:3] == signature and
+				previous[3] != OUTCOME_FAILED):
+				self.unchanged_count += 1
+				continue
+
+			self.pending[path] = signature
+			yield path
+
+	def add_pending(self, path, signature):
+		"""Queues path with a signature read earlier(ex. by 'lyrico plan')"""
+
+		self.pending[path] = signature
+
+	def record(self, song):
+		"""Saves the outcome of the song processed on this run"""
+
+		signature = self.pending.pop(song.path, None)
+		if signature is None:
+			return
+
+		if not (song.artist and song.title):
+			outcome = OUTCOME_IGNORED
+		elif song.error:
+			outcome = OUTCOME_FAILED
+		else:
+			outcome = OUTCOME_OK
+
+		if song.saved_to_tag:
+			# Saving the tag changed the file. Keep its new signature, so it is
+			# not taken as modified by the next run or by 'lyrico watch'.
+			signature = ScanManifest.get_signature(song.path) or signature
+
+		self.files[song.path] = signature + [outcome]
+
+	def save(self, drop_unseen=True):
+
+		"""
+			Writes the manifest to disk. When drop_unseen is True, which is
+			the case after a full scan, files not detected on this run are removed.
+		"""
+
+		if not self.path:
+			return
+
+		files = self.files
+		if drop_unseen:
+			files = dict((path, value) for path, value in self.files.items() if path in self.seen)
+
+		data = {
+			'version': ScanManifest.manifest_version,
+			'settings': ScanManifest.get_settings_key(),
+			'files': files,
+		}
+
+		temp_path = '%s.%d.tmp' % (self.path, os.getpid())
+		try:
+			with io.open(temp_path, 'w', encoding='utf-8') as f:
+				f.write(json.dumps(data, ensure_ascii=False))
+			replace_file(temp_path, self.path)
+		except (IOError, OSError) as e:
+			print('Unable to save scan manifest.')
+			print(e)
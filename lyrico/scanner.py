@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+
+"""
+	Contains the directory walker used to detect audio files in 'source_dir'.
+
+	The walker makes a single pass over the directory tree using 'scandir'.
+	On most platforms 'scandir' returns the file type along with the name
+	(d_type on Linux), so no 'stat' call is needed to tell files from folders.
+	Folders can also be listed by a pool of threads for network filesystems.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import threading
+
+try:
+	import queue
+except ImportError:
+	# python27
+	import Queue as queue
+
+try:
+	# >3.5
+	from os import scandir
+except ImportError:
+	# python27 uses the 'scandir' backport
+	from scandir import scandir
+
+from .config import Config
+
+
+def get_audio_extensions(audio_formats=None):
+
+	"""
+		Returns a frozenset of lowercase extensions(with the leading '.')
+		for the audio formats supported by lyrico.
+	"""
+
+	if audio_formats is None:
+		audio_formats = Config.audio_formats
+
+	return frozenset('.' + ext.lower() for ext in audio_formats)
+
+
+def get_file_key(st):
+	"""Returns a single int identifying the physical file from os.stat result"""
+	return (st.st_dev << 64) | st.st_ino
+
+
+def stat_entry(entry):
+	"""Returns os.stat result, following symlinks, for a scandir entry"""
+
+	# On Windows the cached DirEntry.stat always has st_dev and st_ino set to zero
+	if os.name == 'nt':
+		return os.stat(entry.path)
+	return entry.stat()
+
+
+class DirListing():
+
+	"""
+		Result of listing a single folder. In parallel scans it is created
+		when the folder is queued and 'done' is set once a thread has listed it.
+	"""
+
+	def __init__(self, path, dev, ancestors):
+		self.path = path
+		self.dev = dev
+
+		# Linked list of keys of this folder and its parents, (key, parent_chain).
+		self.ancestors = ancestors
+
+		# list of (path, file_key) for audio files in this folder
+		self.audio_files = []
+
+		# DirListing objects for the inner folders
+		self.sub_dirs = []
+
+		self.done = threading.Event()
+
+
+class LibraryScanner():
+
+	"""
+		Walks 'source_dir' in a single pass and yields paths to audio files.
+
+		Hardlinks and symlinks pointing to a file which was already yielded are
+		collapsed, so each physical file is processed only once. Symlinks to
+		folders are followed, but a folder is never scanned twice, which also
+		protects the scan from symlink loops.
+
+		With threads > 1, a pool of threads lists the inner folders concurrently.
+		This helps on network filesystems where each folder read is a round trip.
+		When ordered is True, paths are still yielded in the same order as
+		a single threaded scan, else as soon as their folder is listed.
+	"""
+
+	def __init__(self, extensions=None, threads=1, ordered=True):
+
+		if extensions is None:
+			extensions = get_audio_extensions()
+		self.extensions = extensions
+
+		self.threads = max(1, threads)
+		self.ordered = ordered
+
+		# Count of audio file paths skipped since they were aliases(hardlinks
+		# or symlinks) of a file already detected.
+		self.aliases_collapsed = 0
+
+		# Count of symlinks to folders skipped since the folder was already scanned.
+		self.dir_aliases_skipped = 0
+
+		# Count of symlinks which pointed back to one of their parent folders.
+		self.symlink_loops = 0
+
+		# Keys(see get_file_key) of physical files and folders already seen.
+		self.seen_files = set()
+		self.seen_dirs = set()
+
+		# Guards seen_dirs and the folder counters when listing in threads.
+		self.dirs_lock = threading.Lock()
+
+	def walk(self, path):
+
+		"""
+			Generator which yields paths to all audio files in dir located at path,
+			including all the inner directories.
+
+			Extensions are matched case-insensitively so '.mp3', '.MP3' and '.Mp3'
+			are all detected on every platform.
+
+			Like the glob patterns used earlier, hidden files and folders(starting
+			with a '.') are skipped.
+		"""
+
+		try:
+			root_stat = os.stat(path)
+		except OSError:
+			return
+
+		root_key = get_file_key(root_stat)
+		self.seen_dirs.add(root_key)
+		root = DirListing(path, root_stat.st_dev, (root_key, None))
+
+		if self.threads == 1:
+			listings = self.walk_serial(root)
+		elif self.ordered:
+			listings = self.walk_parallel_ordered(root)
+		else:
+			listings = self.walk_parallel_unordered(root)
+
+		for listing in listings:
+			for song_path, file_key in listing.audio_files:
+				if file_key in self.seen_files:
+					self.aliases_collapsed += 1
+					continue
+
+				self.seen_files.add(file_key)
+				yield song_path
+
+	def walk_serial(self, root):
+
+		# Use an explicit stack instead of recursion so deep trees can't hit
+		# the recursion limit.
+		pending_dirs = [root]
+		while pending_dirs:
+			listing = pending_dirs.pop()
+			self.list_dir(listing)
+			yield listing
+
+			# Reverse so that the folders are popped(scanned) in the order read.
+			pending_dirs.extend(reversed(listing.sub_dirs))
+
+	def walk_parallel_ordered(self, root):
+
+		"""
+			Threads list folders ahead of the consumer, while listings are
+			yielded in the same depth-first order as walk_serial.
+		"""
+
+		pool = ListingPool(self, self.threads)
+		try:
+			pool.submit(root)
+			pending_dirs = [root]
+			while pending_dirs:
+				listing = pending_dirs.pop()
+				listing.done.wait()
+				yield listing
+				pending_dirs.extend(reversed(listing.sub_dirs))
+		finally:
+			pool.stop()
+
+	def walk_parallel_unordered(self, root):
+
+		"""
+			Yields listings as soon as any thread finishes them.
+		"""
+
+		pool = ListingPool(self, self.threads, queue.Queue())
+		try:
+			pool.submit(root)
+			outstanding = 1
+			while outstanding:
+				listing = pool.finished.get()
+				outstanding += len(listing.sub_dirs) - 1
+				yield listing
+		finally:
+			pool.stop()
+
+	def list_dir(self, listing):
+
+		"""
+			Reads folder for listing and fills in its audio files and
+			inner folders.
+		"""
+
+		try:
+			entries = scandir(listing.path)
+		except OSError:
+			# Folder removed during scan or no permissions to read it.
+			return
+
+		try:
+			for entry in entries:
+				if entry.name.startswith('.'):
+					continue
+
+				try:
+					is_symlink = entry.is_symlink()
+
+					# is_dir uses the d_type returned by readdir and only needs
+					# a stat call for symlinks or on filesystems not reporting it.
+					if entry.is_dir():
+						sub_dir = self.get_sub_dir(entry, is_symlink, listing.ancestors)
+						if sub_dir:
+							listing.sub_dirs.append(sub_dir)
+						continue
+
+					if os.path.splitext(entry.name)[1].lower() not in self.extensions:
+						continue
+
+					if is_symlink or not hasattr(entry, 'inode'):
+						# Only symlinks need a stat call, to get the target file.
+						file_key = get_file_key(stat_entry(entry))
+					else:
+						# Files always live on the same device as their folder, so
+						# the inode returned by readdir is enough.
+						file_key = (listing.dev << 64) | entry.inode()
+
+				except OSError:
+					# Broken symlinks or file removed during scan
+					continue
+
+				listing.audio_files.append((entry.path, file_key))
+
+		finally:
+			# The 'scandir' iterator holds an open file descriptor.
+			close = getattr(entries, 'close', None)
+			if close:
+				close()
+
+	def get_sub_dir(self, entry, is_symlink, ancestors):
+
+		"""
+			Returns the DirListing for folder entry or None if the folder was
+			already scanned.
+		"""
+
+		st = stat_entry(entry)
+		dir_key = get_file_key(st)
+
+		with self.dirs_lock:
+			if dir_key in self.seen_dirs:
+				if is_symlink:
+					chain = ancestors
+					while chain:
+						if chain[0] == dir_key:
+							self.symlink_loops += 1
+							print('Symlink loop detected. Skipping', entry.path)
+							return None
+						chain = chain[1]
+					self.dir_aliases_skipped += 1
+				return None
+
+			self.seen_dirs.add(dir_key)
+
+		return DirListing(entry.path, st.st_dev, (dir_key, ancestors))
+
+
+class ListingPool():
+
+	"""
+		Bounded pool of threads listing folders for LibraryScanner.
+
+		When a folder is listed, its inner folders are queued right away, so
+		up to 'threads' folder reads are always in flight. Finished listings
+		are put in the 'finished' queue when one is given.
+	"""
+
+	def __init__(self, scanner, threads, finished=None):
+		self.scanner = scanner
+		self.finished = finished
+		self.tasks = queue.Queue()
+		self.stopped = False
+
+		self.workers = []
+		for _ in range(threads):
+			worker = threading.Thread(target=self.run)
+			worker.daemon = True
+			worker.start()
+			self.workers.append(worker)
+
+	def submit(self, listing):
+		self.tasks.put(listing)
+
+	def run(self):
+		while True:
+			listing = self.tasks.get()
+			if listing is None or self.stopped:
+				return
+
+			try:
+				self.scanner.list_dir(listing)
+				for sub_dir in listing.sub_dirs:
+					self.submit(sub_dir)
+			finally:
+				# Always mark the listing done so the consumer never waits forever.
+				listing.done.set()
+				if self.finished is not None:
+					self.finished.put(listing)
+
+	def stop(self):
+
+		"""
+			Stops the threads. Called when the walk finishes or the consumer
+			stops iterating early.
+		"""
+
+		self.stopped = True
+		for _ in self.workers:
+			self.tasks.put(None)
+
+
+def walk_audio_files(path, extensions=None, threads=1, ordered=True):
+
+	"""
+		Generator which yields paths to all audio files in dir located at path.
+		See LibraryScanner.walk
+	"""
+
+	return LibraryScanner(extensions, threads, ordered).walk(path)
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+"""
+	Contains helpers to split one library across several machines using
+	'lyrico --shard i/n'.
+
+	Each song belongs to exactly one of the n shards, decided by a stable
+	hash of its path relative to 'source_dir'. So hosts which mount the
+	library at different paths still agree on the split, without talking
+	to each other. Songs of a '--from-manifest' run are split the same way,
+	relative to the record's 'source_dir' if it has one. Paths outside of
+	it are hashed as absolute paths.
+
+	Each shard writes its own 'log.shard-i-of-n.txt' along with a
+	'log.shard-i-of-n.json' holding its counters and log lines. 'lyrico merge'
+	combines the JSON files of all shards into a single 'log.txt'.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import re
+import io
+import json
+import hashlib
+
+from .config import Config
+from .helper import replace_file
+
+
+SHARD_LOG_REGEX = re.compile(r'^log\.shard-(\d+)-of-(\d+)\.json$')
+
+
+def parse_shard(value):
+
+	"""
+		Parses the '--shard' value 'i/n' into tuple (i, n).
+		Shards are numbered from 1 to n. Raises ValueError for invalid values.
+	"""
+
+	parts = value.split('/')
+	if len(parts) != 2:
+		raise ValueError(value)
+
+	index, count = int(parts[0]), int(parts[1])
+	if count < 1 or not (1 <= index <= count):
+		raise ValueError(value)
+
+	return (index, count)
+
+
+def get_shard_suffix(shard):
+	"""Returns suffix used in names of files written by shard, '' when not sharding"""
+
+	if not shard:
+		return ''
+	return '.shard-%d-of-%d' % shard
+
+
+def get_shard_index(song_path, source_dir, count):
+	"""Returns the shard, from 1 to count, that song_path belongs to"""
+
+	key = os.path.abspath(song_path)
+	if source_dir:
+		rel_path = os.path.relpath(key, os.path.abspath(source_dir))
+		if rel_path != os.pardir and not rel_path.startswith(os.pardir + os.sep):
+			key = rel_path
+
+	key = key.replace(os.sep, '/')
+	digest = hashlib.md5(key.encode('utf-8')).hexdigest()
+	return int(digest[:8], 16) % count + 1
+
+
+def filter_shard(song_paths, source_dir, shard):
+	"""Generator which only yields song_paths belonging to shard"""
+
+	index, count = shard
+	for song_path in song_paths:
+		if get_shard_index(song_path, source_dir, count) == index:
+			yield song_path
+
+
+def save_shard_results(shard, counts, log_strings):
+	"""Saves counters and log strings of this shard for 'lyrico merge'"""
+
+	data = {
+		'shard': list(shard),
+		'counts': counts,
+		'log_strings': log_strings,
+	}
+
+	path = os.path.join(Config.lyrics_dir, 'log' + get_shard_suffix(shard) + '.json')
+	temp_path = '%s.%d.tmp' % (path, os.getpid())
+	try:
+		with io.open(temp_path, 'w', encoding='utf-8') as f:
+			f.write(json.dumps(data, ensure_ascii=False))
+		replace_file(temp_path, path)
+	except (IOError, OSError) as e:
+		print('Unable to save shard results.')
+		print(e)
+
+
+def merge_shard_logs(write_log):
+
+	"""
+		Combines the results saved by all shards in 'lyrics_dir' into 'log.txt'.
+		write_log is Song.write_log. Returns False if nothing was merged.
+	"""
+
+	try:
+		names = os.listdir(Config.lyrics_dir)
+	except OSError as e:
+		print('Unable to read "lyrics_dir".')
+		print(e)
+		return False
+
+	# shard count -> {shard index: file name}
+	shard_files = {}
+	for name in names:
+		match = SHARD_LOG_REGEX.match(name)
+		if match:
+			index, count = int(match.group(1)), int(match.group(2))
+			shard_files.setdefault(count, {})[index] = name
+
+	if not shard_files:
+		print('No shard results found in', Config.lyrics_dir)
+		return False
+
+	if len(shard_files) > 1:
+		print('Found results of runs split in different number of shards:',
+			', '.join(str(count) for count in sorted(shard_files)))
+		print('Please remove the old "log.shard-*" files and merge again.')
+		return False
+
+	count, files = list(shard_files.items())[0]
+
+	missing = [str(index) for index in range(1, count + 1) if index not in files]
+	if missing:
+		print('Results missing for shards', ', '.join(missing), 'of', count)
+
+	counts = {
+		'detected_count': 0,
+		'valid_metadata_count': 0,
+		'lyrics_saved_to_file_count': 0,
+		'lyrics_saved_to_tag_count': 0,
+	}
+	log_strings = []
+
+	for index in sorted(files):
+		try:
+			with io.open(os.path.join(Config.lyrics_dir, files[index]), 'r', encoding='utf-8') as f:
+				data = json.load(f)
+		except (IOError, ValueError) as e:
+			print('Unable to read results of shard', index)
+			print(e)
+			continue
+
+		for key in counts:
+			counts[key] += data['counts'].get(key, 0)
+		log_strings.extend(data['log_strings'])
+
+	write_log('log.txt', counts, log_strings)
+	print('Merged results of', len(files), 'of', count, 'shards into log.txt')
+	return True
@@ -8,6 +8,7 @@ from __future__ import unicode_literals
 import time
 import sys
 import os
+import threading
 
 from mutagen.id3 import USLT
 from mutagen.asf import ASFUnicodeAttribute
@@ -21,9 +22,30 @@ from .lyrico_sources.az_lyrics import donwload_from_az_lyrics
 from .lyrico_sources.musix_match import donwload_from_musix_match
 from .lyrico_sources.lyricsmode import donwload_from_lyricsmode
 
-from .song_helper import get_song_data, get_song_list
+from .song_helper import get_song_data, open_tag
 from .config import Config
+from .lyrics_catalog import LyricsCatalog
 from .audio_format_keys import FORMAT_KEYS
+from .device_limits import DeviceLimits
+from .hedged_fetch import hedging_enabled, hedged_fetch
+from .source_stats import order_sources, timed_download
+
+# Lyrics sources in fixed order(see source_stats module): (setting in
+# config.ini, download function). Each function takes the Song and sets its lyrics,
+# source and error.
+LYRICS_SOURCES = [
+	('lyric_wikia', donwload_from_lyric_wikia),
+	('lyrics_n_music', donwload_from_lnm),
+	('musix_match', donwload_from_musix_match),
+	('lyricsmode', donwload_from_lyricsmode),
+	('az_lyrics', donwload_from_az_lyrics),
+]
+
+def get_enabled_sources():
+	"""Returns the LYRICS_SOURCES enabled in config.ini, in the order they are tried"""
+
+	return order_sources([(setting, download) for setting, download in LYRICS_SOURCES
+		if getattr(Config, setting)])
 
 # If we are using python27, import codec module and replace native 'open'
 # with 'codec.open' to write unicode strings to file.
@@ -33,9 +55,18 @@ if sys.version_info[0] < 3:
     open = codecs.open
 
 
-class Song():
+class Song(object):
 	"""Container objects repersenting each song globbed from source_dir"""
 
+	# Songs are kept until the log is written, so use slots instead of a
+	# __dict__ per song. Only small fields are kept, the tag is opened in
+	# save_lyrics and lyrics are released once saved.
+	__slots__ = (
+		'path', 'artist', 'title', 'album', 'format',
+		'lyrics_file_path', 'lyrics_file_present', 'lyrics_tag_present',
+		'lyrics', 'saved_to_tag', 'saved_to_file', 'source', 'error',
+	)
+
 	# holds count for songs for valid metadata
 	valid_metadata_count = 0
 
@@ -45,21 +76,25 @@ class Song():
 	# Count for songs whose lyrics are successfully saved to tag.
 	lyrics_saved_to_tag_count = 0
 
-	def __init__(self, path):
+	# Songs are saved by several threads in the pipeline(see pipeline module).
+	# Guards the counters above.
+	counts_lock = threading.Lock()
+
+	def __init__(self, path, data=None):
 
 		self.path = path
 
-		# extract data from song
-		data = get_song_data(path)
+		# extract data from song, unless it is already known(ex. from a manifest)
+		if data is None:
+			data = get_song_data(path)
 
-		# Initialize instance variables from data extracted
-		self.tag = data['tag']
+		# Initialize instance variables from data extracted. The tag itself
+		# is not kept, it is opened in save_lyrics when needed.
 		self.artist = data['artist']
 		self.title = data['title']
 		self.album = data['album']
 		self.format = data['format']
 
-		self.lyrics_file_name = data['lyrics_file_name']
 		self.lyrics_file_path = data['lyrics_file_path']
 
 		# If the required lyrics file is already present in LYRICS_DIR
@@ -91,38 +126,50 @@ class Song():
 
 		"""
 
-		if not self.download_required():
-			print('\nSkipping', self.artist, '-', self.title)
-			print('Lyrics already present.')
-			return
+		if self.fetch_lyrics():
+			self.save_lyrics()
 
-		# At this point there is nothing in self.error
-		print('\nDownloading:', self.artist, '-', self.title)
+	def fetch_lyrics(self):
 
-		# Use sources according to user settings
-		if Config.lyric_wikia:
-			donwload_from_lyric_wikia(self)
+		"""
+			Only called when song has artist and title. Downloads lyrics
+			from the sources, without saving them. Returns False if the
+			download is not required.
 
-		# Only try other sources if required
+		"""
+
+		if not self.start_fetch():
+			return False
+
+		# Ask several sources at once(see hedged_fetch module).
+		if hedging_enabled():
+			hedged_fetch(self, get_enabled_sources())
+			return True
 
-		if not self.lyrics and Config.lyrics_n_music:
-			donwload_from_lnm(self)
+		# Use sources according to user settings. Only try other sources
+		# if required.
+		for setting, download in get_enabled_sources():
+			if not self.lyrics:
+				timed_download(setting, download, self)
 
-		if not self.lyrics and Config.musix_match:
-			donwload_from_musix_match(self)
+		return True
 
-		if not self.lyrics and Config.lyricsmode:
-			donwload_from_lyricsmode(self)
+	def start_fetch(self):
+		"""Logs the start of the download. Returns False if it is not required."""
 
-		if not self.lyrics and Config.az_lyrics:
-			donwload_from_az_lyrics(self)
+		if not self.download_required():
+			print('\nSkipping', self.artist, '-', self.title)
+			print('Lyrics already present.')
+			return False
 
-		self.save_lyrics()
+		# At this point there is nothing in self.error
+		print('\nDownloading:', self.artist, '-', self.title)
+		return True
 
 	def save_lyrics(self):
 
 		"""
-			Called by self.download_lyrics to save lyrics according to
+			Called after self.fetch_lyrics to save lyrics according to
 			Config.save_to_file, Config.save_to_tag settings.
 
 			Handles the case if lyrics is not found. Logs errors to console
@@ -136,6 +183,17 @@ class Song():
 
 		if self.lyrics and Config.save_to_file:
 			try:
+				# Create the folder for the lyrics file when 'lyrics_dir' uses
+				# the 'letter' or 'hash' layout.
+				lyrics_file_dir = os.path.dirname(self.lyrics_file_path)
+				if lyrics_file_dir != Config.lyrics_dir and not os.path.isdir(lyrics_file_dir):
+					try:
+						os.makedirs(lyrics_file_dir)
+					except OSError:
+						# Created by another save thread in the meantime
+						if not os.path.isdir(lyrics_file_dir):
+							raise
+
 				with open(self.lyrics_file_path, 'w', encoding='utf-8') as f:
 					f.write('Artist - ' + self.artist + '\n')
 					f.write('Title - ' + self.title + '\n')
@@ -149,14 +207,19 @@ class Song():
 					f.write(self.lyrics)
 
 				# update class variable
-				Song.lyrics_saved_to_file_count += 1
+				with Song.counts_lock:
+					Song.lyrics_saved_to_file_count += 1
+
+				# Keep the catalog current for songs processed later in the
+				# same run(ex. 'lyrico watch') and for the next run.
+				LyricsCatalog.get_catalog().add(self.lyrics_file_path)
 
 				# update the Song instance flag
 				self.saved_to_file = True
 
 				print('Success: Lyrics saved to file.')
 
-			except IOError as e:
+			except (IOError, OSError) as e:
 				err_str = str(e)
 				if e.errno == 22:
 					err_str = 'Cannot save lyrics to file. Unable to create file with song metadata.'
@@ -171,9 +234,17 @@ class Song():
 		if self.lyrics and Config.save_to_tag:
 			lyrics_key = FORMAT_KEYS[self.format]['lyrics']
 			try:
+				# Open the full tag only now, so embedded artwork and other
+				# frames are written back unchanged, and freed once saved.
+				# Reads and saves wait for the device(see device_limits module).
+				with DeviceLimits.get_limits().slot(self.path):
+					tag, tag_error = open_tag(self.path, self.format)
+				if tag is None:
+					raise MutagenError(tag_error)
+
 				if self.format == 'mp3':
 					# encoding = 3 for UTF-8
-					self.tag.add(USLT(encoding=3, lang = u'eng', desc = u'lyrics.wikia',
+					tag.add(USLT(encoding=3, lang = u'eng', desc = u'lyrics.wikia',
 									text=self.lyrics))
 
 				if self.format == 'm4a' or self.format == 'mp4':
@@ -181,21 +252,23 @@ class Song():
 					
 					if sys.version_info[0] < 3:
 						lyrics_key = lyrics_key.encode('latin-1')
-					self.tag[lyrics_key] = self.lyrics
+					tag[lyrics_key] = self.lyrics
 
 				# Both flac and ogg/oga(Vorbis & FLAC), are being read/write as Vorbis Comments.
 				# Vorbis Comments don't have a standard 'lyrics' tag. The 'LYRICS' tag is 
 				# most common non-standard tag used for lyrics.
 				if self.format == 'flac' or self.format == 'ogg' or self.format == 'oga':
-					self.tag[lyrics_key] = self.lyrics
+					tag[lyrics_key] = self.lyrics
 
 				if self.format == 'wma':
 					# ASF Format uses ASFUnicodeAttribute objects instead of Python's Unicode
-					self.tag[lyrics_key] = ASFUnicodeAttribute(self.lyrics)
+					tag[lyrics_key] = ASFUnicodeAttribute(self.lyrics)
 
-				self.tag.save()
+				with DeviceLimits.get_limits().slot(self.path):
+					tag.save()
 				self.saved_to_tag = True
-				Song.lyrics_saved_to_tag_count += 1
+				with Song.counts_lock:
+					Song.lyrics_saved_to_tag_count += 1
 
 				print('Success: Lyrics saved to tag.')
 
@@ -209,6 +282,10 @@ class Song():
 				self.error = err_str
 				print('Failed:', err_str)
 
+		# Lyrics are saved. Release them, the song itself is kept until the
+		# log is written.
+		self.lyrics = None
+
 	def download_required(self):
 		"""
 		Checks if a lyrics are required to be download.
@@ -295,11 +372,28 @@ class Song():
 		return template.format(**log)
 
 	@staticmethod
-	def log_results(song_list):
+	def get_counts(detected_count):
+		"""
+		returns the counters shown at the top of the log as a dict.
+
+		"""
+		return {
+			'detected_count': detected_count,
+			'valid_metadata_count': Song.valid_metadata_count,
+			'lyrics_saved_to_file_count': Song.lyrics_saved_to_file_count,
+			'lyrics_saved_to_tag_count': Song.lyrics_saved_to_tag_count,
+		}
+
+	@staticmethod
+	def write_log(log_file_name, counts, log_strings):
+		"""
+		writes the log file in 'lyrics_dir' from counts(see get_counts)
+		and log strings of the songs(see get_log_string).
+
+		"""
 
 		try:
 			log_date = time.strftime("%H:%M:%S  %d/%m/%y")
-			log_file_name = 'log.txt'
 			with open(os.path.join(Config.lyrics_dir, log_file_name), 'w', encoding='utf-8') as f:
 				
 				f.write('\t\t\t\tlyrico\n\n')
@@ -307,16 +401,19 @@ class Song():
 				f.write('Log Date ' + log_date + '\n')
 				f.write('\n')
 
-				f.write('Audio files detected: ' + str(len(song_list)))
+				f.write('Audio files detected: ' + str(counts['detected_count']))
+				f.write('\n')
+
+				f.write('Metadata extracted for: ' + str(counts['valid_metadata_count']))
 				f.write('\n')
 
-				f.write('Metadata extracted for: ' + str(Song.valid_metadata_count))
+				f.write('Lyrics files saved: ' + str(counts['lyrics_saved_to_file_count']))
 				f.write('\n')
 
-				f.write('Lyrics files saved: ' + str(Song.lyrics_saved_to_file_count))
+				f.write('Tags saved: ' + str(counts['lyrics_saved_to_tag_count']))
 				f.write('\n')
 
-				f.write('Tags saved: ' + str(Song.lyrics_saved_to_tag_count))
+				f.write('Lyrics files layout: ' + Config.lyrics_layout)
 				f.write('\n\n')
 
 				table_header = '  \t[FILE]\t[TAG]\t[SOURCE]\t\t\t[ARTIST-TITLE]\t\t\t\t[ERROR]\n'
@@ -327,9 +424,9 @@ class Song():
 
 				# write individual song log strings
 				index_number = 1
-				for song in song_list:
+				for log_string in log_strings:
 					f.write(str(index_number))
-					f.write(song.get_log_string())
+					f.write(log_string)
 					index_number += 1
 
 				# Add STATUS KEY to log
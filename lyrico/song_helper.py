@@ -9,8 +9,8 @@ from __future__ import unicode_literals
 
 import sys
 import os
-import glob2
-import platform
+import io
+import json
 
 try:
 	from urllib.parse  import quote
@@ -29,6 +29,14 @@ from mutagen import MutagenError
 from .config import Config
 from .helper import sanitize_data
 from .audio_format_keys import FORMAT_KEYS
+from .lyrics_catalog import LyricsCatalog
+from .lyrics_layout import get_lyrics_file_path
+from .tag_probe import probe_tag
+from .codec_sniff import sniff_codec, get_format, UNSUPPORTED_CODECS
+from .metadata_cache import MetadataCache
+from .scan_manifest import ScanManifest
+from .device_limits import DeviceLimits
+from .read_order import advise_paths
 
 
 def get_key(tag, key, format):
@@ -150,18 +158,50 @@ def extract_ogg_tag(path):
 
 	return (ogg_tag, error)
 
-def get_song_data(path):
-	
-	""" 
-		Extracts song artist, album, title and lyrics if present 
-		from audio file.
+def open_tag(path, song_format, codec=None):
 
-		This is method is called by constructor of Song class which uses
-		the dict returned to instantiate song objects.
+	"""
+		Reads the tag of audio file at path with mutagen, using the class
+		for song_format. Returns a tuple (tag, error).
 
-		'path' is the absolute path to the audio file.  
+		codec(see codec_sniff.sniff_codec) picks the class for .ogg/.oga
+		files. It is sniffed when not given.
+
+		Raises IOError and MutagenError like the mutagen classes.
+	"""
+
+	if song_format == 'mp3':
+		return (ID3(path), None)
+	if song_format == 'mp4' or song_format == 'm4a':
+		return (MP4(path), None)
+	if song_format == 'flac':
+		return (FLAC(path), None)
+	if song_format == 'wma':
+		return (ASF(path), None)
+	if song_format == 'ogg' or song_format == 'oga':
+		if codec is None:
+			codec = sniff_codec(path)
+		if codec == 'ogg-vorbis':
+			return (OggVorbis(path), None)
+		if codec == 'ogg-flac':
+			return (OggFLAC(path), None)
+		if codec in UNSUPPORTED_CODECS:
+			return (None, UNSUPPORTED_CODECS[codec])
+		# Not an Ogg file at all. Try both codecs.
+		return extract_ogg_tag(path)
+
+	return (None, 'Unsupported audio format.')
+
+def read_song_metadata(path):
+
+	"""
+		Reads the tag of audio file at path and returns a plain dict with
+		'artist', 'title', 'album', 'format', 'lyrics_tag_present' and 'error'.
+
+		The mutagen tag is dropped once these are read, so embedded artwork
+		(often several MB per song) is never kept in memory. Song.save_lyrics
+		opens the tag again, in full, when lyrics are saved to it.
 	"""
-	data = {}
 
 	tag = None
 	artist = None
@@ -169,12 +209,6 @@ def get_song_data(path):
 	album = None
 	lyrics = None
 	song_format = None
-	
-	lyrics_file_name = None
-	lyrics_file_path = None
-
-	lyrics_file_present = False
-	lyrics_tag_present = False
 
 	error = None
 
@@ -182,38 +216,128 @@ def get_song_data(path):
 	# only use lowercase for formats
 	song_format = path[ path.rfind('.') + 1 : ].lower()
 
-
+	# Read files with the class matching their content, which can differ
+	# from the extension.
 	try:
-		if song_format == 'mp3':
-			tag = ID3(path)
-		if song_format == 'mp4' or song_format == 'm4a':
-			tag = MP4(path)
-		if song_format == 'flac':
-			tag = FLAC(path)
-		if song_format == 'wma':
-			tag = ASF(path)
-		if song_format == 'ogg' or song_format == 'oga':
-			tag, error = extract_ogg_tag(path)
+		codec = sniff_codec(path)
 	except IOError:
-		error = 'Unable to locate the file. Could have been moved during operation.'
-	except MutagenError:
-		error = 'Unable to read metadata. Unsupported codec or tag does not exist.'
-	except Exception as e:
-		error = str(e)
-		print(e)
+		# The error is logged when the tag is read below.
+		codec = None
+	song_format = get_format(song_format, codec)
+
+	# The probe only reads the fields needed here, without building the
+	# mutagen tag. It returns None for files it leaves to mutagen.
+	fields = None
+	if Config.tag_probe and codec not in UNSUPPORTED_CODECS:
+		fields = probe_tag(path, song_format)
+
+	if codec in UNSUPPORTED_CODECS:
+		# Not worth parsing, lyrico can't save lyrics to these.
+		error = UNSUPPORTED_CODECS[codec]
+	elif fields is not None:
+		artist = sanitize_data(fields['artist'])
+		title = sanitize_data(fields['title'])
+		album = sanitize_data(fields['album'])
+		lyrics = sanitize_data(fields['lyrics'])
 	else:
-		# This only runs if reading tags creates no exceptions
-		artist = get_key(tag, FORMAT_KEYS[song_format]['artist'], song_format)
-		title = get_key(tag, FORMAT_KEYS[song_format]['title'], song_format)
-		album = get_key(tag, FORMAT_KEYS[song_format]['album'], song_format)
-		lyrics = get_key(tag, FORMAT_KEYS[song_format]['lyrics'], song_format)
+		try:
+			tag, error = open_tag(path, song_format, codec)
+		except IOError:
+			error = 'Unable to locate the file. Could have been moved during operation.'
+		except MutagenError:
+			error = 'Unable to read metadata. Unsupported codec or tag does not exist.'
+		except Exception as e:
+			error = str(e)
+			print(e)
+		else:
+			# This only runs if reading tags creates no exceptions
+			if tag:
+				artist = get_key(tag, FORMAT_KEYS[song_format]['artist'], song_format)
+				title = get_key(tag, FORMAT_KEYS[song_format]['title'], song_format)
+				album = get_key(tag, FORMAT_KEYS[song_format]['album'], song_format)
+				lyrics = get_key(tag, FORMAT_KEYS[song_format]['lyrics'], song_format)
+
+	metadata = {
+		'artist': artist,
+		'title': title,
+		'album': album,
+		'format': song_format,
+
+		# check if lyrics already embedded in tag
+		'lyrics_tag_present': bool(lyrics),
+
+		'error': error,
+	}
+
+	return metadata
+
+def read_song_metadata_only(item):
+
+	"""
+		Returns (path, signature, metadata) for item (path, signature, metadata,
+		next_paths). Tags are only read when metadata is None(not cached).
+		next_paths are advised to be read ahead first. Used by worker processes.
+	"""
+
+	path, signature, metadata, next_paths = item
+	advise_paths(next_paths)
+	if metadata is None:
+		# Wait for the device of the song(see device_limits module).
+		with DeviceLimits.get_limits().slot(path):
+			metadata = read_song_metadata(path)
+	return (path, signature, metadata)
+
+def get_song_data(path):
+	
+	""" 
+		Extracts song artist, album, title and lyrics if present 
+		from audio file.
+
+		This is method is called by constructor of Song class which uses
+		the dict returned to instantiate song objects.
+
+		'path' is the absolute path to the audio file.  
+	"""
+
+	cache = MetadataCache.get_cache()
+	if cache is None:
+		return build_song_data(read_song_metadata(path))
+
+	# Unchanged files are not opened at all.
+	signature = ScanManifest.get_signature(path)
+	metadata = cache.get(path, signature)
+	if metadata is not None:
+		return build_song_data(metadata)
+
+	metadata = read_song_metadata(path)
+	cache.put(path, signature, metadata)
+	return build_song_data(metadata)
+
+def build_song_data(metadata):
+
+	"""
+		Builds the dict used to instantiate Song objects from the metadata
+		of the song(see read_song_metadata). Adds the lyrics file name and
+		path and checks if the lyrics file is already present.
+	"""
+
+	artist = metadata['artist']
+	title = metadata['title']
+	error = metadata['error']
+
+	data = {}
+
+	lyrics_file_name = None
+	lyrics_file_path = None
+
+	lyrics_file_present = False
 
 	# build wikia URL, filename and filepath
 	# If tag is not read or either of artist name or title is not preset
 	# those properties of the Song object would be intialized to None
 	if artist and title:
 		lyrics_file_name = '%s - %s.txt' % (artist, title)
-		lyrics_file_path = os.path.join(Config.lyrics_dir, lyrics_file_name)
+		lyrics_file_path = get_lyrics_file_path(lyrics_file_name)
 	else:
 		# Only log the following error if the tags have been read correctly but
 		# artist or title was simply not present in the tag.
@@ -222,50 +346,88 @@ def get_song_data(path):
 			error = 'Artist name or song title not found.'
 
 
-	# check if lyrics file already exists in LYRICS_DIR
-	if lyrics_file_path in Config.lyric_files_in_dir:
-		lyrics_file_present = True
-
-	# check if lyrics already embedded in tag
-	if lyrics:
-		lyrics_tag_present = True
+	# check if lyrics file already exists in LYRICS_DIR. The catalog is only
+	# needed, and built, when lyrics are saved to files.
+	if lyrics_file_path and Config.save_to_file:
+		lyrics_file_present = LyricsCatalog.get_catalog().contains(lyrics_file_path)
 
 	# build dict
-	data['tag'] = tag
 	data['artist'] = artist
 	data['title'] = title
-	data['album'] = album
-	data['format'] = song_format
+	data['album'] = metadata['album']
+	data['format'] = metadata['format']
 
 	data['lyrics_file_name'] = lyrics_file_name
 	data['lyrics_file_path'] = lyrics_file_path
 
 	data['lyrics_file_present'] = lyrics_file_present
-	data['lyrics_tag_present'] = lyrics_tag_present
+	data['lyrics_tag_present'] = metadata['lyrics_tag_present']
 
 	data['error'] = error
 
 	return data
 
-def get_song_list(path):
+def read_manifest_records(source):
 
-	""" Return list of paths to all valid audio files in dir located at path.
-		Valid audio formats are imported from settings module.
-		Also checks for any inner directories."""
+	"""
+		Generator which yields records from a JSON lines manifest of songs.
+		source is the path to the file or '-' to read from stdin.
 
-	song_list = []
+		Each line is an object with the 'path' of the audio file and optional
+		'artist', 'title', 'album' and 'lyrics_tag_present'. An optional
+		'source_dir' is the library the path belongs to, used for '--shard'.
+	"""
 
-	for ext in Config.audio_formats:
-		pattern = '**/*.' + ext
-		pattern_uppercase = '**/*.' + ext.upper()
+	if source == '-':
+		f = io.open(sys.stdin.fileno(), 'r', encoding='utf-8', closefd=False)
+	else:
+		f = io.open(source, 'r', encoding='utf-8')
+
+	with f:
+		for line_number, line in enumerate(f, 1):
+			line = line.strip()
+			if not line:
+				continue
+			try:
+				record = json.loads(line)
+				if not record.get('path'):
+					raise ValueError('"path" is missing')
+			except (ValueError, AttributeError) as e:
+				print('Skipping invalid manifest line', line_number, '-', e)
+				continue
+			yield record
+
+def get_manifest_song_data(record):
+
+	"""
+		Returns the dict used to instantiate Song objects from a manifest record.
+
+		When the record has both artist and title, the audio file is not
+		opened at all. Only when lyrics are saved to tags without 'overwrite'
+		and the record does not tell if lyrics are already in the tag,
+		the tag still has to be read.
+	"""
+
+	path = record['path']
+	artist = sanitize_data(record.get('artist'))
+	title = sanitize_data(record.get('title'))
+	lyrics_tag_present = record.get('lyrics_tag_present')
 
-		song_list.extend(glob2.glob(os.path.join(path, pattern)))
+	tag_check_required = (Config.save_to_tag and not Config.overwrite and
+		lyrics_tag_present is None)
+
+	song_format = path[ path.rfind('.') + 1 : ].lower()
 
-		# Windows is case-insensitive towards extensions. So the glob2 module detects
-		# ex. .ogg and .OGG as well. But in Linux the extensions are case-sensitive.
+	if not (artist and title) or tag_check_required or song_format not in FORMAT_KEYS:
+		return get_song_data(path)
 
-		# Add detection for uppercase extensions
-		if platform.system() == 'Linux':
-			song_list.extend(glob2.glob(os.path.join(path, pattern_uppercase)))
+	metadata = {
+		'artist': artist,
+		'title': title,
+		'album': sanitize_data(record.get('album')),
+		'format': song_format,
+		'lyrics_tag_present': bool(lyrics_tag_present),
+		'error': None,
+	}
 
-	return song_list
\ No newline at end of file
+	return build_song_data(metadata)
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+
+"""
+	Contains the SourceStats class which learns the order in which lyrics
+	sources are tried.
+
+	For each source the number of lookups, the number of hits and a
+	histogram of their latency are kept in the lyrico state folder. Sources
+	are tried in order of their expected time per lyrics found:
+
+		mean latency / hit rate
+
+	which finds lyrics soonest when sources are asked one after another.
+	Sources without stats start at a 50% hit rate and 1 second. Stats are
+	halved once a source has MAX_LOOKUPS, so recent runs weigh the most.
+	A fraction of songs("source_exploration") tries the sources in random
+	order, so a source which got better is noticed.
+
+	"source_order" in config.ini:
+
+		- 'adaptive' - order by stats as above
+		- 'fixed' - the order of song.LYRICS_SOURCES
+		- a comma separated list of sources, ex. 'musix_match, az_lyrics',
+		  tried first in that order. The others follow in fixed order.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import io
+import json
+import time
+import random
+import threading
+
+from .config import Config, SOURCE_STR_MAP
+from .helper import replace_file
+from .lyrico_sources.rate_limits import get_throttled_count
+
+
+SOURCE_ORDERS = ('adaptive', 'fixed')
+
+# Upper bounds of the latency histogram buckets in seconds. The last
+# bucket holds slower lookups.
+LATENCY_BUCKETS = [0.1, 0.25, 0.5, 1, 2, 5, 10]
+
+# Assumed for sources without stats
+PRIOR_HIT_RATE = 0.5
+PRIOR_LATENCY = 1.0
+
+MAX_LOOKUPS = 2000
+
+
+def get_pinned_sources(source_order):
+	"""Returns the sources listed in "source_order", None if it is not a list"""
+
+	if source_order in SOURCE_ORDERS:
+		return None
+	return [name.strip() for name in source_order.split(',') if name.strip()]
+
+
+def is_valid_source_order(source_order):
+	pinned = get_pinned_sources(source_order)
+	return pinned is None or (bool(pinned) and all(name in SOURCE_STR_MAP for name in pinned))
+
+
+def order_sources(sources):
+
+	"""
+		Returns sources, a list of (setting, download function) in fixed
+		order, in the order they are to be tried for a song.
+	"""
+
+	source_order = Config.source_order
+	if source_order == 'fixed':
+		return sources
+
+	pinned = get_pinned_sources(source_order)
+	if pinned is not None:
+		# sorted is stable, sources not listed keep their fixed order.
+		return sorted(sources, key=lambda source:
+			pinned.index(source[0]) if source[0] in pinned else len(pinned))
+
+	if random.random() < Config.source_exploration:
+		sources = list(sources)
+		random.shuffle(sources)
+		return sources
+
+	return SourceStats.get_stats().order(sources)
+
+
+def timed_download(setting, download, song):
+	"""Calls download for song and records the lookup in SourceStats"""
+
+	throttled_count = get_throttled_count()
+	start = time.time()
+	download(song)
+
+	# A throttled lookup says nothing about the lyrics the source has.
+	if get_throttled_count() == throttled_count:
+		SourceStats.get_stats().record(setting, bool(song.lyrics), time.time() - start)
+
+
+class SourceStats():
+
+	"""
+		Lookups, hits and latency histogram per source. Saved as JSON in the
+		lyrico state folder.
+	"""
+
+	stats_file_name = 'source_stats.json'
+	stats_version = 1
+
+	# Stats for Config.lyrics_dir used by the current run. See get_stats.
+	current = None
+
+	def __init__(self, lyrics_dir, state_path=None):
+		self.lyrics_dir = lyrics_dir
+		self.state_path = state_path
+
+		# setting -> {'lookups', 'hits', 'latency'(sum), 'histogram'}
+		self.sources = {}
+
+		# Set when lookups were recorded since the stats were loaded.
+		self.modified = False
+
+		# Lookups are recorded by the fetch threads.
+		self.lock = threading.Lock()
+
+	@staticmethod
+	def get_stats():
+		"""Returns the SourceStats for Config.lyrics_dir, loading them the first time"""
+
+		stats = SourceStats.current
+		if stats is None or stats.lyrics_dir != Config.lyrics_dir:
+			state_path = None
+			try:
+				if Config.lyrics_dir:
+					state_path = Config.get_state_path(SourceStats.stats_file_name)
+			except OSError:
+				# 'lyrics_dir' does not exist. Stats are kept for this run only.
+				pass
+			stats = SourceStats(Config.lyrics_dir, state_path)
+			stats.load()
+			SourceStats.current = stats
+		return stats
+
+	def load(self):
+		if not self.state_path:
+			return
+		try:
+			with io.open(self.state_path, 'r', encoding='utf-8') as f:
+				saved = json.load(f)
+			if saved.get('version') == SourceStats.stats_version:
+				self.sources = saved.get('sources', {})
+		except (IOError, ValueError):
+			pass
+
+	def get_source(self, setting):
+		source = self.sources.get(setting)
+		if source is None:
+			source = {
+				'lookups': 0,
+				'hits': 0,
+				'latency': 0.0,
+				'histogram': [0] * (len(LATENCY_BUCKETS) + 1),
+			}
+			self.sources[setting] = source
+		return source
+
+	def record(self, setting, hit, latency):
+		"""Called after each lookup of a source"""
+
+		bucket = len(LATENCY_BUCKETS)
+		for index, bound in enumerate(LATENCY_BUCKETS):
+			if latency <= bound:
+				bucket = index
+				break
+
+		with self.lock:
+			source = self.get_source(setting)
+			if source['lookups'] >= MAX_LOOKUPS:
+				source['lookups'] //= 2
+				source['hits'] //= 2
+				source['latency'] /= 2
+				source['histogram'] = [count // 2 for count in source['histogram']]
+
+			source['lookups'] += 1
+			source['hits'] += hit
+			source['latency'] += latency
+			source['histogram'][bucket] += 1
+			self.modified = True
+
+	def get_cost(self, setting):
+		"""Returns expected seconds per lyrics found by the source"""
+
+		source = self.sources.get(setting)
+		if not source or not source['lookups']:
+			return PRIOR_LATENCY / PRIOR_HIT_RATE
+
+		# A single prior lookup keeps sources with few lookups, or no hits,
+		# from being ordered by chance.
+		lookups = source['lookups'] + 1
+		hit_rate = (source['hits'] + PRIOR_HIT_RATE) / float(lookups)
+		latency = (source['latency'] + PRIOR_LATENCY) / lookups
+		return latency / hit_rate
+
+	def order(self, sources):
+		"""Returns sources sorted by get_cost, cheapest first"""
+
+		with self.lock:
+			costs = dict((setting, self.get_cost(setting)) for setting, download in sources)
+		return sorted(sources, key=lambda source: costs[source[0]])
+
+	def get_percentile(self, setting, fraction):
+		"""Returns upper bound of the latency bucket holding fraction of the lookups"""
+
+		source = self.sources[setting]
+		needed = source['lookups'] * fraction
+		counted = 0
+		for index, count in enumerate(source['histogram']):
+			counted += count
+			if counted >= needed:
+				break
+		return LATENCY_BUCKETS[index] if index < len(LATENCY_BUCKETS) else None
+
+	def print_stats(self):
+		"""Prints the stats of all sources, cheapest first, if any were used in this run"""
+
+		if not self.modified:
+			return
+
+		print('\nSource stats(hit rate, median and 90th percentile latency):')
+		for setting in sorted(self.sources, key=self.get_cost):
+			source = self.sources[setting]
+			if not source['lookups']:
+				continue
+
+			percentiles = []
+			for fraction in (0.5, 0.9):
+				bound = self.get_percentile(setting, fraction)
+				percentiles.append('<%gs' % bound if bound is not None else '>%gs' % LATENCY_BUCKETS[-1])
+
+			print('\t%-13s %5.1f%% of %d  %s  %s' % (SOURCE_STR_MAP.get(setting, setting),
+				100.0 * source['hits'] / source['lookups'], source['lookups'],
+				percentiles[0], percentiles[1]))
+
+	def save(self):
+		if not self.modified or not self.state_path:
+			return
+
+		data = {
+			'version': SourceStats.stats_version,
+			'sources': self.sources,
+		}
+
+		temp_path = '%s.%d.tmp' % (self.state_path, os.getpid())
+		try:
+			with self.lock:
+				with io.open(temp_path, 'w', encoding='utf-8') as f:
+					f.write(json.dumps(data, ensure_ascii=False))
+			replace_file(temp_path, self.state_path)
+			self.modified = False
+		except (IOError, OSError) as e:
+			print('Unable to save source stats.')
+			print(e)
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+"""
+	Contains the StreamingLog class which collects the log strings of songs
+	as they finish, so Song objects don't have to be kept until the end of
+	the run to build the log.
+
+	Log strings are spooled to a temporary file, one JSON string per line,
+	and read back once when the log is written.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import json
+import tempfile
+
+from .song import Song
+from .shards import get_shard_suffix, save_shard_results
+
+
+class StreamingLog():
+
+	def __init__(self, shard=None):
+		self.shard = shard
+		self.count = 0
+		self.spool = tempfile.TemporaryFile()
+
+	def add(self, song):
+		"""Called for each song once it is processed"""
+
+		self.add_log_string(song.get_log_string())
+
+	def add_log_string(self, log_string):
+		"""Adds a log string built earlier(ex. by an interrupted run)"""
+
+		line = json.dumps(log_string) + '\n'
+		self.spool.write(line.encode('utf-8'))
+		self.count += 1
+
+	def flush(self):
+		"""Moves the buffered log strings out of lyrico's memory"""
+
+		self.spool.flush()
+
+	def iter_log_strings(self):
+		"""Generator which yields the log strings in the order songs were added"""
+
+		self.spool.seek(0)
+		for line in self.spool:
+			yield json.loads(line.decode('utf-8'))
+
+	def close(self):
+		"""Writes the log file(and shard results) and removes the spool"""
+
+		counts = Song.get_counts(self.count)
+		try:
+			if self.shard:
+				# 'lyrico merge' needs the log strings of the shard in one file.
+				log_strings = list(self.iter_log_strings())
+				Song.write_log('log' + get_shard_suffix(self.shard) + '.txt', counts, log_strings)
+				save_shard_results(self.shard, counts, log_strings)
+			else:
+				Song.write_log('log.txt', counts, self.iter_log_strings())
+		finally:
+			self.spool.close()
@@ -0,0 +1,576 @@
+# -*- coding: utf-8 -*-
+
+"""
+	Contains a light weight reader for the tags of the supported formats.
+
+	To decide if a song needs lyrics, lyrico only needs the artist, title,
+	album and whether lyrics are already present. mutagen builds the full
+	tag object(every frame, artwork included) for that. The probe maps the
+	file and only walks the parts holding those four fields:
+
+	- mp3: the ID3v2 header and frames
+	- flac: the VORBIS_COMMENT metadata block
+	- ogg/oga: the comment header packet of Ogg Vorbis streams
+	- mp4/m4a: the 'moov.udta.meta.ilst' atom
+	- wma: the content description objects of the ASF header
+
+	Pages of the file which are not touched are never read from disk. When
+	the probe finds anything it does not handle exactly like mutagen
+	(compressed or unsynchronised frames, ID3v1 tags, other Ogg codecs,
+	non text values...) it returns None and the tag is read with mutagen.
+	Tags are always written with mutagen.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import io
+import mmap
+import struct
+import uuid
+
+
+# Keys read from Vorbis comments for lyrics, in order. Same as song_helper.get_key
+VORBIS_LYRICS_KEYS = ['lyrics', 'unsyncedlyrics', 'unsynced lyrics', 'synced lyrics']
+
+# ID3v2.2 frame ids of the frames read, with the ID3v2.3/4 id mutagen upgrades them to.
+ID3_V22_FRAMES = {
+	b'TP1': b'TPE1',
+	b'TT2': b'TIT2',
+	b'TAL': b'TALB',
+	b'ULT': b'USLT',
+}
+
+ID3_TEXT_FRAMES = {
+	b'TPE1': 'artist',
+	b'TIT2': 'title',
+	b'TALB': 'album',
+}
+
+# Frame text encodings of ID3v2
+ID3_ENCODINGS = ['latin-1', 'utf-16', 'utf-16-be', 'utf-8']
+
+MP4_ITEMS = {
+	b'\xa9ART': 'artist',
+	b'\xa9nam': 'title',
+	b'\xa9alb': 'album',
+	b'\xa9lyr': 'lyrics',
+}
+
+ASF_ATTRIBUTES = {
+	'Author': 'artist',
+	'Title': 'title',
+	'WM/AlbumTitle': 'album',
+	'WM/Lyrics': 'lyrics',
+}
+
+ASF_HEADER_OBJECT = uuid.UUID('75B22630-668E-11CF-A6D9-00AA0062CE6C').bytes_le
+ASF_CONTENT_DESCRIPTION = uuid.UUID('75B22633-668E-11CF-A6D9-00AA0062CE6C').bytes_le
+ASF_EXTENDED_CONTENT_DESCRIPTION = uuid.UUID('D2D0A440-E307-11D2-97F0-00A0C95EA850').bytes_le
+ASF_HEADER_EXTENSION = uuid.UUID('5FBF03B5-A92E-11CF-8EE3-00C00C205365').bytes_le
+ASF_METADATA = uuid.UUID('C5F8CBEA-5BAF-4877-8467-AA8C44FA4CCA').bytes_le
+ASF_METADATA_LIBRARY = uuid.UUID('44231C94-9498-49D1-A141-1D134E457054').bytes_le
+
+# mutagen lists ASF attributes grouped by the object they were read from, in this order.
+ASF_OBJECTS_ORDER = [ASF_CONTENT_DESCRIPTION, ASF_EXTENDED_CONTENT_DESCRIPTION,
+	ASF_METADATA, ASF_METADATA_LIBRARY]
+
+
+class ProbeError(Exception):
+	"""Raised when the probe can not read a tag the same way as mutagen"""
+	pass
+
+
+def probe_tag(path, song_format):
+
+	"""
+		Returns a dict with the 'artist', 'title', 'album' and 'lyrics' of
+		the audio file at path, each None when not present in its tag.
+
+		Returns None if the file must be read with mutagen instead.
+	"""
+
+	probe = PROBES.get(song_format)
+	if probe is None:
+		return None
+
+	try:
+		with io.open(path, 'rb') as f:
+			# Mapping the whole file is cheap, pages are only read when used.
+			mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+	except (IOError, OSError, ValueError):
+		# Missing or empty files. mutagen logs the proper error.
+		return None
+
+	fields = {
+		'artist': None,
+		'title': None,
+		'album': None,
+		'lyrics': None,
+	}
+
+	try:
+		probe(mm, fields)
+	except (ProbeError, struct.error, ValueError, IndexError):
+		# ValueError includes UnicodeDecodeError
+		return None
+	finally:
+		mm.close()
+
+	return fields
+
+
+def read_syncsafe(data):
+	"""Returns int stored in 4 bytes, 7 bits each, as in ID3v2 sizes"""
+
+	b = struct.unpack(str('>4B'), data)
+	if (b[0] | b[1] | b[2] | b[3]) & 0x80:
+		raise ProbeError('not syncsafe')
+	return (b[0] << 21) | (b[1] << 14) | (b[2] << 7) | b[3]
+
+
+def get_id3_size(mm):
+	"""Returns size of the ID3v2 tag at start of mm, 0 if there is none"""
+
+	if mm[0:3] != b'ID3' or len(mm) < 10:
+		return 0
+
+	flags = struct.unpack(str('>B'), mm[5:6])[0]
+	size = 10 + read_syncsafe(mm[6:10])
+	if flags & 0x10:
+		# footer
+		size += 10
+	return size
+
+
+def decode_id3_text(data, encoding):
+	"""Returns the first null terminated string in data"""
+
+	if encoding >= len(ID3_ENCODINGS):
+		raise ProbeError('unknown encoding')
+
+	if encoding in (1, 2):
+		# UTF-16 terminators are 2 bytes, aligned to the characters.
+		end = 0
+		while end + 1 < len(data) and data[end:end + 2] != b'\x00\x00':
+			end += 2
+		data = data[:end]
+	else:
+		end = data.find(b'\x00')
+		if end != -1:
+			data = data[:end]
+
+	return data.decode(ID3_ENCODINGS[encoding])
+
+
+def probe_id3(mm, fields):
+
+	if mm[0:3] != b'ID3':
+		# mutagen also reads files with only an ID3v1 tag
+		raise ProbeError('no ID3v2 header')
+
+	major, revision, flags = struct.unpack(str('>BBB'), mm[3:6])
+	if major not in (2, 3, 4):
+		raise ProbeError('unknown version')
+
+	if flags & 0x80:
+		# whole tag unsynchronised
+		raise ProbeError('unsynchronised')
+
+	end = 10 + read_syncsafe(mm[6:10])
+	if end > len(mm):
+		raise ProbeError('truncated tag')
+
+	pos = 10
+	if flags & 0x40:
+		if major == 2:
+			# compressed ID3v2.2 tag
+			raise ProbeError('compressed')
+		ext_size = mm[pos:pos + 4]
+		if ext_size.isalnum() and ext_size.upper() == ext_size:
+			# Some taggers set the flag without writing the extended header.
+			# Like mutagen, take a frame id in its place as the first frame.
+			pass
+		elif major == 3:
+			pos += 4 + struct.unpack(str('>I'), ext_size)[0]
+		else:
+			pos += read_syncsafe(ext_size)
+
+	header_size = 6 if major == 2 else 10
+	lyrics_found = False
+
+	while pos + header_size <= end:
+		if major == 2:
+			frame_id = mm[pos:pos + 3]
+			frame_size = struct.unpack(str('>I'), b'\x00' + mm[pos + 3:pos + 6])[0]
+			frame_flags = 0
+		else:
+			frame_id = mm[pos:pos + 4]
+			if major == 4:
+				frame_size = read_syncsafe(mm[pos + 4:pos + 8])
+			else:
+				frame_size = struct.unpack(str('>I'), mm[pos + 4:pos + 8])[0]
+			frame_flags = struct.unpack(str('>H'), mm[pos + 8:pos + 10])[0]
+
+		if frame_id[0:1] == b'\x00':
+			# padding
+			break
+
+		if not frame_id.isalnum() or frame_id.upper() != frame_id:
+			raise ProbeError('invalid frame')
+
+		body_start = pos + header_size
+		pos = body_start + frame_size
+		if pos > end:
+			raise ProbeError('truncated frame')
+
+		if major == 2:
+			frame_id = ID3_V22_FRAMES.get(frame_id, frame_id)
+
+		field = ID3_TEXT_FRAMES.get(frame_id)
+		is_lyrics = frame_id == b'USLT'
+		if field is None and not is_lyrics:
+			continue
+
+		# mutagen keeps the first frame for text frames and lists lyrics
+		# frames in the order read.
+		if (field and fields[field] is not None) or (is_lyrics and lyrics_found):
+			continue
+
+		# v2.3: compression, encryption, grouping
+		# v2.4: grouping, compression, encryption, unsynchronisation, data length
+		if (major == 3 and frame_flags & 0x00E0) or (major == 4 and frame_flags & 0x004F):
+			raise ProbeError('frame flags')
+
+		body = mm[body_start:pos]
+		if not body:
+			raise ProbeError('empty frame')
+		encoding = struct.unpack(str('>B'), body[0:1])[0]
+
+		if field:
+			text = decode_id3_text(body[1:], encoding)
+			if not text:
+				# mutagen keeps frames without text, but get_key fails on them.
+				raise ProbeError('empty text')
+			fields[field] = text
+		else:
+			# encoding, language, description, lyrics
+			data = body[4:]
+			if encoding in (1, 2):
+				desc_end = 0
+				while desc_end + 1 < len(data) and data[desc_end:desc_end + 2] != b'\x00\x00':
+					desc_end += 2
+				data = data[desc_end + 2:]
+			else:
+				data = data[data.find(b'\x00') + 1:]
+			fields['lyrics'] = decode_id3_text(data, encoding)
+			lyrics_found = True
+
+	if (fields['artist'] is None or fields['title'] is None or fields['album'] is None) and (
+		len(mm) >= 128 and mm[len(mm) - 128:len(mm) - 125] == b'TAG'):
+		# mutagen fills in fields missing from ID3v2 with the ID3v1 tag.
+		raise ProbeError('ID3v1 tag')
+
+
+def read_vorbis_comment(data, fields):
+
+	"""
+		Reads fields from Vorbis comment in data, which starts at the
+		vendor string.
+	"""
+
+	pos = 4 + struct.unpack(str('<I'), data[0:4])[0]
+	count = struct.unpack(str('<I'), data[pos:pos + 4])[0]
+	pos += 4
+
+	values = {}
+	for _ in range(count):
+		length = struct.unpack(str('<I'), data[pos:pos + 4])[0]
+		pos += 4
+		comment = data[pos:pos + length]
+		if len(comment) != length:
+			raise ProbeError('truncated comment')
+		pos += length
+
+		key, sep, value = comment.partition(b'=')
+		if not sep:
+			continue
+
+		key = key.decode('ascii', 'replace').lower()
+		if key in ('artist', 'title', 'album') or key in VORBIS_LYRICS_KEYS:
+			# Vorbis comments are case insensitive and can repeat.
+			values.setdefault(key, []).append(value.decode('utf-8', 'replace'))
+
+	for field in ('artist', 'title', 'album'):
+		if field in values:
+			fields[field] = values[field][0]
+
+	for key in VORBIS_LYRICS_KEYS:
+		if key in values:
+			fields['lyrics'] = values[key][0]
+			break
+
+
+def probe_flac(mm, fields):
+
+	# mutagen skips an ID3v2 tag before the FLAC stream.
+	pos = get_id3_size(mm)
+	if mm[pos:pos + 4] != b'fLaC':
+		raise ProbeError('no FLAC header')
+	pos += 4
+
+	# mutagen reads the STREAMINFO block, which must come first.
+	header = mm[pos:pos + 4]
+	if header[0:1] not in (b'\x00', b'\x80') or struct.unpack(str('>I'), b'\x00' + header[1:4])[0] < 34:
+		raise ProbeError('invalid STREAMINFO')
+
+	comment_found = False
+	while True:
+		header = mm[pos:pos + 4]
+		if len(header) != 4:
+			raise ProbeError('truncated block')
+		block_type = struct.unpack(str('>B'), header[0:1])[0]
+		length = struct.unpack(str('>I'), b'\x00' + header[1:4])[0]
+		pos += 4
+
+		if block_type & 0x7F == 127:
+			raise ProbeError('invalid block')
+
+		if block_type & 0x7F == 4:
+			if comment_found:
+				# mutagen refuses files with more than one comment block.
+				raise ProbeError('more than one comment block')
+			comment_found = True
+			read_vorbis_comment(mm[pos:pos + length], fields)
+
+		pos += length
+		if block_type & 0x80:
+			# last metadata block
+			break
+		if pos > len(mm):
+			raise ProbeError('truncated block')
+
+
+def read_ogg_packets(mm, count):
+
+	"""
+		Returns the first count packets of the first logical stream in
+		Ogg file mm.
+	"""
+
+	packets = []
+	chunks = []
+	pos = 0
+	serial = None
+
+	while len(packets) < count:
+		if mm[pos:pos + 4] != b'OggS':
+			raise ProbeError('no Ogg page')
+
+		page_serial, segment_count = struct.unpack(str('<IB'), mm[pos + 14:pos + 18] + mm[pos + 26:pos + 27])
+		if serial is None:
+			serial = page_serial
+
+		lacing = struct.unpack(str('%dB' % segment_count), mm[pos + 27:pos + 27 + segment_count])
+		data_pos = pos + 27 + segment_count
+		pos = data_pos + sum(lacing)
+		if pos > len(mm):
+			raise ProbeError('truncated page')
+
+		if page_serial != serial:
+			# pages of other multiplexed streams
+			continue
+
+		for value in lacing:
+			chunks.append(mm[data_pos:data_pos + value])
+			data_pos += value
+			if value < 255:
+				packets.append(b''.join(chunks))
+				chunks = []
+				if len(packets) == count:
+					break
+
+	return packets
+
+
+def probe_ogg(mm, fields):
+
+	identification, comment = read_ogg_packets(mm, 2)
+
+	# mutagen reads the last page for the length of the stream. Pages are
+	# at most 65307 bytes long.
+	last_page = mm.rfind(b'OggS', max(0, len(mm) - 65307))
+	if last_page == -1 or last_page + 27 > len(mm):
+		raise ProbeError('no last page')
+	segment_count = struct.unpack(str('<B'), mm[last_page + 26:last_page + 27])[0]
+	lacing = struct.unpack(str('%dB' % segment_count), mm[last_page + 27:last_page + 27 + segment_count])
+	if last_page + 27 + segment_count + sum(lacing) > len(mm):
+		raise ProbeError('truncated last page')
+
+	# Other codecs(FLAC, Opus...) are left to mutagen.
+	if not identification.startswith(b'\x01vorbis') or not comment.startswith(b'\x03vorbis'):
+		raise ProbeError('not Vorbis')
+
+	read_vorbis_comment(comment[7:], fields)
+
+
+def iter_mp4_atoms(mm, start, end):
+	"""Yields (name, data start, atom end) for the atoms between start and end"""
+
+	pos = start
+	while pos + 8 <= end:
+		size, name = struct.unpack(str('>I4s'), mm[pos:pos + 8])
+		header_size = 8
+		if size == 1:
+			size = struct.unpack(str('>Q'), mm[pos + 8:pos + 16])[0]
+			header_size = 16
+		elif size == 0:
+			size = end - pos
+
+		if size < header_size or pos + size > end:
+			raise ProbeError('invalid atom')
+
+		yield (name, pos + header_size, pos + size)
+		pos += size
+
+
+def find_mp4_atom(mm, start, end, name):
+	"""Returns (data start, atom end) of the first atom called name or None"""
+
+	for atom_name, data_start, atom_end in iter_mp4_atoms(mm, start, end):
+		if atom_name == name:
+			return (data_start, atom_end)
+	return None
+
+
+def probe_mp4(mm, fields):
+
+	moov = find_mp4_atom(mm, 0, len(mm), b'moov')
+	if moov is None:
+		raise ProbeError('no moov atom')
+
+	ilst = None
+	udta = find_mp4_atom(mm, moov[0], moov[1], b'udta')
+	if udta:
+		meta = find_mp4_atom(mm, udta[0], udta[1], b'meta')
+		if meta:
+			# 'meta' is a full atom, with version and flags before the inner atoms.
+			ilst = find_mp4_atom(mm, meta[0] + 4, meta[1], b'ilst')
+
+	if ilst is None:
+		# No tags
+		return
+
+	for name, data_start, item_end in iter_mp4_atoms(mm, ilst[0], ilst[1]):
+		field = MP4_ITEMS.get(name)
+		if field is None or fields[field] is not None:
+			continue
+
+		for data_name, value_start, data_end in iter_mp4_atoms(mm, data_start, item_end):
+			if data_name != b'data':
+				raise ProbeError('unexpected atom')
+
+			# version(1), type(3), locale(4)
+			data_type = struct.unpack(str('>I'), mm[value_start:value_start + 4])[0] & 0xFFFFFF
+			if data_type not in (0, 1):
+				# mutagen does not read these values as text
+				raise ProbeError('not text')
+
+			fields[field] = mm[value_start + 8:data_end].decode('utf-8')
+			break
+
+
+def read_utf16(data):
+	return data.decode('utf-16-le').strip('\x00')
+
+
+def read_asf_object(mm, guid, start, end, attributes):
+
+	"""
+		Adds (name, value) for the attributes in ASF object at start to
+		attributes, a dict of lists keyed by object GUID.
+	"""
+
+	if guid == ASF_CONTENT_DESCRIPTION:
+		lengths = struct.unpack(str('<5H'), mm[start:start + 10])
+		pos = start + 10
+		for name, length in zip(['Title', 'Author'], lengths):
+			if length:
+				attributes.setdefault(guid, []).append((name, read_utf16(mm[pos:pos + length])))
+			pos += length
+
+	elif guid == ASF_EXTENDED_CONTENT_DESCRIPTION:
+		count = struct.unpack(str('<H'), mm[start:start + 2])[0]
+		pos = start + 2
+		for _ in range(count):
+			name_length = struct.unpack(str('<H'), mm[pos:pos + 2])[0]
+			name = read_utf16(mm[pos + 2:pos + 2 + name_length])
+			pos += 2 + name_length
+			value_type, value_length = struct.unpack(str('<HH'), mm[pos:pos + 4])
+			pos += 4
+			if name in ASF_ATTRIBUTES:
+				if value_type != 0:
+					raise ProbeError('not text')
+				attributes.setdefault(guid, []).append((name, read_utf16(mm[pos:pos + value_length])))
+			pos += value_length
+
+	elif guid in (ASF_METADATA, ASF_METADATA_LIBRARY):
+		count = struct.unpack(str('<H'), mm[start:start + 2])[0]
+		pos = start + 2
+		for _ in range(count):
+			name_length, value_type, value_length = struct.unpack(str('<HHI'), mm[pos + 4:pos + 12])
+			name = read_utf16(mm[pos + 12:pos + 12 + name_length])
+			pos += 12 + name_length
+			if name in ASF_ATTRIBUTES:
+				if value_type != 0:
+					raise ProbeError('not text')
+				attributes.setdefault(guid, []).append((name, read_utf16(mm[pos:pos + value_length])))
+			pos += value_length
+
+	elif guid == ASF_HEADER_EXTENSION:
+		# reserved GUID(16), reserved(2), size of inner objects(4)
+		pos = start + 22
+		while pos + 24 <= end:
+			inner_guid = mm[pos:pos + 16]
+			size = struct.unpack(str('<Q'), mm[pos + 16:pos + 24])[0]
+			if size < 24 or pos + size > end:
+				raise ProbeError('invalid object')
+			read_asf_object(mm, inner_guid, pos + 24, pos + size, attributes)
+			pos += size
+
+
+def probe_asf(mm, fields):
+
+	if mm[0:16] != ASF_HEADER_OBJECT:
+		raise ProbeError('no ASF header')
+
+	header_size, object_count = struct.unpack(str('<QI'), mm[16:28])
+	if header_size > len(mm):
+		raise ProbeError('truncated header')
+
+	attributes = {}
+	pos = 30
+	for _ in range(object_count):
+		guid = mm[pos:pos + 16]
+		size = struct.unpack(str('<Q'), mm[pos + 16:pos + 24])[0]
+		if size < 24 or pos + size > header_size:
+			raise ProbeError('invalid object')
+		read_asf_object(mm, guid, pos + 24, pos + size, attributes)
+		pos += size
+
+	for guid in ASF_OBJECTS_ORDER:
+		for name, value in attributes.get(guid, []):
+			field = ASF_ATTRIBUTES[name]
+			if fields[field] is None:
+				fields[field] = value
+
+
+PROBES = {
+	'mp3': probe_id3,
+	'flac': probe_flac,
+	'ogg': probe_ogg,
+	'oga': probe_ogg,
+	'mp4': probe_mp4,
+	'm4a': probe_mp4,
+	'wma': probe_asf,
+}
@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+
+"""
+	Contains the 'lyrico watch' mode which keeps running and downloads lyrics
+	for audio files as they are added to 'source_dir'.
+
+	On Linux the folders are watched using inotify(through ctypes, no extra
+	dependency). Everywhere else, or when inotify is not available, 'source_dir'
+	is polled for changes.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+
+from .song import Song
+from .config import Config
+from .scanner import walk_audio_files, get_audio_extensions
+from .scan_manifest import ScanManifest
+from .lyrics_catalog import LyricsCatalog
+from .metadata_cache import MetadataCache
+from .source_stats import SourceStats
+
+
+# A file is only processed once no event was seen for it for these many seconds
+# and its size and mtime did not change in between. This avoids reading tags
+# of files which are still being copied.
+DEBOUNCE_SECONDS = 2.0
+
+# Interval between two scans of 'source_dir' when polling.
+POLL_INTERVAL = 10.0
+
+# inotify constants from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF
+
+# struct inotify_event {int wd; uint32_t mask; uint32_t cookie; uint32_t len; char name[];}
+EVENT_HEADER = struct.Struct(str('iIII'))
+
+
+def encode_path(path):
+	if sys.version_info[0] < 3:
+		return path.encode(sys.getfilesystemencoding())
+	return os.fsencode(path)
+
+
+def decode_path(path):
+	if sys.version_info[0] < 3:
+		return path.decode(sys.getfilesystemencoding())
+	return os.fsdecode(path)
+
+
+class InotifyWatcher():
+
+	"""
+		Watches 'source_dir' and all inner folders using inotify.
+		Raises OSError if inotify is not available.
+	"""
+
+	def __init__(self, path):
+
+		libc_name = ctypes.util.find_library('c')
+		if not libc_name:
+			raise OSError(errno.ENOSYS, 'libc not found')
+
+		self.libc = ctypes.CDLL(libc_name, use_errno=True)
+		if not hasattr(self.libc, 'inotify_init1'):
+			raise OSError(errno.ENOSYS, 'inotify is not supported')
+
+		self.fd = self.libc.inotify_init1(IN_CLOEXEC)
+		if self.fd < 0:
+			err = ctypes.get_errno()
+			raise OSError(err, os.strerror(err))
+
+		# watch descriptor -> folder path
+		self.watched_dirs = {}
+
+		# Set when the kernel event queue overflowed and events were lost.
+		self.overflowed = False
+
+		self.add_tree(path)
+
+	def add_watch(self, path):
+		wd = self.libc.inotify_add_watch(self.fd, encode_path(path), WATCH_MASK)
+		if wd < 0:
+			# Folder removed in between or the inotify watch limit was reached.
+			err = ctypes.get_errno()
+			print('Unable to watch', path, os.strerror(err))
+			return
+		self.watched_dirs[wd] = path
+
+	def add_tree(self, path):
+
+		"""
+			Adds watches for folder at path and all its inner folders.
+			Returns paths of audio files already present in them, since files
+			could have landed before the watch was added.
+		"""
+
+		audio_files = []
+		pending_dirs = [path]
+		extensions = get_audio_extensions()
+
+		while pending_dirs:
+			current_dir = pending_dirs.pop()
+			self.add_watch(current_dir)
+			try:
+				names = os.listdir(current_dir)
+			except OSError:
+				continue
+
+			for name in names:
+				if name.startswith('.'):
+					continue
+				child = os.path.join(current_dir, name)
+				if os.path.isdir(child) and not os.path.islink(child):
+					pending_dirs.append(child)
+				elif os.path.splitext(name)[1].lower() in extensions:
+					audio_files.append(child)
+
+		return audio_files
+
+	def get_changes(self, timeout):
+
+		"""
+			Waits for at most timeout seconds and returns list of paths of
+			files which were created or modified.
+		"""
+
+		readable, _, _ = select.select([self.fd], [], [], timeout)
+		if not readable:
+			return []
+
+		buf = os.read(self.fd, 65536)
+		changed = []
+		offset = 0
+		while offset + EVENT_HEADER.size <= len(buf):
+			wd, mask, cookie, name_len = EVENT_HEADER.unpack_from(buf, offset)
+			offset += EVENT_HEADER.size
+			name = buf[offset: offset + name_len].rstrip(b'\0')
+			offset += name_len
+
+			if mask & IN_Q_OVERFLOW:
+				self.overflowed = True
+				continue
+
+			parent = self.watched_dirs.get(wd)
+			if mask & (IN_IGNORED | IN_DELETE_SELF):
+				self.watched_dirs.pop(wd, None)
+				continue
+
+			if parent is None or not name:
+				continue
+
+			path = os.path.join(parent, decode_path(name))
+
+			if mask & IN_ISDIR:
+				# A new folder(ex. an album) was created or moved in.
+				if mask & (IN_CREATE | IN_MOVED_TO) and not name.startswith(b'.'):
+					changed.extend(self.add_tree(path))
+				continue
+
+			changed.append(path)
+
+		return changed
+
+	def close(self):
+		os.close(self.fd)
+
+
+class PollingWatcher():
+
+	"""
+		Detects changes by scanning 'source_dir' every POLL_INTERVAL seconds
+		and comparing size and mtime of the audio files with the last scan.
+	"""
+
+	def __init__(self, path):
+		self.path = path
+		self.overflowed = False
+		self.snapshot = self.take_snapshot()
+		self.next_scan = time.time() + POLL_INTERVAL
+
+	def take_snapshot(self):
+		snapshot = {}
+		for path in walk_audio_files(self.path, threads=Config.scan_threads):
+			signature = ScanManifest.get_signature(path)
+			if signature:
+				snapshot[path] = signature
+		return snapshot
+
+	def get_changes(self, timeout):
+		wait = min(timeout, self.next_scan - time.time())
+		if wait > 0:
+			time.sleep(wait)
+			if time.time() < self.next_scan:
+				return []
+
+		snapshot = self.take_snapshot()
+		changed = [path for path, signature in snapshot.items()
+					if self.snapshot.get(path) != signature]
+		self.snapshot = snapshot
+		self.next_scan = time.time() + POLL_INTERVAL
+		return changed
+
+	def close(self):
+		pass
+
+
+def get_watcher(path, use_polling=False):
+
+	"""
+		Returns an InotifyWatcher where available and falls back to PollingWatcher.
+	"""
+
+	if not use_polling and sys.platform.startswith('linux'):
+		try:
+			return InotifyWatcher(path)
+		except (OSError, AttributeError) as e:
+			print('Unable to use inotify.', e)
+			print('Falling back to polling', path, 'every', POLL_INTERVAL, 'seconds.')
+
+	return PollingWatcher(path)
+
+
+def process_song(path, manifest):
+
+	"""
+		Runs a single audio file through the usual Song -> download_lyrics ->
+		save_lyrics path and records the outcome in the scan manifest.
+	"""
+
+	# Only record the files which actually get processed.
+	for song_path in manifest.filter_pending([path], False):
+		song = Song(song_path)
+		if song.artist and song.title:
+			song.download_lyrics()
+		else:
+			print('\n' + (song.title or song.path), 'was ignored.', song.error)
+		manifest.record(song)
+
+
+def watch_source_dir(path, use_polling=False):
+
+	"""
+		Keeps watching path for new or modified audio files and downloads
+		lyrics for them. Runs until interrupted with Ctrl+C.
+	"""
+
+	extensions = get_audio_extensions()
+	watcher = get_watcher(path, use_polling)
+	manifest = ScanManifest.load()
+
+	# path -> (time of last event, signature when it was seen)
+	pending = {}
+
+	print('Watching', path, 'for new audio files. Press Ctrl+C to stop.')
+
+	try:
+		while True:
+			for changed_path in watcher.get_changes(DEBOUNCE_SECONDS / 2):
+				if os.path.splitext(changed_path)[1].lower() in extensions:
+					pending[changed_path] = (time.time(), ScanManifest.get_signature(changed_path))
+
+			if watcher.overflowed:
+				# Events were lost. Find changed files by comparing the whole
+				# tree with the manifest.
+				print('Too many changes at once. Rescanning', path)
+				watcher.overflowed = False
+				for changed_path in walk_audio_files(path, threads=Config.scan_threads):
+					signature = ScanManifest.get_signature(changed_path)
+					previous = manifest.files.get(changed_path)
+					if signature and (not previous or previous[:3] != signature):
+						pending[changed_path] = (time.time(), signature)
+
+			now = time.time()
+			processed = False
+			for changed_path, (seen_at, signature) in list(pending.items()):
+				if now - seen_at < DEBOUNCE_SECONDS:
+					continue
+
+				current = ScanManifest.get_signature(changed_path)
+				previous = manifest.files.get(changed_path)
+				if current is None:
+					# Removed or moved away before it settled.
+					del pending[changed_path]
+				elif current != signature:
+					# Still being written to.
+					pending[changed_path] = (now, current)
+				elif previous and previous[:3] == current:
+					# Not changed since it was processed, ex. the events of
+					# lyrico saving the lyrics tag.
+					del pending[changed_path]
+				else:
+					del pending[changed_path]
+					process_song(changed_path, manifest)
+					processed = True
+
+			if processed:
+				manifest.save(False)
+				LyricsCatalog.get_catalog().save()
+				SourceStats.get_stats().save()
+				if MetadataCache.get_cache():
+					MetadataCache.get_cache().flush()
+
+	except KeyboardInterrupt:
+		print('\nStopped watching', path)
+
+	finally:
+		watcher.close()
+		manifest.save(False)
+		LyricsCatalog.get_catalog().save()
+		SourceStats.get_stats().save()
+		if MetadataCache.get_cache():
+			MetadataCache.get_cache().close()
@@ -36,6 +36,7 @@ def reset_config():
 
 	config.set('paths', 'source_dir', 'None')
 	config.set('paths', 'lyrics_dir', 'None')
+	config.set('paths', 'lyrics_layout', 'flat')
 
 	config.set('sources', 'lyric_wikia', 'True')
 	config.set('sources', 'lyrics_n_music', 'True')
@@ -43,6 +44,33 @@ def reset_config():
 	config.set('sources', 'lyricsmode', 'True')
 	config.set('sources', 'az_lyrics', 'False')
 
+	if not config.has_section('performance'):
+		config.add_section('performance')
+	config.set('performance', 'scan_threads', '1')
+	config.set('performance', 'scan_ordered', 'True')
+	config.set('performance', 'read_order', 'none')
+	config.set('performance', 'readahead_files', '4')
+	config.set('performance', 'tag_probe', 'True')
+	config.set('performance', 'metadata_cache', 'True')
+	config.set('performance', 'metadata_workers', '1')
+	config.set('performance', 'metadata_chunksize', '64')
+	config.set('performance', 'fetch_workers', '1')
+	config.set('performance', 'jobs', '1')
+	config.set('performance', 'host_connections', '4')
+	config.set('performance', 'max_connections', '16')
+	config.set('performance', 'race_sources', '1')
+	config.set('performance', 'hedge_delay', '0.0')
+	config.set('performance', 'source_order', 'adaptive')
+	config.set('performance', 'source_exploration', '0.05')
+	config.set('performance', 'save_workers', '1')
+	config.set('performance', 'queue_size', '100')
+	config.set('performance', 'max_memory', 'none')
+	config.set('performance', 'http_pool_size', '10')
+	config.set('performance', 'http_prewarm', 'False')
+	config.set('performance', 'max_retries', '3')
+	config.set('performance', 'retry_backoff', '1.0')
+	config.set('performance', 'max_retry_wait', '60.0')
+
 	# save to config.ini
 	with open(config_path, 'w') as configfile:
 		config.write(configfile)
\ No newline at end of file